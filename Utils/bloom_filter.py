@@ -0,0 +1,140 @@
+import os
+import math
+import mmap
+import pickle
+import logging
+from Utils.checkpoint import atomic_dump
+from Utils.url_canonicalizer import url_fingerprint
+
+
+class _BloomSlice:
+    """
+    Fixed-capacity Bloom filter whose bit array is a memory-mapped file.
+    """
+
+    def __init__(self, path, capacity, error_rate, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.count = count
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+
+        num_bytes = (self.num_bits + 7) // 8
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.truncate(num_bytes)
+        self._file = open(path, "r+b")
+        self.bits = mmap.mmap(self._file.fileno(), num_bytes)
+
+
+    def _positions(self, fingerprint):
+        # Double hashing (Kirsch & Mitzenmacher): k positions from the two halves of the fingerprint
+        h1 = fingerprint & 0xFFFFFFFF
+        h2 = (fingerprint >> 32) | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+
+    def __contains__(self, fingerprint):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(fingerprint))
+
+
+    def add(self, fingerprint):
+        bits = self.bits
+        for position in self._positions(fingerprint):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+    def flush(self):
+        self.bits.flush()
+
+
+    def close(self):
+        self.bits.close()
+        self._file.close()
+
+
+class ScalableBloomFilter:
+    """
+    Set of URLs in bounded memory: a scalable Bloom filter (Almeida et al.) over 64-bit URL
+    fingerprints. Membership tests have no false negatives and at most `error_rate` false
+    positives, however many URLs are added.
+
+    Starts with one slice for `initial_capacity` URLs; whenever the last slice is full, a
+    new one with `growth` times the capacity and half the error rate is added, so the error
+    rates of all slices add up to less than `error_rate`. Each slice is a memory-mapped file
+    in the directory `path`, so saving only writes the pages that changed.
+    """
+
+    def __init__(self, path='data/visited_urls_in_queue.bloom', initial_capacity=1_000_000, error_rate=1e-4, growth=2):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.path_to_meta = os.path.join(path, "meta.pkl")
+        self.created = not os.path.exists(self.path_to_meta)
+
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        counts = [0]
+        if not self.created:
+            # The slice files were laid out with the stored parameters, which win over the arguments
+            with open(self.path_to_meta, "rb") as f:
+                meta = pickle.load(f)
+            self.initial_capacity, self.error_rate, self.growth = meta['initial_capacity'], meta['error_rate'], meta['growth']
+            counts = meta['counts']
+            logging.info(f"Loaded visited URL filter with {sum(counts)} URLs in {len(counts)} slices from {path}")
+
+        self.slices = [self._open_slice(index, count) for index, count in enumerate(counts)]
+
+
+    def _open_slice(self, index, count=0):
+        return _BloomSlice(os.path.join(self.path, f"slice_{index}.bin"),
+                           self.initial_capacity * self.growth ** index,
+                           self.error_rate / 2 ** (index + 1),
+                           count)
+
+
+    def __contains__(self, url):
+        fingerprint = url_fingerprint(url)
+        return any(fingerprint in bloom_slice for bloom_slice in self.slices)
+
+
+    def add(self, url):
+        fingerprint = url_fingerprint(url)
+        if any(fingerprint in bloom_slice for bloom_slice in self.slices):
+            return
+        last = self.slices[-1]
+        last.add(fingerprint)
+        if last.count >= last.capacity:
+            self.slices.append(self._open_slice(len(self.slices)))
+
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+
+    def save(self):
+        try:
+            for bloom_slice in self.slices:
+                bloom_slice.flush()
+            atomic_dump({'initial_capacity': self.initial_capacity, 'error_rate': self.error_rate,
+                         'growth': self.growth, 'counts': [bloom_slice.count for bloom_slice in self.slices]}, self.path_to_meta)
+            logging.info(f"Successfully saved visited URL filter ({len(self)} URLs) to {self.path}.")
+        except Exception as e:
+            logging.error(f"Error saving visited URL filter to {self.path}: {e}.")
+
+
+    def close(self):
+        for bloom_slice in self.slices:
+            bloom_slice.close()
+
+
+    def memory_bytes(self):
+        return sum(len(bloom_slice.bits) for bloom_slice in self.slices)
+
+
+    def __len__(self):
+        return sum(bloom_slice.count for bloom_slice in self.slices)
@@ -1,19 +1,33 @@
 import pickle
 
 from Utils.indexer import Indexer
+from Utils import metrics
 
 
 class BM25:
 
-    def __init__(self):
+    def __init__(self, indexer=None, shared_index=None):
         self.path_to_TFs = 'data/tfs.pkl'
         self.path_to_IDFs = 'data/idfs.pkl'
         self.path_to_crawled_data = 'data/crawled_data.pkl'
+
+        # Reuse the caller's indexer for proximity bonuses instead of reloading the posting lists per query
+        self.indexer = indexer
+        self.shared_index = shared_index
+        if shared_index is not None:
+            self.tf_data, self.idfs, self.crawled_data = [], {}, {}
+            self.doc_lengths = shared_index.doc_lengths
+            self.avgdl = shared_index.avgdl
+            return
         
         self.tf_data = self._load(self.path_to_TFs)
         self.idfs = self._load(self.path_to_IDFs)
         self.crawled_data = self._load(self.path_to_crawled_data)
 
+        # Document lengths do not change between queries, compute them once
+        self.doc_lengths = self._compute_doc_lengths()
+        self.avgdl = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0
+
 
     def _load(self, path):
         try:
@@ -29,13 +43,23 @@ class BM25:
         return [sum(doc.values()) for doc in self.tf_data]
 
 
+    def get_url(self, doc_id):
+        if self.shared_index is not None:
+            return self.shared_index.url(doc_id)
+        return self.crawled_data[doc_id]['url']
+
+
     def _bm25_score(self, weighted_query, doc_index, doc_lengths, avgdl, k1=1.5, b=0.75):
         score = 0.0
         doc_len = doc_lengths[doc_index]
 
         for term, weight in weighted_query:
-            tf = self.tf_data[doc_index].get(term.lower(), 0)
-            idf = self.idfs.get(term, 0)
+            if self.shared_index is not None:
+                tf = self.shared_index.term_frequency(term.lower(), doc_index)
+                idf = self.shared_index.idf(term)
+            else:
+                tf = self.tf_data[doc_index].get(term.lower(), 0)
+                idf = self.idfs.get(term, 0)
 
             denom = tf + k1 * (1 - b + b * doc_len / avgdl)
             if denom > 0:
@@ -44,18 +68,22 @@ class BM25:
         return score
 
 
-    def bm25_ranking(self, weighted_query, candidate_doc_ids):
-        doc_lengths = self._compute_doc_lengths()
-        avgdl = sum(doc_lengths) / len(doc_lengths)
+    def bm25_ranking(self, weighted_query, candidate_doc_ids, deadline=None):
+        doc_lengths = self.doc_lengths
+        avgdl = self.avgdl
 
         scores = []
-        ind = Indexer()
+        ind = self.indexer if self.indexer is not None else Indexer(silent=True, shared_index=self.shared_index)
+
+        with metrics.stage("bm25"):
+            for doc_id in candidate_doc_ids:
+                score = self._bm25_score(weighted_query, doc_id, doc_lengths, avgdl)
+                scores.append((doc_id, score))
 
-        for doc_id in candidate_doc_ids:
-            score = self._bm25_score(weighted_query, doc_id, doc_lengths, avgdl)
-            bonus = ind.proximity_bonus([term for term, _ in weighted_query], doc_id, window=3)
-            score += bonus
-            scores.append((doc_id, score))
+        if deadline is None or deadline.allows("proximity"):
+            with metrics.stage("proximity"):
+                query_terms = [term for term, _ in weighted_query]
+                scores = [(doc_id, score + ind.proximity_bonus(query_terms, doc_id, window=3)) for doc_id, score in scores]
 
         scores = sorted(scores, key=lambda x: x[1], reverse=True)
         return scores   # Return (doc_id, score) pairs
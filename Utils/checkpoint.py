@@ -0,0 +1,142 @@
+import os
+import time
+import zlib
+import fcntl
+import struct
+import pickle
+import logging
+
+
+RECORD_HEADER = struct.Struct('<II')   # payload length, CRC32 of the payload (as in the document log)
+
+
+def atomic_dump(data, path):
+    """
+    Pickle `data` to `path` through a temporary file that is renamed over it, so `path`
+    holds either the previous or the new version, never a truncated one.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    # Make the rename itself durable
+    dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def lock_directory(path):
+    """
+    Take the exclusive lock of the directory `path` (its LOCK file) for this process, or raise
+    RuntimeError if another process holds it. The lock is released when the returned file is
+    closed, or when the process exits.
+    """
+    lock_file = open(os.path.join(path, "LOCK"), "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise RuntimeError(f"{path} is in use by another process (is the crawler running?)") from None
+    return lock_file
+
+
+class SnapshotJournal:
+    """
+    Write-ahead log of the changes to a pickled snapshot (`path`) since it was last written,
+    kept in `path`.wal.
+
+    Each record goes to the file with one unbuffered write, so it survives the crawler being
+    killed; it is fsynced (surviving a power loss) at most `sync_interval` seconds later, or
+    on `sync`. On open, the records are read back for `replay` and a torn record at the end
+    is cut off. `checkpoint` rewrites the snapshot atomically only once the journal holds as
+    many records as the snapshot has entries, so saving costs O(changes) amortized. Records
+    must be idempotent: after a crash between the rename and the reset they are replayed
+    onto a snapshot that already contains them.
+    """
+
+    def __init__(self, path, sync_interval=1.0):
+        self.path = path
+        self.path_to_journal = f"{path}.wal"
+        self.sync_interval = sync_interval
+        self._replayed = self._read()
+        self.num_records = len(self._replayed)
+        self._file = open(self.path_to_journal, "ab", buffering=0)
+        self._last_sync = time.time()
+        self._unsynced = False
+
+
+    def replay(self):
+        """
+        Returns the records logged since the snapshot was written (only once, after opening).
+        """
+        records, self._replayed = self._replayed, []
+        if records:
+            logging.info(f"Replayed {len(records)} changes from {self.path_to_journal}")
+        return records
+
+
+    def log(self, record):
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        self._file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self.num_records += 1
+        self._unsynced = True
+        if time.time() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+
+    def sync(self):
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = False
+        self._last_sync = time.time()
+
+
+    def checkpoint(self, data, size, force=False):
+        """
+        Sync the journal, and snapshot `data` (with `size` entries) when the journal is as large
+        or `force` is set. Returns whether the snapshot was written.
+        """
+        self.sync()
+        if not force and self.num_records < size:
+            return False
+        atomic_dump(data, self.path)
+        self._file.truncate(0)
+        os.fsync(self._file.fileno())
+        self.num_records = 0
+        return True
+
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+
+    def __len__(self):
+        return self.num_records
+
+
+    def _read(self):
+        records = []
+        try:
+            with open(self.path_to_journal, "r+b") as f:
+                data = f.read()
+                offset = 0
+                while offset < len(data):
+                    valid = offset + RECORD_HEADER.size <= len(data)
+                    if valid:
+                        length, crc = RECORD_HEADER.unpack_from(data, offset)
+                        payload = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+                        valid = len(payload) == length and zlib.crc32(payload) == crc
+                    if not valid:
+                        logging.warning(f"Truncating incomplete record at {self.path_to_journal}:{offset}.")
+                        f.truncate(offset)
+                        break
+                    records.append(pickle.loads(payload))
+                    offset += RECORD_HEADER.size + length
+        except FileNotFoundError:
+            pass
+        return records
@@ -0,0 +1,330 @@
+import os
+import time
+import heapq
+import sqlite3
+from urllib.parse import urlparse
+
+
+# States of a DiskFrontier row (its `loaded` column)
+_ON_DISK = 0   # waiting for a refill of the hot window
+_LOADED = 1    # queued in the hot window
+_POPPED = 2    # popped, not marked done yet
+
+
+class HostFrontier:
+    """
+    Two-level crawl frontier in the style of Mercator (Heydon & Najork).
+
+    Front queue: one priority heap of (priority, url, depth) ordered by `_calculate_priority`.
+    Back queues: one priority heap per host, at most `max_back_queues` hosts at a time.
+        URLs of other hosts wait in the front queue until a back queue frees up.
+    Ready-time heap: (time, host) for every host with queued URLs, i.e. when the host may
+        be fetched next. Hosts whose time has passed move to a heap keyed by the priority of
+        their best URL, so among the hosts that may be fetched now the best URL wins.
+
+    A host is fetchable when it has no request in flight and its crawl delay, measured from
+    the start of its previous fetch, has passed. As long as any queued host is fetchable,
+    `pop_ready` returns a URL; one slow or busy site never blocks the others.
+    """
+
+    def __init__(self, items=(), max_back_queues=1000):
+        self.max_back_queues = max_back_queues
+
+        self.front = []          # (priority, url, depth) of hosts without a back queue
+        self.back = {}           # host -> heap of (priority, url, depth)
+        self.next_allowed = {}   # host -> earliest start time of its next fetch
+        self.busy = set()        # hosts with a request in flight
+        self._waiting = []       # (ready time, host)
+        self._ready = []         # (best priority, host) for hosts whose ready time has passed
+        self._size = 0
+
+        for item in items:
+            self.push(item)
+
+
+    @staticmethod
+    def host_of(url):
+        try:
+            return urlparse(url).netloc
+        except ValueError:
+            return ""  # rejected by the crawler's URL filters when popped
+
+
+    def push(self, item):
+        """
+        Queue a (priority, url, depth) tuple.
+        """
+        host = self.host_of(item[1])
+        self._size += 1
+
+        queue = self.back.get(host)
+        if queue is not None:
+            heapq.heappush(queue, item)
+            if queue[0] is item:
+                self._announce(host)
+        elif len(self.back) < self.max_back_queues:
+            self.back[host] = [item]
+            self._announce(host)
+        else:
+            heapq.heappush(self.front, item)
+
+
+    def pop_ready(self, now=None):
+        """
+        Returns (host, item) with the best URL among the hosts that may be fetched now,
+        or None if no host is ready. The caller marks the host busy with `acquire`.
+        """
+        now = time.time() if now is None else now
+        self._refill()
+
+        while self._waiting and self._waiting[0][0] <= now:
+            _, host = heapq.heappop(self._waiting)
+            if host in self.back and host not in self.busy:
+                heapq.heappush(self._ready, (self.back[host][0][0], host))
+
+        while self._ready:
+            priority, host = heapq.heappop(self._ready)
+            queue = self.back.get(host)
+            if not queue or host in self.busy or queue[0][0] != priority:
+                continue  # stale entry, superseded by a newer one
+            if self.next_allowed.get(host, 0) > now:
+                heapq.heappush(self._waiting, (self.next_allowed[host], host))
+                continue  # delayed by `set_delay` after it became ready
+
+            item = heapq.heappop(queue)
+            self._size -= 1
+            if queue:
+                # Still ready until the caller acquires it (the URL may be filtered out)
+                heapq.heappush(self._ready, (queue[0][0], host))
+            else:
+                del self.back[host]
+                self._refill()
+            return host, item
+        return None
+
+
+    def acquire(self, host, delay):
+        """
+        Mark a fetch to `host` as started; the next one may start `delay` seconds later.
+        """
+        self.busy.add(host)
+        self.next_allowed[host] = time.time() + delay
+
+
+    def release(self, host):
+        """
+        Mark the fetch to `host` as finished.
+        """
+        self.busy.discard(host)
+        if host in self.back:
+            heapq.heappush(self._waiting, (self.next_allowed.get(host, 0), host))
+
+
+    def set_delay(self, host, delay):
+        """
+        Let the next fetch to `host` start `delay` seconds from now at the earliest, e.g. after a
+        request for its robots.txt. Unlike `acquire`, the host is not marked busy.
+        """
+        self.next_allowed[host] = time.time() + delay
+        if host in self.back and host not in self.busy:
+            heapq.heappush(self._waiting, (self.next_allowed[host], host))
+
+
+    def seconds_until_ready(self):
+        """
+        Time until the next host may be fetched, or None if no host is scheduled
+        (nothing queued, or all queued hosts are busy and get scheduled on release).
+        """
+        if self._ready:
+            return 0.0
+        if not self._waiting:
+            return None
+        return max(0.0, self._waiting[0][0] - time.time())
+
+
+    def items(self):
+        """
+        All queued (priority, url, depth) tuples, e.g. to persist the frontier.
+        """
+        items = list(self.front)
+        for queue in self.back.values():
+            items.extend(queue)
+        return items
+
+
+    def num_hosts(self):
+        return len(self.back)
+
+
+    def host_queue_sizes(self, limit=None):
+        """
+        [(host, queued URLs)] of the hosts with back queues, longest first.
+        """
+        sizes = sorted(((host, len(queue)) for host, queue in self.back.items()), key=lambda entry: entry[1], reverse=True)
+        return sizes[:limit] if limit is not None else sizes
+
+
+    def __len__(self):
+        return self._size
+
+
+    def _announce(self, host):
+        """
+        (Re)schedule `host` after its best URL changed.
+        """
+        if host in self.busy:
+            return  # scheduled again on release
+        ready_time = self.next_allowed.get(host, 0)
+        if ready_time <= time.time():
+            heapq.heappush(self._ready, (self.back[host][0][0], host))
+        else:
+            heapq.heappush(self._waiting, (ready_time, host))
+
+
+    def _refill(self):
+        """
+        Move URLs from the front queue into back queues while back queues are free.
+        """
+        while self.front and len(self.back) < self.max_back_queues:
+            item = heapq.heappop(self.front)
+            host = self.host_of(item[1])
+            queue = self.back.get(host)
+            if queue is None:
+                self.back[host] = [item]
+            else:
+                heapq.heappush(queue, item)
+            if self.back[host][0] is item:
+                self._announce(host)
+
+
+class DiskFrontier:
+    """
+    HostFrontier backed by SQLite, for frontiers that do not fit in memory.
+
+    Every queued URL is a row of the database until the crawler marks it `done`, so URLs that
+    were queued, in flight or parked when a crawl stopped are queued again on the next start,
+    and saving is a commit of the changes since the last save.
+
+    Only a hot window of about `hot_window` URLs lives in an in-memory HostFrontier. When it
+    drops to half, it is refilled with the best URLs from disk. URLs pushed while the window
+    is full wait on disk for the next refill, even if they are better than the ones in memory.
+    Each row records whether its URL is on disk, in the hot window or popped.
+    """
+
+    def __init__(self, path='data/frontier.db', hot_window=50000, max_back_queues=1000):
+        self.path = path
+        self.hot_window = hot_window
+        self.created = not os.path.exists(path)
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Commits (`save`) only append to the WAL file and survive a killed crawler; fsync happens at WAL checkpoints
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS frontier ("
+                          "url TEXT PRIMARY KEY, priority REAL NOT NULL, depth INTEGER NOT NULL, loaded INTEGER NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS frontier_on_disk ON frontier (loaded, priority)")
+        self.conn.execute("UPDATE frontier SET loaded = ? WHERE loaded != ?", (_ON_DISK, _ON_DISK))
+        self.conn.commit()
+
+        self.on_disk = self.conn.execute("SELECT COUNT(*) FROM frontier").fetchone()[0]
+        self.hot = HostFrontier(max_back_queues=max_back_queues)
+
+
+    host_of = staticmethod(HostFrontier.host_of)
+
+
+    def push(self, item):
+        """
+        Queue a (priority, url, depth) tuple. A URL that is already queued is ignored, unless it
+        was popped and not marked done yet (e.g. parked by the caller): then it is queued again.
+        """
+        priority, url, depth = item
+        row = self.conn.execute("SELECT loaded FROM frontier WHERE url = ?", (url,)).fetchone()
+        if row is not None:
+            if row[0] == _POPPED:
+                self.conn.execute("UPDATE frontier SET loaded = ? WHERE url = ?", (_LOADED, url))
+                self.hot.push(item)
+            return
+
+        in_memory = len(self.hot) < self.hot_window
+        self.conn.execute("INSERT INTO frontier (url, priority, depth, loaded) VALUES (?, ?, ?, ?)",
+                          (url, priority, depth, _LOADED if in_memory else _ON_DISK))
+        if in_memory:
+            self.hot.push(item)
+        else:
+            self.on_disk += 1
+
+
+    def done(self, url):
+        """
+        Remove a popped URL for good, once it was fetched or filtered out.
+        """
+        self.conn.execute("DELETE FROM frontier WHERE url = ?", (url,))
+
+
+    def pop_ready(self, now=None):
+        """
+        See HostFrontier.pop_ready. The URL stays in the database until `done`.
+        """
+        if self._needs_refill():
+            self._refill_from_disk()
+        ready = self.hot.pop_ready(now)
+        if ready is not None:
+            self.conn.execute("UPDATE frontier SET loaded = ? WHERE url = ?", (_POPPED, ready[1][1]))
+        return ready
+
+
+    def acquire(self, host, delay):
+        self.hot.acquire(host, delay)
+
+
+    def release(self, host):
+        self.hot.release(host)
+
+
+    def set_delay(self, host, delay):
+        self.hot.set_delay(host, delay)
+
+
+    def seconds_until_ready(self):
+        if self._needs_refill():
+            return 0.0 # pop_ready loads more URLs first
+        return self.hot.seconds_until_ready()
+
+
+    def num_hosts(self):
+        return self.hot.num_hosts()
+
+
+    def host_queue_sizes(self, limit=None):
+        """
+        See HostFrontier.host_queue_sizes; URLs on disk are not included.
+        """
+        return self.hot.host_queue_sizes(limit)
+
+
+    def save(self):
+        self.conn.commit()
+
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+    def __len__(self):
+        return len(self.hot) + self.on_disk
+
+
+    def _needs_refill(self):
+        return self.on_disk > 0 and len(self.hot) <= self.hot_window // 2
+
+
+    def _refill_from_disk(self):
+        limit = self.hot_window - len(self.hot)
+        rows = self.conn.execute("SELECT url, priority, depth FROM frontier WHERE loaded = ? ORDER BY priority LIMIT ?",
+                                 (_ON_DISK, limit)).fetchall()
+        self.conn.executemany("UPDATE frontier SET loaded = ? WHERE url = ?", [(_LOADED, url) for url, _, _ in rows])
+        self.on_disk = self.on_disk - len(rows) if len(rows) == limit else 0
+        for url, priority, depth in rows:
+            self.hot.push((priority, url, depth))
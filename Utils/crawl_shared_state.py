@@ -0,0 +1,218 @@
+import os
+import time
+import sqlite3
+import hashlib
+from urllib.parse import urlparse
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    partition INTEGER NOT NULL,
+    priority REAL NOT NULL,
+    url TEXT NOT NULL,
+    depth INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS links_by_partition ON links (partition, id);
+CREATE TABLE IF NOT EXISTS simhashes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    partition INTEGER NOT NULL,
+    simhash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS workers (
+    partition INTEGER PRIMARY KEY,
+    idle INTEGER NOT NULL,
+    exited INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+
+def partition_of(url, num_partitions):
+    """
+    Partition that owns the URL's host. Stable across processes and runs (unlike `hash()`),
+    so every worker routes a host to the same partition.
+    """
+    try:
+        host = urlparse(url).netloc
+    except ValueError:
+        host = ""
+    digest = hashlib.md5(host.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % num_partitions
+
+
+def partition_path(path, index):
+    """
+    'data/crawled_data.pkl' -> 'data/crawled_data.p<index>.pkl'
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.p{index}{ext}"
+
+
+class SharedCrawlState:
+    """
+    State shared by the worker processes of a distributed crawl, in one SQLite database.
+
+    Every worker owns the hosts of its partition, so frontier, robots.txt rules and
+    politeness stay local to one process. Only what crosses partitions goes through here:
+        links:     links found by one worker for a host owned by another one
+        simhashes: SimHashes of indexed pages, for duplicate detection across partitions
+        documents: doc ID per URL, so IDs are unique over all partitions
+        workers:   whether each worker is idle, to detect the end of the crawl
+
+    The database runs in WAL mode, so workers can read while another one writes. Each
+    process must open its own SharedCrawlState (SQLite connections cannot be shared).
+    """
+
+    def __init__(self, path='data/crawl_shared.db'):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)  # transactions are explicit
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._last_simhash_id = 0
+
+
+    def reset_workers(self, num_partitions):
+        """
+        Mark all workers as busy before they start. Links queued by an interrupted crawl are kept.
+        """
+        now = time.time()
+        with self._transaction():
+            self.conn.execute("DELETE FROM workers")
+            self.conn.executemany("INSERT INTO workers (partition, idle, exited, updated) VALUES (?, 0, 0, ?)",
+                                  [(index, now) for index in range(num_partitions)])
+
+
+    def register_documents(self, crawled_data):
+        """
+        Reserve the doc IDs of already crawled documents ({doc_id: {'url': ...}}).
+        """
+        with self._transaction():
+            self.conn.executemany("INSERT OR IGNORE INTO documents (doc_id, url) VALUES (?, ?)",
+                                  [(doc_id, info['url']) for doc_id, info in crawled_data.items() if 'url' in info])
+
+
+    def doc_ids(self):
+        """
+        Returns {url: doc_id} of all documents crawled by any partition.
+        """
+        return dict(self.conn.execute("SELECT url, doc_id FROM documents"))
+
+
+    def allocate_doc_id(self, url):
+        """
+        Doc ID of `url`: the existing one, or the next free ID over all partitions.
+        """
+        with self._transaction():
+            row = self.conn.execute("SELECT doc_id FROM documents WHERE url = ?", (url,)).fetchone()
+            if row is not None:
+                return row[0]
+            cursor = self.conn.execute(
+                "INSERT INTO documents (doc_id, url) SELECT COALESCE(MAX(doc_id) + 1, 0), ? FROM documents", (url,))
+            return self.conn.execute("SELECT doc_id FROM documents WHERE rowid = ?", (cursor.lastrowid,)).fetchone()[0]
+
+
+    def send(self, links):
+        """
+        Queue links for the partitions owning their hosts.
+
+        Args:
+            links: list of (partition, (priority, url, depth))
+        """
+        if not links:
+            return
+        with self._transaction():
+            self.conn.executemany("INSERT INTO links (partition, priority, url, depth) VALUES (?, ?, ?, ?)",
+                                  [(partition, priority, url, depth) for partition, (priority, url, depth) in links])
+
+
+    def receive(self, partition, limit=10000):
+        """
+        Take up to `limit` links queued for `partition`. A worker that receives links is busy again.
+
+        Returns:
+            list of (priority, url, depth)
+        """
+        with self._transaction():
+            rows = self.conn.execute("SELECT id, priority, url, depth FROM links WHERE partition = ? ORDER BY id LIMIT ?",
+                                     (partition, limit)).fetchall()
+            if not rows:
+                return []
+            self.conn.execute("DELETE FROM links WHERE partition = ? AND id <= ?", (partition, rows[-1][0]))
+            self.conn.execute("UPDATE workers SET idle = 0, updated = ? WHERE partition = ?", (time.time(), partition))
+        return [(priority, url, depth) for _, priority, url, depth in rows]
+
+
+    def publish_simhash(self, partition, simhash):
+        self.conn.execute("INSERT INTO simhashes (partition, simhash) VALUES (?, ?)", (partition, format(simhash, 'x')))
+
+
+    def new_simhashes(self):
+        """
+        SimHashes published (by any partition) since the previous call.
+        """
+        rows = self.conn.execute("SELECT id, simhash FROM simhashes WHERE id > ? ORDER BY id",
+                                 (self._last_simhash_id,)).fetchall()
+        if rows:
+            self._last_simhash_id = rows[-1][0]
+        return [int(simhash, 16) for _, simhash in rows]
+
+
+    def set_idle(self, partition):
+        """
+        Mark a worker whose frontier is empty and who has nothing in flight or left to send.
+        """
+        self.conn.execute("UPDATE workers SET idle = 1, updated = ? WHERE partition = ?", (time.time(), partition))
+
+
+    def mark_exited(self, partition):
+        """
+        Take a worker that stopped (e.g. crashed) out of the termination check. Links queued
+        for it stay in the database for the next crawl.
+        """
+        self.conn.execute("UPDATE workers SET idle = 1, exited = 1, updated = ? WHERE partition = ?", (time.time(), partition))
+
+
+    def finished(self):
+        """
+        True once every worker is idle and no links are queued for a running worker.
+
+        Workers send their links before they go idle and become busy in the same transaction
+        in which they receive links, so no link can be on its way when this is True.
+        """
+        busy, queued = self.conn.execute(
+            "SELECT (SELECT COUNT(*) FROM workers WHERE idle = 0),"
+            " (SELECT COUNT(*) FROM links WHERE partition IN (SELECT partition FROM workers WHERE exited = 0))"
+        ).fetchone()
+        return busy == 0 and queued == 0
+
+
+    def close(self):
+        self.conn.close()
+
+
+    def _transaction(self):
+        return _Transaction(self.conn)
+
+
+class _Transaction:
+    """
+    BEGIN IMMEDIATE ... COMMIT (or ROLLBACK on error). IMMEDIATE takes the write lock up front,
+    so concurrent read-then-write transactions of different workers cannot deadlock.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
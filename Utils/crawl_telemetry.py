@@ -0,0 +1,155 @@
+import os
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from Utils.metrics import MetricsRegistry
+
+
+# Fetch and stage durations in seconds, from fast local pages to the request timeout
+CRAWL_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0)
+
+
+class CrawlTelemetry:
+    """
+    Live metrics of a crawl in the Prometheus text format (see Utils/metrics.py): page outcomes,
+    bytes and fetch latency per host, time per stage, and gauges (pages/s, bytes/s, frontier
+    size per host, duplicate and non-English rates) updated by `report`.
+
+    `report` also writes the metrics to `path`, and if `port` is set they are served at
+    http://127.0.0.1:<port>/metrics while the crawl runs. Hosts beyond the first `max_hosts`
+    are reported as host="other", so the number of series stays bounded.
+    """
+
+    def __init__(self, path='data/crawl_metrics.prom', port=None, max_hosts=200, frontier_hosts=20):
+        self.path = path
+        self.port = port
+        self.max_hosts = max_hosts
+        self.frontier_hosts = frontier_hosts
+        self.registry = MetricsRegistry(buckets=CRAWL_BUCKETS)
+        self._hosts = set()
+        self.start_time = time.time()
+        self._last_report = (self.start_time, 0, 0)  # time, pages, bytes at the last report
+        self.pages = 0
+        self.bytes = 0
+        self._server = None
+
+
+    def count(self, outcome):
+        self.registry.inc("crawler_pages_total", {"outcome": outcome},
+                          help_text="Pages handled by the crawler, by outcome.")
+        if outcome in ("crawled", "revisited_changed"):
+            self.pages += 1
+
+
+    def fetched(self, host, seconds, num_bytes, status):
+        host = self._host_label(host)
+        self.registry.observe("crawler_fetch_duration_seconds", seconds, {"host": host},
+                              help_text="Time from sending a request to having read the body, per host.")
+        self.registry.inc("crawler_fetches_total", {"host": host, "status": status},
+                          help_text="Fetches per host and page status.")
+        if num_bytes:
+            self.registry.inc("crawler_bytes_total", {"host": host}, num_bytes,
+                              help_text="Body bytes read (decompressed), per host.")
+            self.bytes += num_bytes
+
+
+    def stage(self, name, seconds):
+        self.registry.observe("crawler_stage_duration_seconds", seconds, {"stage": name},
+                              help_text="Time spent per page in each crawl stage.")
+
+
+    def report(self, stats, frontier, fetches_in_flight, processes_in_flight, process_backlog=0):
+        """
+        Update the gauges from the crawler's state and write all metrics to `path`.
+        """
+        now = time.time()
+        last_time, last_pages, last_bytes = self._last_report
+        elapsed = max(now - last_time, 1e-9)
+        self._last_report = (now, self.pages, self.bytes)
+
+        gauges = self.registry.set
+        gauges("crawler_pages_per_second", (self.pages - last_pages) / elapsed,
+               help_text="Pages indexed per second since the previous report.")
+        gauges("crawler_bytes_per_second", (self.bytes - last_bytes) / elapsed,
+               help_text="Bytes read per second since the previous report.")
+        gauges("crawler_uptime_seconds", now - self.start_time, help_text="Seconds since the crawl started.")
+        gauges("crawler_in_flight", fetches_in_flight, {"kind": "fetch"},
+               help_text="Requests and preprocessing jobs running.")
+        gauges("crawler_in_flight", processes_in_flight, {"kind": "process"})
+        gauges("crawler_process_backlog", process_backlog,
+               help_text="Fetched pages waiting for a preprocessing slot; fetching pauses while there are any.")
+
+        # Pages that reached the duplicate check (fetched with text), and those that passed it
+        checked = stats["crawled"] + stats["skipped_duplicate_content"] + stats["skipped_non_english"]
+        gauges("crawler_duplicate_ratio", stats["skipped_duplicate_content"] / checked if checked else 0.0,
+               help_text="Fraction of fetched pages skipped as near-duplicates (SimHash).")
+        unique = stats["crawled"] + stats["skipped_non_english"]
+        gauges("crawler_non_english_ratio", stats["skipped_non_english"] / unique if unique else 0.0,
+               help_text="Fraction of non-duplicate pages skipped as non-English or without text.")
+
+        gauges("crawler_frontier_urls", len(frontier), help_text="URLs queued in the frontier.")
+        gauges("crawler_frontier_hosts", frontier.num_hosts(), help_text="Hosts with a back queue in memory.")
+        self.registry.remove("crawler_frontier_host_urls")  # only the current largest queues
+        for host, size in frontier.host_queue_sizes(self.frontier_hosts):
+            gauges("crawler_frontier_host_urls", size, {"host": host},
+                   help_text=f"URLs in memory for the {self.frontier_hosts} hosts with the longest queues.")
+
+        self._write()
+
+
+    def start_server(self):
+        if self.port is None:
+            return
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # scrapes would flood the crawl log
+
+        try:
+            self._server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        except OSError as e:
+            logging.warning(f"[METRICS] Could not serve metrics on port {self.port}: {e}. Writing them to {self.path} only.")
+            return
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        logging.info(f"[METRICS] Serving crawl metrics at http://127.0.0.1:{self.port}/metrics")
+
+
+    def close(self):
+        self._write()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+    def _host_label(self, host):
+        if host in self._hosts:
+            return host
+        if len(self._hosts) < self.max_hosts:
+            self._hosts.add(host)
+            return host
+        return "other"
+
+
+    def _write(self):
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.registry.render())
+            os.replace(tmp_path, self.path) # Readers never see a half-written file
+        except OSError as e:
+            logging.error(f"[METRICS] Error writing metrics to {self.path}: {e}.")
@@ -0,0 +1,102 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+class RankedListCache:
+    """
+    Server-side cache of full ranked result lists, addressed by an opaque cursor.
+
+    The first request for a query runs the whole search pipeline and stores the
+    complete ranking here. Later pages only slice the cached list.
+    """
+
+    def __init__(self, ttl=300, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # cursor -> {"key": ..., "results": [(url, score), ...], "skipped": [stage, ...], "expires": float}
+        self._entries = OrderedDict()
+        # normalized query key -> cursor, so the same query reuses its cursor
+        self._cursor_by_key = {}
+        self._lock = threading.Lock()
+
+
+    def put(self, key, results, skipped=()):
+        """
+        Store a ranked list and return the cursor pointing to it.
+
+        Args:
+            key: hashable -> normalized query key
+            results: list of (url, score) -> full ranked list
+            skipped: list of str -> stages skipped for the deadline; such a degraded list is
+                     only served through its cursor, never looked up for a new query
+
+        Returns:
+            str: Opaque cursor for later pages
+        """
+        cursor = secrets.token_urlsafe(16)
+        with self._lock:
+            self._evict_expired()
+
+            if not skipped:
+                old_cursor = self._cursor_by_key.pop(key, None)
+                if old_cursor is not None:
+                    self._entries.pop(old_cursor, None)
+                self._cursor_by_key[key] = cursor
+
+            self._entries[cursor] = {"key": key, "results": results, "skipped": list(skipped), "expires": time.time() + self.ttl}
+
+            while len(self._entries) > self.max_entries:
+                oldest_cursor, oldest = self._entries.popitem(last=False)
+                if self._cursor_by_key.get(oldest["key"]) == oldest_cursor:
+                    del self._cursor_by_key[oldest["key"]]
+        return cursor
+
+
+    def get(self, cursor):
+        """
+        Returns the ranked list stored under `cursor`, or None if unknown or expired.
+        """
+        entry = self.entry(cursor)
+        return entry[1] if entry is not None else None
+
+
+    def entry(self, cursor):
+        """
+        Returns (normalized query key, ranked list, skipped stages) stored under `cursor`, or None
+        if unknown or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(cursor)
+            if entry is None:
+                return None
+            if entry["expires"] < time.time():
+                self._drop(cursor)
+                return None
+            return entry["key"], entry["results"], entry["skipped"]
+
+
+    def lookup(self, key):
+        """
+        Returns the live cursor for a normalized query key, or None.
+        """
+        with self._lock:
+            cursor = self._cursor_by_key.get(key)
+        if cursor is None or self.get(cursor) is None:
+            return None
+        return cursor
+
+
+    def _drop(self, cursor):
+        entry = self._entries.pop(cursor, None)
+        if entry is not None and self._cursor_by_key.get(entry["key"]) == cursor:
+            del self._cursor_by_key[entry["key"]]
+
+
+    def _evict_expired(self):
+        now = time.time()
+        expired = [cursor for cursor, entry in self._entries.items() if entry["expires"] < now]
+        for cursor in expired:
+            self._drop(cursor)
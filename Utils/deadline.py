@@ -0,0 +1,61 @@
+import time
+from Utils import metrics
+
+
+class Deadline:
+    """
+    Per-request time budget carried through the search pipeline.
+
+    Optional stages ask `allows(stage)` before running. A stage only runs if at least
+    its reserve (a fraction of the total budget) is still left, otherwise it is skipped
+    and recorded in `skipped`. The reserves decrease along DEGRADATION_ORDER, so as the
+    budget runs out stages are dropped in that order: query expansion first, sentiment last.
+    """
+
+    DEGRADATION_ORDER = ("expansion", "candidates", "proximity", "dense_rerank", "sentiment")
+
+    DEFAULT_RESERVES = {
+        "expansion": 0.75,     # skip WordNet synonym expansion
+        "candidates": 0.6,     # shrink the union candidate set to the rarest terms' postings
+        "proximity": 0.45,     # skip positional proximity bonuses
+        "dense_rerank": 0.3,   # skip SBERT encoding and re-ranking, keep BM25 order
+        "sentiment": 0.15,     # skip subjectivity classification of the result pages
+    }
+
+    def __init__(self, budget, reserves=None):
+        """
+        Args:
+            budget: float -> total time budget in seconds
+            reserves: dict -> optional overrides of DEFAULT_RESERVES
+        """
+        self.budget = budget
+        self.start = time.perf_counter()
+        self.reserves = dict(self.DEFAULT_RESERVES)
+        if reserves:
+            self.reserves.update(reserves)
+        self.skipped = []
+
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+    def remaining(self):
+        return max(0.0, self.budget - self.elapsed())
+
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+    def allows(self, stage):
+        """
+        Returns True if `stage` may run with the budget left, otherwise records it as skipped.
+        """
+        if self.remaining() >= self.reserves[stage] * self.budget:
+            return True
+        if stage not in self.skipped:
+            self.skipped.append(stage)
+            metrics.registry.inc("search_degraded_stages_total", {"stage": stage},
+                                 help_text="Pipeline stages skipped because the request deadline was close.")
+        return False
@@ -0,0 +1,97 @@
+import pickle
+import logging
+import multiprocessing
+from Utils.legal_crawling import OfflineCrawler
+from Utils.crawl_shared_state import SharedCrawlState, partition_path
+from Utils.checkpoint import SnapshotJournal, atomic_dump
+
+
+def _crawl_partition(seeds, index, num_workers, shared_state_path, crawler_kwargs):
+    crawler = OfflineCrawler(seeds, partition=(index, num_workers), shared_state_path=shared_state_path, **crawler_kwargs)
+    crawler.run()
+
+
+class DistributedCrawler:
+    """
+    Runs the crawl in `num_workers` processes, each owning the hosts whose hash falls into
+    its partition (see `partition_of`). Each worker is a normal OfflineCrawler with its own
+    frontier and politeness per host, and its own state files (data/<name>.p<index>.pkl).
+    Links to hosts of another partition go through the shared SQLite store to their owner.
+
+    When all workers are done, their documents and SimHashes are merged into
+    data/crawled_data.pkl and data/simhashes.pkl for the indexer.
+    """
+
+    def __init__(self, seeds, num_workers=4, shared_state_path='data/crawl_shared.db', **crawler_kwargs):
+        self.seeds = seeds
+        self.num_workers = num_workers
+        self.shared_state_path = shared_state_path
+        self.crawler_kwargs = crawler_kwargs
+
+        self.path_to_crawled_data = 'data/crawled_data.pkl'
+        self.path_to_simhashes = 'data/simhashes.pkl'
+
+
+    def run(self):
+        shared = SharedCrawlState(self.shared_state_path)
+        # Documents of earlier (single-process) crawls keep their IDs
+        shared.register_documents(self._load(self.path_to_crawled_data, {}))
+        shared.reset_workers(self.num_workers)
+
+        processes = []
+        for index in range(self.num_workers):
+            process = multiprocessing.Process(
+                target=_crawl_partition,
+                args=(self.seeds, index, self.num_workers, self.shared_state_path, self.crawler_kwargs),
+                name=f"crawler-{index}",
+            )
+            process.start()
+            processes.append(process)
+        logging.info(f"[DISTRIBUTED] Started {self.num_workers} crawler processes.")
+
+        running = dict(enumerate(processes))
+        try:
+            while running:
+                for index, process in list(running.items()):
+                    process.join(timeout=1)
+                    if process.exitcode is None:
+                        continue
+                    del running[index]
+                    if process.exitcode != 0:
+                        # Don't let the others wait for links to a partition that is gone
+                        logging.error(f"[DISTRIBUTED] Crawler process {index} exited with code {process.exitcode}.")
+                        shared.mark_exited(index)
+        except KeyboardInterrupt:
+            # The workers got the same SIGINT and save their own state
+            logging.info("[DISTRIBUTED] Interrupted, waiting for the crawler processes to save their state...")
+            for process in running.values():
+                process.join()
+
+        self._merge_partitions(shared)
+        shared.close()
+
+
+    def _merge_partitions(self, shared):
+        crawled_data = self._load(self.path_to_crawled_data, {})
+        for index in range(self.num_workers):
+            crawled_data.update(self._load(partition_path(self.path_to_crawled_data, index), {}))
+
+        # simhashes.pkl is journaled by single-process crawls: include its journal and reset it with the snapshot
+        simhash_journal = SnapshotJournal(self.path_to_simhashes)
+        simhashes = self._load(self.path_to_simhashes, set())
+        simhashes.update(simhash_journal.replay())
+        simhashes.update(shared.new_simhashes())
+
+        atomic_dump(crawled_data, self.path_to_crawled_data)
+        simhash_journal.checkpoint(simhashes, len(simhashes), force=True)
+        simhash_journal.close()
+        logging.info(f"[DISTRIBUTED] Merged {self.num_workers} partitions: {len(crawled_data)} documents, {len(simhashes)} SimHashes.")
+
+
+    @staticmethod
+    def _load(path, default):
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return default
@@ -0,0 +1,216 @@
+import os
+import time
+import zlib
+import struct
+import pickle
+import logging
+from Utils.checkpoint import atomic_dump, lock_directory
+
+
+RECORD_HEADER = struct.Struct('<II')   # payload length, CRC32 of the payload
+INDEX_ENTRY = struct.Struct('<QIQI')   # doc ID, segment number, offset, record length
+
+
+class DocumentLog:
+    """
+    Append-only log of crawled documents, replacing the re-pickling of all documents per page.
+
+    Records (doc_id, doc_info) are appended to segment files (segment_<n>.log) of at most
+    `segment_bytes`. A document written again (e.g. a changed revisit) gets a new record; the
+    latest one wins. Each record is written right away (so it survives the crawler being
+    killed), while commits are grouped: one fsync and index write once `group_size` records
+    are pending or the oldest is `group_interval` seconds old, or when `commit` is called.
+
+    index.bin is the offset index: one fixed-size entry per record (doc ID, segment, offset,
+    length). It is written after the segments it points into, so on open, records after the
+    last indexed one are recovered by scanning the log, and a torn record at the end is cut off.
+    As that would cut off the records of a process still writing, one process at a time may
+    have the log open (the directory's LOCK file); opening it raises RuntimeError otherwise.
+    """
+
+    def __init__(self, path='data/crawl_log', segment_bytes=64 * 1024 * 1024, group_size=32, group_interval=1.0):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.group_size = group_size
+        self.group_interval = group_interval
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = lock_directory(path)
+        self.path_to_index = os.path.join(path, "index.bin")
+        self.created = not os.path.exists(self.path_to_index)
+
+        self.offsets = {}      # doc_id -> (segment, offset, length) of its latest record
+        self.next_id = 0       # never reused, also after a document is rewritten
+        self._pending = []     # index entries of records not committed yet
+        self._pending_since = None
+        self._open()
+
+
+    def allocate_id(self):
+        """
+        Returns a new doc ID, larger than every ID in the log.
+        """
+        doc_id = self.next_id
+        self.next_id += 1
+        return doc_id
+
+
+    def append(self, doc_id, doc_info):
+        payload = pickle.dumps((doc_id, doc_info), protocol=pickle.HIGHEST_PROTOCOL)
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        if self._active_size > 0 and self._active_size + len(record) > self.segment_bytes:
+            os.fsync(self._active_file.fileno())
+            self._start_segment(self._active_segment + 1)
+        self._active_file.write(record)
+        entry = (doc_id, self._active_segment, self._active_size, len(record))
+        self._active_size += len(record)
+        self._pending.append(entry)
+        self.offsets[doc_id] = entry[1:]
+        self.next_id = max(self.next_id, doc_id + 1)
+        if self._pending_since is None:
+            self._pending_since = time.time()
+        if len(self._pending) >= self.group_size or time.time() - self._pending_since >= self.group_interval:
+            self.commit()
+
+
+    def commit(self):
+        """
+        Make the pending records durable (one fsync) and index them.
+        """
+        if not self._pending:
+            return
+        os.fsync(self._active_file.fileno())
+        self._index_file.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in self._pending))
+        self._index_file.flush()
+        self._pending = []
+        self._pending_since = None
+
+
+    def get(self, doc_id):
+        segment, offset, length = self.offsets[doc_id]
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(offset)
+            record = f.read(length)
+        return pickle.loads(record[RECORD_HEADER.size:])[1]
+
+
+    def iter_records(self):
+        """
+        Stream (doc_id, doc_info) of the latest version of every document, in log order.
+        """
+        current = {(segment, offset) for segment, offset, _ in self.offsets.values()}
+        for segment in self._segments():
+            with open(self._segment_path(segment), "rb") as f:
+                offset = 0
+                while True:
+                    header = f.read(RECORD_HEADER.size)
+                    if len(header) < RECORD_HEADER.size:
+                        break
+                    length, _ = RECORD_HEADER.unpack(header)
+                    payload = f.read(length)
+                    if (segment, offset) in current:
+                        yield pickle.loads(payload)
+                    offset += RECORD_HEADER.size + length
+
+
+    def export(self, path):
+        """
+        Write the documents as one pickled {doc_id: doc_info} dict (the format the indexer reads).
+        """
+        crawled_data = dict(self.iter_records())
+        atomic_dump(crawled_data, path)
+        logging.info(f"Exported {len(crawled_data)} documents from {self.path} to {path}.")
+
+
+    def close(self):
+        self.commit()
+        self._active_file.close()
+        self._index_file.close()
+        self._lock_file.close()
+
+
+    def __contains__(self, doc_id):
+        return doc_id in self.offsets
+
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, f"segment_{segment:05d}.log")
+
+
+    def _segments(self):
+        return sorted(int(name[len("segment_"):-len(".log")]) for name in os.listdir(self.path)
+                      if name.startswith("segment_") and name.endswith(".log"))
+
+
+    def _start_segment(self, segment):
+        if getattr(self, "_active_file", None) is not None:
+            self._active_file.close()
+        self._active_segment = segment
+        self._active_file = open(self._segment_path(segment), "ab", buffering=0)
+        self._active_size = self._active_file.tell()
+
+
+    def _open(self):
+        segments = self._segments()
+        sizes = {segment: os.path.getsize(self._segment_path(segment)) for segment in segments}
+
+        # Index entries; a torn entry at the end (crash while writing it) is dropped
+        data = b""
+        if not self.created:
+            with open(self.path_to_index, "rb") as f:
+                data = f.read()
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        end = (segments[0], 0) if segments else (0, 0)  # position after the last indexed record
+        for doc_id, segment, offset, length in INDEX_ENTRY.iter_unpack(data[:usable]):
+            if offset + length > sizes.get(segment, -1):
+                continue
+            self.offsets[doc_id] = (segment, offset, length)
+            end = max(end, (segment, offset + length))
+        self._index_file = open(self.path_to_index, "r+b" if not self.created else "wb")
+        self._index_file.truncate(usable)
+        self._index_file.seek(usable)
+
+        recovered = self._recover(end, [segment for segment in segments if segment >= end[0]])
+        self.next_id = max(self.offsets, default=-1) + 1
+        self._start_segment(segments[-1] if segments else 0)
+        if self.offsets:
+            logging.info(f"Opened document log {self.path} with {len(self.offsets)} documents"
+                         + (f" ({recovered} records recovered from the log)" if recovered else ""))
+
+
+    def _recover(self, end, segments):
+        """
+        Index the records written after the last index entry, and cut off a torn record.
+        """
+        entries = []
+        for segment in segments:
+            offset = end[1] if segment == end[0] else 0
+            path = self._segment_path(segment)
+            with open(path, "r+b") as f:
+                f.seek(offset)
+                while True:
+                    header = f.read(RECORD_HEADER.size)
+                    if not header:
+                        break
+                    valid = len(header) == RECORD_HEADER.size
+                    if valid:
+                        length, crc = RECORD_HEADER.unpack(header)
+                        payload = f.read(length)
+                        valid = len(payload) == length and zlib.crc32(payload) == crc
+                    if not valid:
+                        logging.warning(f"Truncating incomplete record at {path}:{offset}.")
+                        f.truncate(offset)
+                        break
+                    doc_id = pickle.loads(payload)[0]
+                    entries.append((doc_id, segment, offset, RECORD_HEADER.size + len(payload)))
+                    offset += RECORD_HEADER.size + len(payload)
+
+        if entries:
+            self._index_file.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in entries))
+            self._index_file.flush()
+            for doc_id, segment, offset, length in entries:
+                self.offsets[doc_id] = (segment, offset, length)
+        return len(entries)
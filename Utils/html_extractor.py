@@ -0,0 +1,169 @@
+import re
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+    import lxml.html
+except ImportError:  # optional: the streaming stdlib parser is used instead
+    lxml = None
+
+
+# Never visible
+SKIPPED_TAGS = {"script", "style"}
+# Visible, but not part of the page's own content (left out of SimHash, indexing and link extraction)
+BOILERPLATE_TAGS = {"nav", "footer", "header", "aside", "form"}
+
+_BODY_TAG = re.compile(r"<body[\s/>]", re.IGNORECASE)
+
+
+class _Collector:
+    """
+    Builds the extraction result from start/end/data events, so every backend only has to
+    walk the document once and report what it sees.
+    """
+
+    def __init__(self):
+        self.text_parts = []
+        self.content_parts = []
+        self.title_parts = []
+        self.links = []
+        self.description = ""
+        self.has_body = False
+
+        self._skipped_depth = 0
+        self._boilerplate_depth = 0
+        self._in_title = False
+        self._anchor = None  # (href, anchor text parts) of the open <a>
+
+
+    def start(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skipped_depth += 1
+        elif tag in BOILERPLATE_TAGS:
+            self._boilerplate_depth += 1
+        elif tag == "a":
+            self._close_anchor()  # <a> elements cannot be nested
+            href = attrs.get("href")
+            if href is not None and not self._boilerplate_depth:
+                self._anchor = (href, [])
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "body":
+            self.has_body = True
+        elif tag == "meta" and (attrs.get("name") or "").lower() == "description":
+            self.description = (attrs.get("content") or "").strip()
+
+
+    def end(self, tag):
+        if tag in SKIPPED_TAGS:
+            self._skipped_depth = max(0, self._skipped_depth - 1)
+        elif tag in BOILERPLATE_TAGS:
+            self._boilerplate_depth = max(0, self._boilerplate_depth - 1)
+        elif tag == "a":
+            self._close_anchor()
+        elif tag == "title":
+            self._in_title = False
+
+
+    def data(self, text):
+        if self._skipped_depth:
+            return
+        self.text_parts.append(text)
+        if self._in_title:
+            self.title_parts.append(text)
+        if not self._boilerplate_depth:
+            self.content_parts.append(text)
+            if self._anchor is not None:
+                self._anchor[1].append(text)
+
+
+    def _close_anchor(self):
+        if self._anchor is not None:
+            href, parts = self._anchor
+            self.links.append((href, " ".join(part.strip() for part in parts if part.strip())))
+            self._anchor = None
+
+
+    def result(self):
+        self._close_anchor()
+        return {
+            "text": " ".join(self.text_parts),
+            "content_text": " ".join(self.content_parts),
+            "links": self.links,
+            "title": " ".join("".join(self.title_parts).split()),
+            "description": self.description,
+            "has_body": self.has_body,
+        }
+
+
+class _StreamingParser(HTMLParser):
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+
+def _extract_lxml(html, collector):
+    root = lxml.html.document_fromstring(html)
+    for event, element in etree.iterwalk(root, events=("start", "end")):
+        if not isinstance(element.tag, str):
+            # Comment or processing instruction: only the text after it is content
+            if event == "end" and element.tail:
+                collector.data(element.tail)
+            continue
+        tag = element.tag.lower()
+        if event == "start":
+            collector.start(tag, element.attrib)
+            if element.text:
+                collector.data(element.text)
+        else:
+            collector.end(tag)
+            if element.tail:
+                collector.data(element.tail)
+    # lxml adds a <body> to every document; has_body says whether the page itself has one
+    collector.has_body = _BODY_TAG.search(html) is not None
+
+
+def extract_page(html):
+    """
+    Extract everything the crawler needs from a page in a single pass over the HTML, with
+    lxml if it is installed and the streaming stdlib parser otherwise.
+
+    Args:
+        html: str -> decoded HTML document
+
+    Returns:
+        dict -> {
+            'text': visible text (without script/style),
+            'content_text': visible text without boilerplate (nav, header, footer, aside, form),
+            'links': list of (href as written, anchor text) outside boilerplate,
+            'title': str,
+            'description': str -> content of <meta name="description">,
+            'has_body': bool -> whether the HTML has a <body> tag,
+        }
+    """
+    if lxml is not None:
+        collector = _Collector()
+        try:
+            _extract_lxml(html, collector)
+            return collector.result()
+        except ValueError:
+            pass  # lxml rejects str input with an XML encoding declaration
+
+    collector = _Collector()
+    parser = _StreamingParser(collector)
+    parser.feed(html)
+    parser.close()
+    return collector.result()
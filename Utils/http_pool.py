@@ -0,0 +1,118 @@
+import threading
+import weakref
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+
+try:
+    import brotli  # urllib3 decodes brotli responses with it
+except ImportError:  # optional: responses are then requested with gzip/deflate only
+    brotli = None
+
+
+# Only offer encodings the response can be decoded from
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli is not None else "gzip, deflate"
+
+
+class HostSessionPool:
+    """
+    One keep-alive `requests.Session` per host, so consecutive fetches from a site reuse
+    their TCP/TLS connection instead of doing a new handshake every time.
+
+    Each session keeps at most `connections_per_host` open connections. Sessions of the
+    `max_hosts` most recently used hosts are kept; older ones are closed. Responses are
+    requested compressed (gzip/deflate, and brotli when the `brotli` package is installed).
+    """
+
+    def __init__(self, user_agent, connections_per_host=2, max_hosts=256):
+        self.user_agent = user_agent
+        self.connections_per_host = connections_per_host
+        self.max_hosts = max_hosts
+
+        self._sessions = OrderedDict()  # host -> requests.Session, least recently used first
+        self._seen_sockets = weakref.WeakSet()  # sockets that already carried a response
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.connections_opened = 0
+        self.sessions_closed = 0
+        self.bytes_received = 0   # as transferred, i.e. compressed
+        self.bytes_decoded = 0    # after decompression
+
+
+    def _session(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is not None:
+                self._sessions.move_to_end(host)
+                return session
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.connections_per_host, pool_block=True)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({
+                'User-Agent': self.user_agent,
+                'Accept-Encoding': ACCEPT_ENCODING,
+                'Connection': 'keep-alive',
+            })
+            self._sessions[host] = session
+
+            while len(self._sessions) > self.max_hosts:
+                _, old_session = self._sessions.popitem(last=False)
+                old_session.close()
+                self.sessions_closed += 1
+            return session
+
+
+    def get(self, url, **kwargs):
+        """
+        `requests.get` through the session of the URL's host. Use the response as a context
+        manager (or read its content) so the connection goes back to the pool.
+
+        A response counts as reusing a connection if its socket already carried an earlier
+        response; this needs `stream=True`, otherwise the connection is released before it can
+        be checked and the request counts as a new connection.
+        """
+        session = self._session(urlparse(url).netloc)
+        response = session.get(url, **kwargs)
+        sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+        with self._lock:
+            self.requests += 1
+            if sock is None or sock not in self._seen_sockets:
+                self.connections_opened += 1
+                if sock is not None:
+                    self._seen_sockets.add(sock)
+        return response
+
+
+    def record_transfer(self, response, decoded_bytes):
+        """
+        Account the bytes of a fully read response: on the wire and after decompression.
+        """
+        with self._lock:
+            self.bytes_received += response.raw.tell()
+            self.bytes_decoded += decoded_bytes
+
+
+    def stats(self):
+        with self._lock:
+            reused = self.requests - self.connections_opened
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connection_reuse_rate": reused / self.requests if self.requests else 0.0,
+                "open_sessions": len(self._sessions),
+                "sessions_closed": self.sessions_closed,
+                "bytes_received": self.bytes_received,
+                "bytes_decoded": self.bytes_decoded,
+                "compression_ratio": self.bytes_decoded / self.bytes_received if self.bytes_received else 0.0,
+            }
+
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
@@ -2,63 +2,100 @@ from sentence_transformers import SentenceTransformer, util
 import torch
 from Utils.bm25 import BM25
 from Utils.indexer import Indexer
+from Utils.semantic_cache import SemanticQueryCache
+from Utils import metrics
 import pickle
+import numpy as np
 
 
 class HybridRetrieval:
-    def __init__(self):
-        self.bm25 = BM25()
+    def __init__(self, shared_index=None, semantic_cache_threshold=None):
+        self.shared_index = shared_index
+        self.indexer = Indexer(silent=True, shared_index=shared_index)
+        self.bm25 = BM25(indexer=self.indexer, shared_index=shared_index)
         self.model = SentenceTransformer('all-MiniLM-L6-v2')  # Fast & accurate
-        self.indexer = Indexer()
-        with open('data/sbert_doc_embeddings.pkl', 'rb') as f:
-            self.doc_embeddings = pickle.load(f)  # {doc_id: np.array}
+        if shared_index is not None:
+            self.doc_embeddings = None
+        else:
+            with open('data/sbert_doc_embeddings.pkl', 'rb') as f:
+                self.doc_embeddings = pickle.load(f)  # {doc_id: np.array}
 
-    def retrieve(self, weighted_query, candidate_doc_ids, top_k=50, lambda_bm25=0.5):
+        # Reuses rankings of near-duplicate queries; None disables it
+        self.semantic_cache = None
+        if semantic_cache_threshold is not None:
+            self.semantic_cache = SemanticQueryCache(threshold=semantic_cache_threshold,
+                                                     version_fn=self.indexer.index_version)
+
+    def _doc_embedding(self, doc_id):
+        if self.shared_index is not None:
+            emb = self.shared_index.embedding(doc_id)
+            # Copy out of the read-only memory map, torch wants a writable buffer
+            return np.array(emb) if emb is not None else None
+        return self.doc_embeddings.get(doc_id)
+
+    def encode_query(self, weighted_query):
+        """
+        SBERT embedding of the weighted query (terms repeated according to their weights).
+        """
+        with metrics.stage("query_encode"):
+            query_text = " ".join([term for term, weight in weighted_query for _ in range(int(weight * 2))])
+            return self.model.encode(query_text, convert_to_tensor=True)
+
+    def retrieve(self, weighted_query, candidate_doc_ids, top_k=50, lambda_bm25=0.5, query_emb=None, deadline=None):
         """
         Perform hybrid retrieval: BM25 retrieval + SBERT re-ranking.
+        `query_emb` can be passed in when the caller already encoded the query.
+        With a `deadline` close to expiring, the SBERT re-ranking is skipped and the BM25 order is kept.
         """
 
         # BM25 retrieval (returns list of tuples: (doc_id, bm25_score))
-        bm25_results = self.bm25.bm25_ranking(weighted_query, candidate_doc_ids)
+        bm25_results = self.bm25.bm25_ranking(weighted_query, candidate_doc_ids, deadline=deadline)
 
         # Keep only top_k BM25 results
         top_k_results = bm25_results[:top_k]
 
+        if deadline is not None and not deadline.allows("dense_rerank"):
+            return [(self.bm25.get_url(doc_id), bm25_score) for doc_id, bm25_score in top_k_results]
+
         # Prepare the query for SBERT (repeat terms based on their weights)
-        query_text = " ".join([term for term, weight in weighted_query for _ in range(int(weight * 2))])
-        query_emb = self.model.encode(query_text, convert_to_tensor=True)
+        if query_emb is None:
+            query_emb = self.encode_query(weighted_query)
 
         # Collect embeddings for top_k docs
-        doc_ids = []
-        corpus_emb = []
-        for doc_id, bm25_score in top_k_results:
-            if doc_id in self.doc_embeddings:
-                doc_ids.append(doc_id)
-                emb = torch.from_numpy(self.doc_embeddings[doc_id]).to(query_emb.device)
-                corpus_emb.append(emb)
-
-        if not corpus_emb:
+        with metrics.stage("cosine"):
+            doc_ids = []
+            corpus_emb = []
+            for doc_id, bm25_score in top_k_results:
+                doc_emb = self._doc_embedding(doc_id)
+                if doc_emb is not None:
+                    doc_ids.append(doc_id)
+                    emb = torch.from_numpy(doc_emb).to(query_emb.device)
+                    corpus_emb.append(emb)
+
+            if doc_ids:
+                corpus_emb = torch.stack(corpus_emb)
+
+                # Compute cosine similarity
+                cosine_scores = util.cos_sim(query_emb, corpus_emb)[0]  # shape: (len(doc_ids),)
+
+        if not doc_ids:
             # Return BM25 results with original BM25 scores
             print("No embeddings found")
-            return [(self.bm25.crawled_data[doc_id]['url'], bm25_score) for doc_id, bm25_score in top_k_results]
+            return [(self.bm25.get_url(doc_id), bm25_score) for doc_id, bm25_score in top_k_results]
 
-        corpus_emb = torch.stack(corpus_emb)
+        # Hybrid scoring
+        with metrics.stage("fusion"):
+            final_results = []
+            bm25_score_dict = {doc_id: score for doc_id, score in top_k_results}
 
-        # Compute cosine similarity
-        cosine_scores = util.cos_sim(query_emb, corpus_emb)[0]  # shape: (len(doc_ids),)
+            for idx, doc_id in enumerate(doc_ids):
+                url = self.bm25.get_url(doc_id)
+                bm25_score = bm25_score_dict.get(doc_id, 0)
+                sbert_score = cosine_scores[idx].item()
+                hybrid_score = lambda_bm25 * bm25_score + (1 - lambda_bm25) * sbert_score
+                final_results.append((url, hybrid_score))
 
-        # Hybrid scoring
-        final_results = []
-        bm25_score_dict = {doc_id: score for doc_id, score in top_k_results}
-
-        for idx, doc_id in enumerate(doc_ids):
-            url = self.bm25.crawled_data[doc_id]['url']
-            bm25_score = bm25_score_dict.get(doc_id, 0)
-            sbert_score = cosine_scores[idx].item()
-            hybrid_score = lambda_bm25 * bm25_score + (1 - lambda_bm25) * sbert_score
-            final_results.append((url, hybrid_score))
-
-        # Sort by hybrid score descending
-        final_results.sort(key=lambda x: x[1], reverse=True)
+            # Sort by hybrid score descending
+            final_results.sort(key=lambda x: x[1], reverse=True)
 
         return final_results
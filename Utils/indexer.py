@@ -1,16 +1,28 @@
 from collections import defaultdict
 import pickle
 import math
+import os
+import hashlib
 from sentence_transformers import SentenceTransformer
+from Utils.shared_index import SharedIndex
 
 
 class Indexer:
-    def __init__(self, silent=False):
+    def __init__(self, silent=False, shared_index=None):
         self.path_to_TFs = 'data/tfs.pkl'
         self.path_to_IDFs = 'data/idfs.pkl'
         self.path_to_crawled_data = 'data/crawled_data.pkl'
         self.path_to_posting_lists = 'data/posting_list.pkl'
         self.path_to_embeddings='data/sbert_doc_embeddings.pkl'
+        self.path_to_shared_index = 'data/shared_index'
+        # Version of the files loaded below; a server loads a new Indexer to serve a new index
+        self.version = self._files_version()
+
+        # When serving from the array-based SharedIndex, the pickled posting lists are not loaded at all
+        self.shared_index = shared_index
+        if shared_index is not None:
+            self.skip_dict, self.pos_index_dict = {}, {}
+            return
         
         if not silent:
             self.crawled_data = self._load(self.path_to_crawled_data)
@@ -27,9 +39,44 @@ class Indexer:
         self._build_IDF()
         print("Precomputing doc embeddings.")
         self._precompute_document_embeddings()
+        print("Building shared index...")
+        self._build_shared_index()
+        self.version = self._files_version()
         print("Indexer run done.")
 
 
+    def index_version(self):
+        """
+        Returns a short fingerprint of the index this Indexer serves: that of the index files
+        (path, size, mtime) when they were loaded, or last built by `run`. A re-index on disk
+        only changes it once the server loads the new files (on SIGHUP, see interface.py), so
+        caches keyed by it never mix results of two indexes.
+        """
+        return self.version
+
+
+    def _files_version(self):
+        paths = [self.path_to_crawled_data, self.path_to_posting_lists, self.path_to_TFs,
+                 self.path_to_IDFs, self.path_to_embeddings,
+                 os.path.join(self.path_to_shared_index, 'meta.json')]
+        fingerprint = hashlib.md5()
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            fingerprint.update(f"{path}:{st.st_size}:{st.st_mtime_ns};".encode('utf-8'))
+        return fingerprint.hexdigest()[:12]
+
+
+    def _build_shared_index(self):
+        with open(self.path_to_IDFs, "rb") as f:
+            idfs = pickle.load(f)
+        with open(self.path_to_embeddings, "rb") as f:
+            doc_embeddings = pickle.load(f)
+        SharedIndex.build(self.crawled_data, self.pos_index_dict, idfs, doc_embeddings, self.path_to_shared_index)
+
+
     def _precompute_document_embeddings(self, model_name='all-MiniLM-L6-v2'):
         model = SentenceTransformer(model_name)
 
@@ -57,21 +104,35 @@ class Indexer:
         print(f"[DONE] Saved to {self.path_to_embeddings}")
             
 
-    def get_union_candidates(self, query):
+    def get_union_candidates(self, query, max_candidates=None):
         """
         Retrieve documents that contain at least one of the query terms.
         Args:
             query: list of str -> preprocessed query tokens
+            max_candidates: int -> optional cap; terms are then added rarest first
+                            (shortest posting list) until the cap is reached, the
+                            last one only with as many postings as still fit
 
         Returns:
             set of int: Candidate document IDs
         """
+        if self.shared_index is not None:
+            return self.shared_index.get_union_candidates(query, max_candidates)
+
+        terms = [term for term in query if term in self.skip_dict]
+        if max_candidates is not None:
+            terms.sort(key=lambda term: len(self.skip_dict[term]))
+
         candidate_ids = set()
-        for term in query:
-            if term in self.skip_dict:
-                postings = self.skip_dict[term]
-                ids = [entry[0] for entry in postings]
-                candidate_ids.update(ids)
+        for term in terms:
+            postings = self.skip_dict[term]
+            if max_candidates is None:
+                candidate_ids.update(entry[0] for entry in postings)
+                continue
+            for entry in postings:
+                if len(candidate_ids) >= max_candidates:
+                    return list(candidate_ids)
+                candidate_ids.add(entry[0])
         return list(candidate_ids)
 
 
@@ -90,6 +151,13 @@ class Indexer:
         # Collect positions of all query terms in the given doc
         positions_list = []
         for term in query:
+            if self.shared_index is not None:
+                positions = self.shared_index.positions_of(term, doc_id)
+                if positions is None:
+                    return 0  # Term not in this doc
+                positions_list.append(positions)
+                continue
+
             if term not in self.pos_index_dict:
                 return 0  # If term doesn't exist in corpus, no bonus
 
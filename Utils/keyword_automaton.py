@@ -0,0 +1,115 @@
+import re
+from collections import deque
+
+
+_NON_WORD = re.compile(r'[^\w\s]')
+
+
+def scoring_tokens(text):
+    """
+    Lowercase, replace punctuation by spaces and split: the tokens that keywords are matched on.
+    """
+    return _NON_WORD.sub(' ', text.lower()).split()
+
+
+class KeywordAutomaton:
+    """
+    Finds all keywords of several labelled lists in one pass over a token sequence, with an
+    Aho-Corasick automaton over tokens. `find` is safe to call from several threads once the
+    automaton is built (as by the constructor).
+
+    Keywords are tokenized like the text (see `scoring_tokens`), so multi-word keywords such
+    as "botanical garden" match consecutive tokens (also in "/botanical-garden/"). A keyword
+    only ever matches whole tokens ("rome" does not match "chrome").
+    """
+
+    def __init__(self, keywords=None):
+        self._goto = [{}]      # state -> {token: next state}
+        self._fail = [0]
+        self._output = [()]    # state -> ids of the keywords ending in this state
+        self.keywords = []     # id -> token tuple
+        self.labels = []       # id -> set of labels
+        self._ids = {}         # token tuple -> id
+        self._built = True
+        for label, words in (keywords or {}).items():
+            self.add_all(words, label)
+        self._build() # Before the first (possibly concurrent) `find`
+
+
+    def add(self, keyword, label):
+        tokens = tuple(scoring_tokens(keyword))
+        if not tokens:
+            return
+        keyword_id = self._ids.get(tokens)
+        if keyword_id is None:
+            keyword_id = self._ids[tokens] = len(self.keywords)
+            self.keywords.append(tokens)
+            self.labels.append(set())
+            state = 0
+            for token in tokens:
+                next_state = self._goto[state].get(token)
+                if next_state is None:
+                    next_state = self._goto[state][token] = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] += (keyword_id,)
+            self._built = False
+        self.labels[keyword_id].add(label)
+
+
+    def add_all(self, keywords, label):
+        for keyword in keywords:
+            self.add(keyword, label)
+
+
+    def find(self, tokens):
+        """
+        Returns the ids of the keywords occurring in the token sequence.
+        """
+        if not self._built:
+            self._build()
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for token in tokens:
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+    def counts(self, tokens):
+        """
+        Returns {label: number of distinct keywords of that label in the token sequence}.
+        """
+        counts = {}
+        for keyword_id in self.find(tokens):
+            for label in self.labels[keyword_id]:
+                counts[label] = counts.get(label, 0) + 1
+        return counts
+
+
+    def __len__(self):
+        return len(self.keywords)
+
+
+    def _build(self):
+        # Breadth-first, so the failure state of a state's parent is final before the state itself
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(token, 0)
+                # Keywords ending at the failure state end here as well
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+                queue.append(next_state)
+        self._built = True
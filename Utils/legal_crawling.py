@@ -1,3 +1,4 @@
+import os
 import sys
 import time
 import requests
@@ -8,16 +9,35 @@ nltk.download("punkt_tab", quiet=True)
 nltk.download("wordnet", quiet=True)
 from nltk.corpus import stopwords
 import pickle
-from bs4 import BeautifulSoup
 import re
 from nltk.tokenize import word_tokenize
 from nltk.stem import WordNetLemmatizer
 import heapq 
 import urllib.robotparser 
 import hashlib
+import codecs
 import logging
 import signal
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from Utils.text_preprocessor import preprocess_text
+from Utils.html_extractor import extract_page
+from Utils.crawl_frontier import DiskFrontier
+from Utils.bloom_filter import ScalableBloomFilter
+from Utils.simhash_index import SimHashIndex
+from Utils.simhash import SimHasher
+from Utils.document_log import DocumentLog
+from Utils.page_archive import PageArchive, encode_response
+from Utils.checkpoint import SnapshotJournal, atomic_dump
+from Utils.url_canonicalizer import UrlCanonicalizer
+from Utils.keyword_automaton import KeywordAutomaton, scoring_tokens
+from Utils.url_filter import UrlFilter
+from Utils.crawl_telemetry import CrawlTelemetry
+from Utils.http_pool import HostSessionPool
+from Utils.robots_cache import RobotsCache
+from Utils.recrawl import RevisitScheduler
+from Utils.crawl_shared_state import SharedCrawlState, partition_of, partition_path
 
 
 logging.basicConfig(
@@ -30,37 +50,131 @@ logging.basicConfig(
     ]
 )
 
+
+def _ignore_interrupts():
+    # Preprocessing workers: Ctrl+C reaches the whole process group, but only the crawler handles it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
 class OfflineCrawler:
-    def __init__(self, seeds, max_depth=2, delay=0.5, simhash_threshold=3):
+    def __init__(self, seeds, max_depth=2, delay=0.5, simhash_threshold=3, max_in_flight=16, process_workers=None, max_back_queues=1000,
+                 connections_per_host=2, max_host_sessions=256, robots_ttl=24 * 3600, recrawl=False,
+                 max_page_bytes=5 * 1024 * 1024, allowed_content_types=("text/html", "application/xhtml+xml"),
+                 partition=None, shared_state_path='data/crawl_shared.db', exchange_interval=1.0,
+                 frontier_hot_window=50000, visited_capacity=1_000_000, visited_error_rate=1e-4,
+                 simhash_mode='md5', simhash_shingle_size=1, simhash_tf_weighting=True, sync_interval=1.0,
+                 url_canonicalizer=None, url_filter_patterns=(), metrics_port=9108, metrics_interval=10.0,
+                 archive_pages=True, process_queue_size=None):
         self.seeds = seeds
         self.max_depth = max_depth
         self.default_delay = delay # Store the default delay separately
         self.simhash_threshold = simhash_threshold
-
-        self.path_to_crawled_data = 'data/crawled_data.pkl'
+        # The defaults give the same fingerprints as earlier versions, so simhashes.pkl stays valid
+        self.simhasher = SimHasher(simhash_mode, shingle_size=simhash_shingle_size, tf_weighting=simhash_tf_weighting)
+
+        # URLs are fetched and stored as linked; their canonical form is the key of the visited filter
+        # and of doc_ids, so variants of a URL are fetched once
+        self.canonicalizer = url_canonicalizer or UrlCanonicalizer()
+
+        # Concurrency: requests running at once and processes preprocessing pages for the index
+        # (by default one per CPU, shared by the workers of a distributed crawl)
+        self.max_in_flight = max_in_flight
+        self.process_workers = process_workers or max(1, (os.cpu_count() or 1) // (partition[1] if partition else 1))
+        # Pages submitted for preprocessing at most; while that many are, no new fetches start
+        self.process_queue_size = process_queue_size or 2 * self.process_workers
+
+        self.path_to_document_log = 'data/crawl_log'
+        self.path_to_crawled_data = 'data/crawled_data.pkl' # Exported from the document log for the indexer
+        self.path_to_page_archive = 'data/page_archive'
         self.path_to_simhashes = 'data/simhashes.pkl'
-        self.path_to_frontier = 'data/frontier.pkl'
-        self.path_to_visited_urls_in_queue = 'data/visited_urls_in_queue.pkl'
-
-        self.crawled_data = self._load(self.path_to_crawled_data)
+        self.path_to_frontier = 'data/frontier.db'
+        self.path_to_visited_urls_in_queue = 'data/visited_urls_in_queue.bloom'
+        # Pickles of earlier versions, imported once into the stores above
+        self.path_to_frontier_pickle = 'data/frontier.pkl'
+        self.path_to_visited_pickle = 'data/visited_urls_in_queue.pkl'
+        self.path_to_robots_cache = 'data/robots_cache.pkl'
+        self.path_to_validators = 'data/page_validators.pkl'
+        self.path_to_metrics = 'data/crawl_metrics.prom'
+
+        # Distributed crawl (see Utils/distributed_crawl.py): partition = (index, number of partitions).
+        # This worker only crawls hosts of its partition and keeps its own state files.
+        self.partition = partition
+        self.shared = None
+        if partition is not None:
+            for name in ('path_to_document_log', 'path_to_crawled_data', 'path_to_page_archive', 'path_to_simhashes', 'path_to_frontier', 'path_to_visited_urls_in_queue',
+                         'path_to_frontier_pickle', 'path_to_visited_pickle', 'path_to_robots_cache', 'path_to_validators', 'path_to_metrics'):
+                setattr(self, name, partition_path(getattr(self, name), partition[0]))
+            self.shared = SharedCrawlState(shared_state_path)
+            if metrics_port is not None:
+                metrics_port += partition[0] # One endpoint per worker
+        self.exchange_interval = exchange_interval
+        self.outbox = [] # (partition, frontier item) of links to hosts of other partitions, not sent yet
+        self.links_sent = 0
+        self.links_received = 0
+
+        # Crawled documents, appended as they come in instead of re-pickling all of them per page
+        self.documents = DocumentLog(self.path_to_document_log)
+        self._import_pickled_documents()
+        # Raw HTML of the indexed pages, to rebuild the documents without crawling again (see Utils/reprocess.py)
+        self.archive = PageArchive(self.path_to_page_archive) if archive_pages else None
         self.seen_simhashes = self._load(self.path_to_simhashes)
-        self.frontier = self._load(self.path_to_frontier) 
-        self.visited_urls_in_queue = self._load(self.path_to_visited_urls_in_queue) 
+        # Hashes added since simhashes.pkl was written
+        self.simhash_journal = SnapshotJournal(self.path_to_simhashes)
+        self.seen_simhashes.update(self.simhash_journal.replay())
+        # Near-duplicate lookups probe a few tables instead of comparing with every seen hash
+        self.simhash_index = SimHashIndex(self.simhash_threshold, self.seen_simhashes)
+        # (priority, url, depth) tuples in SQLite, with the best `frontier_hot_window` queued per host in memory
+        self.frontier = DiskFrontier(self.path_to_frontier, hot_window=frontier_hot_window, max_back_queues=max_back_queues)
+        # URLs ever queued, as a Bloom filter: bounded memory, `visited_error_rate` of new URLs are taken for known ones
+        self.visited_urls_in_queue = ScalableBloomFilter(self.path_to_visited_urls_in_queue,
+                                                         initial_capacity=visited_capacity, error_rate=visited_error_rate)
+        self._import_pickled_queue()
 
         # some ways to save frontier and visited URLs during crawl
         signal.signal(signal.SIGINT, self._handle_interrupt) 
+        self.stop_requested = False # Set by Ctrl+C, the run loop then stops and saves at a safe point
         self.crawled_since_last_save = 0
         self.save_threshold = 10 # Save every 100 crawled documents
-
-        # For mapping URL to doc_id (helpful for debugging and future relevance)
-        self.url_to_doc_id = {url_info['url']: doc_id for doc_id, url_info in self.crawled_data.items() if 'url' in url_info}
-
-        # Stores RobotFileParser objects, keyed by domain (netloc)
-        self.robot_parsers = {}
-        # Stores the effective crawl delay for each domain
-        self.domain_delays = {}
+        # Frontier, documents and journals are made durable this often; snapshots are only rewritten at saves
+        self.sync_interval = sync_interval
+
+        # For mapping processed URLs to their doc_id, keyed by the 64-bit fingerprint of the canonical URL
+        self.doc_ids = {self.canonicalizer.fingerprint(url_info['url']): doc_id
+                        for doc_id, url_info in self.documents.iter_records() if 'url' in url_info}
+        if self.shared is not None:
+            # Documents of this partition crawled by earlier runs, also single-process ones
+            self.doc_ids.update((self.canonicalizer.fingerprint(url), doc_id)
+                                for url, doc_id in self.shared.doc_ids().items() if self._owns(url))
+
+        # RobotFileParser objects and effective crawl delays, keyed by domain (netloc), kept across runs
+        self.robots_cache = RobotsCache(self.path_to_robots_cache, ttl=robots_ttl)
+        # domain -> frontier items waiting for the domain's robots.txt
+        self.robots_pending = {}
+
+        # Re-crawl mode: indexed pages whose revisit time has passed are fetched again with
+        # conditional requests, and only re-indexed if they changed
+        self.recrawl = recrawl
+        self.revisits = RevisitScheduler(self.path_to_validators)
+        self.revisit_urls = set()
+
+        # Live metrics: written to path_to_metrics every `metrics_interval` seconds and served on `metrics_port`
+        self.telemetry = CrawlTelemetry(self.path_to_metrics, port=metrics_port)
+        self.metrics_interval = metrics_interval
+
+        # Downloads: accepted content types, size cap (decompressed bytes), and bytes per host
+        self.allowed_content_types = set(allowed_content_types)
+        self.max_page_bytes = max_page_bytes
+        self.host_bytes = {} # host -> {'read', 'rejected', 'rejected_pages'}
+        # future -> (stage, frontier item, domain or page) for running fetch/process jobs
+        self.in_flight = {}
+        self.fetches_in_flight = 0
+        self.processes_in_flight = 0
+        self.process_backlog = deque() # (frontier item, page) fetched while the preprocessing queue was full
+        self.fetch_pool = None
+        self.process_pool = None
         # User-Agent name
         self.user_agent = "TübingenSearchBot_UniProject/4.20 (https://alma.uni-tuebingen.de/alma/pages/startFlow.xhtml?_flowId=detailView-flow&unitId=78284&periodId=228&navigationPosition=studiesOffered,searchCourses)" 
+        # Keep-alive sessions per host, shared by page and robots.txt fetches
+        self.http = HostSessionPool(self.user_agent, connections_per_host=connections_per_host, max_hosts=max_host_sessions)
             
         #Tiered keywords for weighted priority
         self.very_relevant_keywords = {
@@ -152,9 +266,13 @@ class OfflineCrawler:
         }
         # The remaining domains will be considered "normal"
 
-        # NEW: URL Ending Blacklist (Top-level domains or file extensions)
-        self.url_ending_blacklist = {
+        # Top-level domains, matched against the host
+        self.blacklisted_tlds = {
             ".ru", ".cn", ".br", ".fr", ".es", ".it", ".jp", ".kr", ".pt", ".cz", ".pl", ".ch", # Common non-English TLDs
+        }
+
+        # NEW: URL Ending Blacklist (file extensions), matched against the path
+        self.url_ending_blacklist = {
             ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".zip", ".rar", # Document/Archive files
             ".jpg", ".jpeg", ".png", ".gif", ".svg", ".mp4", ".mov", ".avi", ".mp3", ".wav", # Media files
             ".exe", ".dmg", ".apk", ".iso", # Executables
@@ -425,13 +543,153 @@ class OfflineCrawler:
             "khon kaen", "nong khai", "mae hong son", "phitsanulok", "lampang"
         ]
 
+        # Blacklisted endings (of the path), TLDs and domains (with their subdomains), plus optional regex rules, in one filter
+        self.url_filter = UrlFilter(endings=self.url_ending_blacklist, tlds=self.blacklisted_tlds,
+                                    domains=self.blacklisted_domains, patterns=url_filter_patterns)
+
+        # Weights of the keyword tiers in link priorities
+        self.keyword_tier_weights = {"very_relevant": 70, "relevant": 30, "moderately_relevant": 15}
+        # All keyword lists in one automaton, so a page, anchor or URL is scanned once for all of them
+        self.keyword_automaton = KeywordAutomaton({
+            "very_relevant": self.very_relevant_keywords,
+            "relevant": self.relevant_keywords,
+            "moderately_relevant": self.moderately_relevant_keywords,
+            "blacklisted_city": self.blacklisted_city_keywords,
+        })
 
         # Add initial seeds to the frontier (ensures they are high priority at start/resume)
         self._add_initial_seeds(seeds)
 
     def run(self):
-        self.last_fetch_time = {}
+        self._seed_frontier()
+        if self.recrawl:
+            self._schedule_revisits()
+
+        logging.info(f"[START CRAWL] Frontier initialized with {len(self.frontier)} URLs.")
+        logging.info(f"Max depth: {self.max_depth}, Default delay: {self.default_delay}s, SimHash threshold: {self.simhash_threshold}")
+        logging.info(f"Max in-flight requests: {self.max_in_flight}, processing workers: {self.process_workers}")
+        if self.partition is not None:
+            logging.info(f"Partition {self.partition[0]} of {self.partition[1]}, shared state in {self.shared.path}")
+
+        # Track some statistics
+        self.stats = {key: 0 for key in (
+            "crawled", "skipped_robots", "skipped_duplicate_content", "skipped_non_english",
+            "skipped_already_processed", "skipped_blacklisted", "skipped_fetch_errors", "skipped_parsing_errors",
+            "revisited_unchanged", "revisited_changed", "skipped_rejected",
+        )}
+        start_time = time.time()
+
+        # Fetching (and parsing) runs on a thread pool, so slow hosts only block their own requests.
+        # Preprocessing for the index (language detection, POS tagging, lemmatization) is CPU-bound
+        # and runs on a process pool, so it scales with the cores and never holds a fetch slot. The
+        # main thread only schedules and keeps the crawl state (frontier, hashes, docs).
+        self.process_pool = ProcessPoolExecutor(max_workers=self.process_workers, initializer=_ignore_interrupts)
+        # Start the workers before this process has other threads (with fork, they start on the first job)
+        self.process_pool.submit(int).result()
+        self.telemetry.start_server()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="fetch") as fetch_pool:
+            self.fetch_pool = fetch_pool
+            next_exchange = 0
+            next_sync = time.time() + self.sync_interval
+            next_report = time.time() + self.metrics_interval
+
+            while not self.stop_requested:
+                if time.time() >= next_sync:
+                    self._sync_state()
+                    next_sync = time.time() + self.sync_interval
+                if time.time() >= next_report:
+                    self._report_metrics()
+                    next_report = time.time() + self.metrics_interval
+                if self.shared is not None and time.time() >= next_exchange:
+                    self._exchange_links()
+                    next_exchange = time.time() + self.exchange_interval
+                self._dispatch_fetches()
+
+                # Wake up when a job finishes or when a parked host becomes ready
+                timeout = self.frontier.seconds_until_ready()
+                if self.fetches_in_flight >= self.max_in_flight or self.process_backlog:
+                    timeout = None  # no free fetch slot, or fetching waits for preprocessing anyway
+                if self.shared is not None:
+                    # Other partitions can send links at any time
+                    timeout = self.exchange_interval if timeout is None else min(timeout, self.exchange_interval)
+                if not self.in_flight:
+                    if self.frontier.seconds_until_ready() is None:
+                        if self.shared is None or self._partition_finished():
+                            break  # frontier and running jobs are both exhausted
+                        next_exchange = 0 # Other workers are still busy: check for their links after the pause
+                    time.sleep(timeout)
+                    continue
+
+                done, _ = wait(self.in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._handle_completed(future)
 
+            if self.stop_requested:
+                # Don't start queued jobs, only wait for the requests already running. URLs of
+                # unfinished jobs (fetches and preprocessing) stay in the frontier and are crawled
+                # when the crawl resumes.
+                for pool in (fetch_pool, self.process_pool):
+                    pool.shutdown(wait=False, cancel_futures=True)
+        self.process_pool.shutdown()
+
+        elapsed = time.time() - start_time
+        logging.info(f"\n[CRAWL COMPLETE] Finished crawling.")
+        logging.info(f"Total pages crawled and indexed: {self.stats['crawled']} in {elapsed:.1f}s ({self.stats['crawled'] / max(elapsed, 1e-9):.2f} pages/s)")
+        logging.info(f"Skipped by robots.txt: {self.stats['skipped_robots']}")
+        logging.info(f"Skipped as content duplicates (SimHash): {self.stats['skipped_duplicate_content']}")
+        logging.info(f"Skipped as non-English or no text: {self.stats['skipped_non_english']}")
+        logging.info(f"Skipped (already processed in previous run): {self.stats['skipped_already_processed']}")
+        logging.info(f"Skipped (blacklisted domain/ending): {self.stats['skipped_blacklisted']}")
+        if self.url_filter.counts:
+            logging.info("URLs rejected per blacklist rule (also links never queued): " + ", ".join(
+                f"{rule} {count}" for rule, count in self.url_filter.counts.most_common(10)))
+        logging.info(f"Skipped due to fetch/request errors: {self.stats['skipped_fetch_errors']}") # NEW stat
+        logging.info(f"Skipped due to HTML parsing errors: {self.stats['skipped_parsing_errors']}") # NEW stat
+        logging.info(f"Skipped by content type or size: {self.stats['skipped_rejected']}")
+        total_read = sum(entry['read'] for entry in self.host_bytes.values())
+        total_rejected = sum(entry['rejected'] for entry in self.host_bytes.values())
+        logging.info(f"Bytes read: {total_read / 1e6:.1f} MB, of which {total_rejected / 1e6:.1f} MB from rejected pages")
+        for host, entry in sorted(self.host_bytes.items(), key=lambda kv: kv[1]['read'], reverse=True)[:10]:
+            logging.info(f"  {host}: {entry['read'] / 1e6:.2f} MB read, {entry['rejected'] / 1e6:.2f} MB rejected ({entry['rejected_pages']} pages)")
+        if self.recrawl:
+            logging.info(f"Revisited pages unchanged / changed and re-indexed: {self.stats['revisited_unchanged']} / {self.stats['revisited_changed']}")
+        if self.partition is not None:
+            logging.info(f"Links sent to / received from other partitions: {self.links_sent} / {self.links_received}")
+        logging.info(f"Remaining URLs in frontier (not crawled): {len(self.frontier)}")
+        logging.info(f"Visited URL filter: {len(self.visited_urls_in_queue)} URLs in {self.visited_urls_in_queue.memory_bytes() / 1e6:.1f} MB")
+        http_stats = self.http.stats()
+        logging.info(f"HTTP: {http_stats['requests']} requests over {http_stats['connections_opened']} connections "
+                     f"(reuse rate {http_stats['connection_reuse_rate']:.1%}), "
+                     f"{http_stats['bytes_received'] / 1e6:.1f} MB received, {http_stats['bytes_decoded'] / 1e6:.1f} MB decoded")
+        self.http.close()
+        self._report_metrics()
+        self.telemetry.close()
+
+        # URLs still waiting for robots.txt go back to the frontier, links for other partitions to their owners
+        for items in self.robots_pending.values():
+            for item in items:
+                self.frontier.push(item)
+        self.robots_pending = {}
+        if self.shared is not None:
+            self.shared.send(self.outbox) # The owners crawl these links when the crawl resumes
+            self.outbox = []
+            self.shared.close()
+
+        # Explicitly save all state on completion (or interruption), with fresh snapshots
+        self._checkpoint(final=True)
+        self.frontier.close()
+        self.visited_urls_in_queue.close()
+        self.documents.close()
+        if self.archive is not None:
+            self.archive.close()
+        self.simhash_journal.close()
+        self.robots_cache.close()
+        self.revisits.close()
+        logging.info("Frontier, visited URLs, crawled data, simhashes, robots.txt rules and page validators saved "
+                     + ("after interruption." if self.stop_requested else "on completion."))
+
+
+    def _seed_frontier(self):
         seeds_already_known = 0
         seeds_added_count = 0
 
@@ -439,10 +697,10 @@ class OfflineCrawler:
         # This loop only runs once at the beginning of the crawl
         for url in self.seeds:
             # MODIFIED: Normalize URL before checks for consistency
-            normalized_url, _ = urldefrag(urljoin(url, url))
-            
             # --- NEW/MODIFIED: Robust URL parsing for seeds ---
             try:
+                normalized_url, _ = urldefrag(urljoin(url, url))
+                self.canonicalizer.canonicalize(normalized_url) # Rejects malformed URLs (e.g. an invalid port)
                 parsed_url = urlparse(normalized_url)
             except Exception as e:
                 logging.warning(f"[SEED_SKIP] Error parsing seed URL '{url}': {e}. Skipping.")
@@ -455,381 +713,733 @@ class OfflineCrawler:
                 seeds_already_known += 1
                 continue
 
+            if not self._owns(normalized_url):
+                continue # Seeded by the worker owning its host
+
             # Check if already processed (crawled and indexed)
-            if normalized_url in self.url_to_doc_id:
-                logging.info(f"[SEED_SKIP] Seed '{normalized_url}' already processed (Doc ID: {self.url_to_doc_id[normalized_url]}).")
+            doc_id = self._doc_id(normalized_url)
+            if doc_id is not None:
+                logging.info(f"[SEED_SKIP] Seed '{normalized_url}' already processed (Doc ID: {doc_id}).")
                 seeds_already_known += 1
                 continue
 
             # Check if already in frontier or visited_urls_in_queue
-            if normalized_url in self.visited_urls_in_queue:
+            if self._visited_key(normalized_url) in self.visited_urls_in_queue:
                 logging.info(f"[SEED_SKIP] Seed '{normalized_url}' already in frontier or visited. Skipping.")
                 seeds_already_known += 1
                 continue
 
             # NEW: Check for blacklisted domains or URL endings for seeds
-            if parsed_url.netloc in self.blacklisted_domains or self._is_blacklisted_ending(normalized_url):
-                logging.warning(f"[SEED_SKIP] Seed '{normalized_url}' domain/ending blacklisted. Skipping.")
+            rule = self.url_filter.match(normalized_url)
+            if rule is not None:
+                logging.warning(f"[SEED_SKIP] Seed '{normalized_url}' blacklisted ({rule}). Skipping.")
                 seeds_already_known += 1
                 continue
 
             # Check robots.txt for the seed URL before adding
             rp = self._get_robot_parser(normalized_url)
             if rp.can_fetch(self.user_agent, normalized_url):
-                priority = self._calculate_priority(normalized_url, "", [], 0)
-                heapq.heappush(self.frontier, (priority, normalized_url, 0))
-                self.visited_urls_in_queue.add(normalized_url) # Add to visited_urls_in_queue when pushed to frontier
+                priority = self._calculate_priority(normalized_url, "", 0, 0)
+                self.frontier.push((priority, normalized_url, 0))
+                self.visited_urls_in_queue.add(self._visited_key(normalized_url)) # Add to visited_urls_in_queue when pushed to frontier
                 logging.info(f"[SEED_ADD] Added new seed to frontier: '{normalized_url}'.")
                 seeds_added_count += 1
             else:
                 logging.info(f"[SEED_SKIP] Seed '{normalized_url}' disallowed by robots.txt.")
                 seeds_already_known += 1
 
-        logging.info(f"[START CRAWL] Frontier initialized with {len(self.frontier)} URLs.")
-        logging.info(f"Max depth: {self.max_depth}, Default delay: {self.default_delay}s, SimHash threshold: {self.simhash_threshold}")
 
-        # Track some statistics
-        crawled_count = 0
-        skipped_robots = 0
-        skipped_duplicate_content = 0
-        skipped_non_english = 0
-        skipped_already_processed = 0
-        skipped_blacklisted = 0
-        skipped_fetch_errors = 0 
-        skipped_parsing_errors = 0 
-
-        while self.frontier:
-            priority, url, depth = heapq.heappop(self.frontier)
-
-            # --- Initial URL validation and Filtering (Most Efficient) ---
-            # NEW/MODIFIED: Robust URL parsing for URLs from frontier
-            try:
-                parsed_url = urlparse(url)
-                if not parsed_url.scheme or not parsed_url.netloc:
-                    logging.warning(f"[MALFORMED_URL] Skipping malformed URL from frontier: '{url}'.")
-                    skipped_fetch_errors += 1 # Count as a fetch error (can't even form a request)
-                    continue
-                domain = parsed_url.netloc
-            except Exception as e:
-                logging.error(f"[URL_PARSE_ERROR] Failed to parse URL '{url}': {e}. Skipping.")
-                skipped_fetch_errors += 1
-                continue
+    def _schedule_revisits(self):
+        """
+        Queue the indexed pages that are due for a revisit, most overdue first.
+        """
+        REVISIT_BASE_SCORE = 100 # Comparable to the score of a relevant new link
 
-            if self._is_blacklisted_ending(url):
-                logging.info(f"[BLACKLIST_ENDING] Skipping {url} due to blacklisted URL ending.")
-                skipped_blacklisted += 1
-                continue
+        due = self.revisits.due(self._indexed_urls())
+        for overdue, url, depth in due:
+            priority = -REVISIT_BASE_SCORE * (1 + min(overdue, 10))
+            self.frontier.push((priority, url, self.max_depth if depth is None else depth))
+            self.revisit_urls.add(url)
+        logging.info(f"[RECRAWL] {len(due)} of {len(self.doc_ids)} indexed pages are due for a revisit.")
 
-            if domain in self.blacklisted_domains:
-                logging.info(f"[BLACKLIST_DOMAIN] Skipping {url} due to blacklisted domain: {domain}.")
-                skipped_blacklisted += 1
+
+    def _dispatch_fetches(self):
+        """
+        Start fetches until `max_in_flight` requests are running or no host is ready. Nothing is
+        started while fetched pages wait for a preprocessing slot (backpressure), so the pages
+        held in memory stay bounded when fetching is faster than preprocessing.
+        """
+        while self.fetches_in_flight < self.max_in_flight and not self.process_backlog:
+            ready = self.frontier.pop_ready()
+            if ready is None:
+                return
+
+            domain, item = ready
+            priority, url, depth = item
+            if self._admit(item) is None:
+                pending = self.robots_pending.get(domain)
+                if not pending or pending[-1] is not item:
+                    self.frontier.done(url) # Filtered out, not parked until robots.txt arrives
                 continue
-            # --- END Initial Filtering ---
+            cached_robots = self.robots_cache.get(domain)
+            self.frontier.acquire(domain, cached_robots[1] if cached_robots else self.default_delay)
+            logging.info(f"\n[CRAWL] Fetching: {url} (Depth: {depth}, Priority: {-priority:.2f})")
 
+            validators = self.revisits.validators(url) if url in self.revisit_urls else None
+            future = self.fetch_pool.submit(self._fetch_and_parse, url, depth, validators)
+            self.in_flight[future] = ("fetch", item, domain)
+            self.fetches_in_flight += 1
 
-            # Check if this URL has been *processed* before (based on doc_id)
-            if url in self.url_to_doc_id:
-                logging.info(f"[ALREADY_PROCESSED] Skipping {url} (already processed and indexed in a previous run).")
-                skipped_already_processed += 1
-                continue
 
-            if depth > self.max_depth:
-                logging.info(f"Skipping {url} (max depth {self.max_depth} reached).")
-                continue
+    def _admit(self, item):
+        """
+        Filters applied to a URL popped from the frontier before it is fetched.
+        Returns its domain, or None if the URL is skipped.
+        """
+        priority, url, depth = item
 
-            rp = self._get_robot_parser(url)
-            if not rp.can_fetch(self.user_agent, url):
-                logging.info(f"[ROBOTS] Skipping {url} due to robots.txt rules for {domain}.")
-                skipped_robots += 1
-                continue
+        # --- Initial URL validation and Filtering (Most Efficient) ---
+        # NEW/MODIFIED: Robust URL parsing for URLs from frontier
+        try:
+            parsed_url = urlparse(url)
+            if not parsed_url.scheme or not parsed_url.netloc:
+                logging.warning(f"[MALFORMED_URL] Skipping malformed URL from frontier: '{url}'.")
+                self._count("skipped_fetch_errors") # Count as a fetch error (can't even form a request)
+                return None
+            domain = parsed_url.netloc
+        except Exception as e:
+            logging.error(f"[URL_PARSE_ERROR] Failed to parse URL '{url}': {e}. Skipping.")
+            self._count("skipped_fetch_errors")
+            return None
+
+        # Links were filtered when extracted; this catches URLs queued before the rules changed
+        rule = self.url_filter.match(url)
+        if rule is not None:
+            logging.info(f"[BLACKLIST] Skipping {url} due to blacklist rule {rule}.")
+            self._count("skipped_blacklisted")
+            return None
+        # --- END Initial Filtering ---
+
+        # Check if this URL has been *processed* before (based on doc_id), unless it is revisited
+        if self._doc_id(url) is not None and url not in self.revisit_urls:
+            logging.info(f"[ALREADY_PROCESSED] Skipping {url} (already processed and indexed in a previous run).")
+            self._count("skipped_already_processed")
+            return None
+
+        if depth > self.max_depth:
+            logging.info(f"Skipping {url} (max depth {self.max_depth} reached).")
+            return None
+
+        allowed = self._robots_allows(item)
+        if allowed is None:
+            return None # Parked until the domain's robots.txt arrives
+        if not allowed:
+            logging.info(f"[ROBOTS] Skipping {url} due to robots.txt rules for {domain}.")
+            self._count("skipped_robots")
+            return None
+
+        return domain
+
+
+    def _fetch_and_parse(self, url, depth, validators=None):
+        """
+        Runs on a fetch thread: download and parse one page, compute its SimHash and
+        extract its outgoing links. Only reads crawler state, never modifies it.
 
-            required_delay = self.domain_delays.get(domain, self.default_delay)
+        For a revisit, `validators` of the indexed version make the request conditional, and
+        the page is reported unchanged (without extracting anything) if its text is the same.
+
+        Returns:
+            dict -> page with 'status' ('ok', 'fetch_error', 'parse_error', 'no_text',
+                    'not_modified' or 'unchanged')
+        """
+        page = {'url': url, 'depth': depth, 'status': 'ok', 'start_time': time.time()}
+        html = None # Initialize html to None for clear scope
+
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        # --- NEW/MODIFIED: REQUESTS ERROR CATCHING & ENCODING HANDLING ---
+        fetch_start = time.perf_counter()
+        try:
+            # Using stream=True for potentially problematic responses, and explicit decode
+            # to handle encoding errors gracefully instead of crashing.
+            with self.http.get(url, headers=headers, timeout=15, stream=True) as resp: # Increased timeout slightly
+                resp.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+                response_status, response_headers = resp.status_code, resp.headers
+                page['etag'] = resp.headers.get('ETag')
+                page['last_modified'] = resp.headers.get('Last-Modified')
+                if resp.status_code == 304:
+                    logging.info(f"[RECRAWL] {url} not modified (304).")
+                    page['status'] = 'not_modified'
+                    return page
+
+                # Reject non-HTML and oversized responses from their headers, before reading the body
+                mime_type = resp.headers.get('Content-Type', '').split(';')[0].strip().lower()
+                if mime_type and mime_type not in self.allowed_content_types:
+                    logging.info(f"[REJECTED] Skipping {url} (content type '{mime_type}').")
+                    page['status'] = 'rejected'
+                    return page
+                content_length = resp.headers.get('Content-Length', '')
+                if content_length.isdigit() and int(content_length) > self.max_page_bytes:
+                    logging.info(f"[REJECTED] Skipping {url} (Content-Length {content_length} exceeds {self.max_page_bytes} bytes).")
+                    page['status'] = 'rejected'
+                    return page
+
+                html = self._read_html(resp, page)
+                page['fetch_seconds'] = time.perf_counter() - fetch_start
+                self.http.record_transfer(resp, page['bytes_read'])
+                if html is None:
+                    logging.info(f"[REJECTED] Skipping {url} (body exceeds {self.max_page_bytes} bytes).")
+                    page['status'] = 'rejected'
+                    return page
+
+        except requests.exceptions.RequestException as e:
+            # Catches ConnectionError, Timeout, HTTPError (4xx, 5xx), TooManyRedirects, etc.
+            logging.error(f"[FETCH_ERROR] Error fetching {url}: {e}. Skipping this URL.")
+            page['status'] = 'fetch_error'
+            page['fetch_seconds'] = time.perf_counter() - fetch_start
+            return page
+
+        # Check if HTML content was actually obtained after decoding attempts
+        if not html:
+            logging.error(f"[FETCH_ERROR] No HTML content obtained for {url} after decoding attempts. Skipping.")
+            page['status'] = 'fetch_error'
+            return page
+
+        # --- NEW/MODIFIED: PARSING ERROR CATCHING ---
+        # Text, boilerplate-free text, links, title and description come out of one pass over the HTML
+        parse_start = time.perf_counter()
+        try:
+            extracted = extract_page(html)
+            page['parse_seconds'] = time.perf_counter() - parse_start
+            # A very basic sanity check: if no <body> tag is found, it might be truly malformed.
+            if not extracted['has_body']:
+                logging.warning(f"[PARSING_WARN] Page {url} appears to have no body content after parsing. Skipping.")
+                page['status'] = 'parse_error'
+                return page
+        except Exception as e:
+            logging.error(f"[PARSING_ERROR] Error parsing HTML for {url}: {e}. Skipping this URL.")
+            page['status'] = 'parse_error'
+            return page
 
-            if domain in self.last_fetch_time:
-                time_since_last_fetch = time.time() - self.last_fetch_time[domain]
-                if time_since_last_fetch < required_delay:
-                    sleep_duration = required_delay - time_since_last_fetch
-                    logging.info(f"[DELAY] Sleeping for {sleep_duration:.2f}s for {domain} to respect crawl-delay.")
-                    time.sleep(sleep_duration)
+        # Lowercase and remove excessive whitespace for SimHash
+        cleaned_text_for_simhash = re.sub(r'\s+', ' ', extracted['content_text'].lower()).strip()
+        if not cleaned_text_for_simhash:
+            # If no text is extracted for simhash, treat as potential duplicate or non-content page
+            logging.info(f"[SIMHASH_WARN] No significant text for simhash from {url}. Skipping to avoid processing empty content.")
+            page['status'] = 'no_text'
+            return page
+
+        page['content_hash'] = hashlib.md5(cleaned_text_for_simhash.encode('utf-8')).hexdigest()
+        if validators and page['content_hash'] == validators.get('content_hash'):
+            logging.info(f"[RECRAWL] {url} unchanged (same content hash).")
+            page['status'] = 'unchanged'
+            return page
+
+        if self.archive is not None:
+            # Compressed here, on the fetch thread; appended once the page passed the duplicate check
+            page['archive_record'] = encode_response(url, html, response_headers, response_status, page['start_time'])
+        page['text'] = extracted['content_text'] # Boilerplate stays out of the index, as for SimHash
+        page['title'] = extracted['title']
+        page['description'] = extracted['description']
+        simhash_start = time.perf_counter()
+        page['simhash'] = self._compute_simhash(cleaned_text_for_simhash)
+        page['simhash_seconds'] = time.perf_counter() - simhash_start
+        page['links'] = []
+
+        # --- Link Extraction (links are only queued once the page is indexed) ---
+        if depth < self.max_depth:
+            # Same for all links of the page, so scored once (with less weight than the link's own signals)
+            page['source_score'] = self._keyword_score(self._clean_for_scoring(cleaned_text_for_simhash),
+                                                       scale=1 / 3, city_penalty=25)
+
+            for raw_href, anchor_text in extracted['links']:
+                # --- NEW/MODIFIED: Robust parsing of extracted href ---
+                try:
+                    href, _ = urldefrag(urljoin(url, raw_href))
+                    self.canonicalizer.canonicalize(href) # Rejects malformed URLs (e.g. an invalid port)
+                    p = urlparse(href)
+                except Exception as e:
+                    logging.warning(f"[LINK_PARSE_ERROR] Skipping malformed extracted link '{raw_href}' from '{url}': {e}.")
+                    continue
 
-            self.last_fetch_time[domain] = time.time()
+                if p.scheme in ("http", "https"):
+                    # --- NEW: Immediate Filtering for new links ---
+                    if self.url_filter.match(href) is not None:
+                        continue # Skip adding this link
+                    # --- END Immediate Filtering ---
+                    page['links'].append((href, anchor_text))
 
-            start_page_time = time.time()
+        return page
 
-            logging.info(f"\n[CRAWL] Fetching: {url} (Depth: {depth}, Priority: {-priority:.2f})")
-            html = None # Initialize html to None for clear scope
 
-            # --- NEW/MODIFIED: REQUESTS ERROR CATCHING & ENCODING HANDLING ---
+    def _read_html(self, resp, page):
+        """
+        Read the body in chunks and decode it while it arrives. Stops as soon as the body
+        exceeds `max_page_bytes` (returns None), so large files are never downloaded in full.
+        """
+        body = bytearray()
+        parts = []
+        decoder = None
+        page['bytes_read'] = 0
+
+        def decode(data, final=False):
+            nonlocal decoder, parts
             try:
-                headers = {'User-Agent': self.user_agent}
-                # Using stream=True for potentially problematic responses, and explicit decode
-                # to handle encoding errors gracefully instead of crashing.
-                with requests.get(url, headers=headers, timeout=15, stream=True) as resp: # Increased timeout slightly
-                    resp.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-                    # Attempt to read content with resp.encoding, fall back to utf-8, then iso-8859-1
-                    # This is the most robust way to handle diverse encodings.
-                    try:
-                        html = resp.content.decode(resp.encoding if resp.encoding else 'utf-8')
-                    except UnicodeDecodeError:
-                        logging.warning(f"[ENCODING_ERROR] UnicodeDecodeError for {url} with detected encoding '{resp.encoding}'. Trying utf-8 then iso-8859-1.")
-                        try:
-                            html = resp.content.decode('utf-8', errors='replace') # Replace invalid chars
-                        except UnicodeDecodeError:
-                            logging.warning(f"[ENCODING_ERROR] Failed to decode {url} with utf-8. Trying iso-8859-1.")
-                            html = resp.content.decode('iso-8859-1', errors='replace') # Last resort
-                            
-            except requests.exceptions.RequestException as e:
-                # Catches ConnectionError, Timeout, HTTPError (4xx, 5xx), TooManyRedirects, etc.
-                logging.error(f"[FETCH_ERROR] Error fetching {url}: {e}. Skipping this URL.")
-                skipped_fetch_errors += 1
-                continue # Skip to the next URL in the frontier
-
-            # Check if HTML content was actually obtained after decoding attempts
-            if not html:
-                logging.error(f"[FETCH_ERROR] No HTML content obtained for {url} after decoding attempts. Skipping.")
-                skipped_fetch_errors += 1
+                parts.append(decoder.decode(data, final))
+            except UnicodeDecodeError:
+                # No declared charset and not UTF-8: assume Windows-1252 and decode again from the start
+                decoder = codecs.getincrementaldecoder('windows-1252')(errors='replace')
+                parts = [decoder.decode(bytes(body), final)]
+
+        for chunk in resp.iter_content(chunk_size=64 * 1024):
+            body.extend(chunk)
+            page['bytes_read'] = len(body)
+            if len(body) > self.max_page_bytes:
+                return None
+            if decoder is not None:
+                decode(chunk)
+            elif len(body) >= 1024: # The charset is sniffed from the start of the document
+                decoder = self._make_decoder(resp, body)
+                decode(bytes(body))
+
+        if decoder is None:
+            decoder = self._make_decoder(resp, body)
+            decode(bytes(body), final=True)
+        else:
+            decode(b'', final=True)
+        return ''.join(parts)
+
+
+    @staticmethod
+    def _make_decoder(resp, head):
+        """
+        Incremental decoder for the page's charset: byte order mark, then the charset of the
+        Content-Type header, then a <meta> charset in the first 1024 bytes. Undeclared pages
+        are decoded as strict UTF-8 (see _read_html for the fallback).
+        """
+        head = bytes(head[:1024])
+        candidates = []
+        for bom, encoding in ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16')):
+            if head.startswith(bom):
+                candidates.append(encoding)
+        header_charset = re.search(r'charset=["\']?([\w.:-]+)', resp.headers.get('Content-Type', ''), re.I)
+        if header_charset:
+            candidates.append(header_charset.group(1))
+        meta_charset = re.search(rb'<meta[^>]+charset=["\']?([\w.:-]+)', head, re.I)
+        if meta_charset:
+            candidates.append(meta_charset.group(1).decode('ascii'))
+
+        for encoding in candidates:
+            try:
+                return codecs.getincrementaldecoder(encoding)(errors='replace')
+            except LookupError:
                 continue
+        return codecs.getincrementaldecoder('utf-8')(errors='strict')
+
 
-            # --- NEW/MODIFIED: BEAUTIFULSOUP PARSING ERROR CATCHING ---
-            soup = None
+    def _handle_completed(self, future):
+        stage, item, payload = self.in_flight.pop(future)
+
+        if stage == "robots":
+            self.fetches_in_flight -= 1
+            rp, crawl_delay = future.result() # _fetch_robots handles its own errors
+            self._handle_robots(payload, rp, crawl_delay)
+            return
+
+        # A URL leaves the frontier once its page is handled completely. Pages still waiting for
+        # or in preprocessing when the crawler stops are fetched again when it resumes.
+        if stage == "fetch":
+            self.fetches_in_flight -= 1
+            self.frontier.release(payload)
+        else:
+            self.processes_in_flight -= 1
+            self.frontier.done(item[1])
+            self._record_simhash(payload['simhash'])
+            self._submit_processing()
+
+        try:
+            result = future.result()
+        except Exception as e:
+            logging.error(f"[WORKER_ERROR] Unexpected error while processing {item[1]} ({stage}): {e}. Skipping this URL.")
+            self._count("skipped_fetch_errors" if stage == "fetch" else "skipped_parsing_errors")
+            if stage == "fetch":
+                self.frontier.done(item[1])
+            return
+
+        if stage == "fetch":
+            if not self._handle_fetched(item, result):
+                self.frontier.done(item[1])
+        else:
+            self._handle_processed(item, payload, result)
+
+
+    def _handle_fetched(self, item, page):
+        """
+        Returns True if the page was queued for preprocessing, None if it is skipped.
+        """
+        url = page['url']
+        host = self.frontier.host_of(url)
+        if 'fetch_seconds' in page:
+            self.telemetry.fetched(host, page['fetch_seconds'], page.get('bytes_read', 0), page['status'])
+        for stage in ('fetch', 'parse', 'simhash'):
+            if f'{stage}_seconds' in page:
+                self.telemetry.stage(stage, page[f'{stage}_seconds'])
+        host_bytes = self.host_bytes.setdefault(host, {'read': 0, 'rejected': 0, 'rejected_pages': 0})
+        host_bytes['read'] += page.get('bytes_read', 0)
+        if page['status'] == 'rejected':
+            host_bytes['rejected'] += page.get('bytes_read', 0)
+            host_bytes['rejected_pages'] += 1
+            self._count("skipped_rejected")
+            return
+        if page['status'] == 'fetch_error':
+            self._count("skipped_fetch_errors")
+            return
+        if page['status'] == 'parse_error':
+            self._count("skipped_parsing_errors")
+            return
+        if page['status'] == 'no_text':
+            self._count("skipped_duplicate_content") # Count as a type of content skip
+            return
+        if page['status'] in ('not_modified', 'unchanged'):
+            self.revisits.record(url, changed=False, etag=page['etag'], last_modified=page['last_modified'])
+            self.revisit_urls.discard(url)
+            self._count("revisited_unchanged")
+            return
+
+        current_page_simhash = page['simhash']
+        # A changed revisit is close to its own previous version, which is not a duplicate
+        if url not in self.revisit_urls:
+            if self.simhash_index.find(current_page_simhash) is not None:
+                logging.info(f"[SIMHASH] Skipping {url} (content duplicate with existing hash).")
+                self._count("skipped_duplicate_content")
+                return
+
+        # Near-duplicates fetched meanwhile are caught in memory; the hash is saved (and shared) once
+        # the page is preprocessed, so a page refetched after a stop is not a duplicate of itself
+        self.simhash_index.add(current_page_simhash)
+
+        if self.archive is not None:
+            self.archive.append(url, page.pop('archive_record')) # Also kept if the language filter skips it now
+        # Preprocess text for indexing, or wait for a slot in the preprocessing queue
+        self.process_backlog.append((item, page))
+        self._submit_processing()
+        return True
+
+
+    def _submit_processing(self):
+        """
+        Submit waiting pages to the process pool until `process_queue_size` are submitted.
+        """
+        while self.process_backlog and self.processes_in_flight < self.process_queue_size:
+            item, page = self.process_backlog[0]
             try:
-                soup = BeautifulSoup(html, "html.parser")
-                # A very basic sanity check: if no <body> tag is found, it might be truly malformed.
-                if not soup.body:
-                    logging.warning(f"[PARSING_WARN] Page {url} appears to have no body content after parsing. Skipping.")
-                    skipped_parsing_errors += 1
-                    continue
+                future = self.process_pool.submit(preprocess_text, page['text'])
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); its jobs failed, the waiting pages get new workers
+                logging.error("[PROCESS_ERROR] The preprocessing process pool is broken, starting a new one.")
+                self.process_pool.shutdown(wait=False)
+                self.process_pool = ProcessPoolExecutor(max_workers=self.process_workers, initializer=_ignore_interrupts)
+                continue
+            self.process_backlog.popleft()
+            del page['text']
+            page['process_start'] = time.perf_counter()
+            self.in_flight[future] = ("process", item, page)
+            self.processes_in_flight += 1
+
+
+    def _handle_processed(self, item, page, tokens_for_indexing):
+        url, depth = page['url'], page['depth']
+        self.telemetry.stage('preprocess', time.perf_counter() - page['process_start']) # including the wait in the pool's queue
+        is_revisit = url in self.revisit_urls
+        self.revisit_urls.discard(url)
+        if not tokens_for_indexing:
+            logging.info(f"[LANG] Skipping {url} (non-English or no extractable text after preprocessing).")
+            self._count("skipped_non_english")
+            return
+
+        save_start = time.perf_counter()
+        doc_id = self._get_id(url) # A revisit keeps its doc ID and replaces the old version
+        self.documents.append(doc_id, {'url': url, 'tokens': tokens_for_indexing,
+                                    'title': page['title'], 'description': page['description']})
+        self.doc_ids[self.canonicalizer.fingerprint(url)] = doc_id
+        self.revisits.record(url, changed=True, depth=depth, etag=page['etag'],
+                             last_modified=page['last_modified'], content_hash=page['content_hash'])
+        self._count("revisited_changed" if is_revisit else "crawled")
+
+        # NEW: Incremented counter for periodic saving
+        self.crawled_since_last_save += 1
+
+        # NEW: Periodic Saving Check - Place this after a page is successfully crawled and all its state is updated
+        if self.crawled_since_last_save >= self.save_threshold:
+            logging.info(f"[PERIODIC_SAVE] Performing periodic save after {self.crawled_since_last_save} successful crawls.")
+            try:
+                self._checkpoint()
             except Exception as e:
-                # This will catch bs4.exceptions.ParserRejectedMarkup and other parsing errors
-                logging.error(f"[PARSING_ERROR] Error parsing HTML for {url}: {e}. Skipping this URL.")
-                skipped_parsing_errors += 1
-                continue # Skip to the next URL in the frontier
+                logging.error(f"[PERIODIC_SAVE_ERROR] Failed during periodic save: {e}")
+            finally:
+                self.crawled_since_last_save = 0 # Reset counter after attempting to save
+        self.telemetry.stage('save', time.perf_counter() - save_start)
+
+        processing_time = time.time() - page['start_time']
+        logging.info(f"[SUCCESS] Processed {url} (Doc ID: {doc_id}) in {processing_time:.2f} seconds.")
+
+        # --- Frontier Management ---
+        if depth < self.max_depth:
+            links_added_from_page = 0
+            links_waiting_for_robots = 0
+            links_sent_from_page = 0
+            for href, anchor_text in page['links']:
+                # NEW: Check if already processed (crawled and indexed) or already in frontier
+                if self._doc_id(href) is not None or self._visited_key(href) in self.visited_urls_in_queue:
+                    continue
 
+                new_priority = self._calculate_priority(
+                    href,
+                    anchor_text,
+                    page['source_score'],
+                    depth + 1
+                )
+
+                new_item = (new_priority, href, depth + 1)
+                if not self._owns(href):
+                    # The owner checks robots.txt and whether it knows the URL already
+                    self.outbox.append((partition_of(href, self.partition[1]), new_item))
+                    self.visited_urls_in_queue.add(self._visited_key(href))
+                    links_sent_from_page += 1
+                    continue
+                allowed = self._robots_allows(new_item)
+                if allowed:
+                    self.frontier.push(new_item)
+                    links_added_from_page += 1
+                elif allowed is None:
+                    links_waiting_for_robots += 1 # Pushed once the robots.txt of its domain arrives
+                else:
+                    continue
+                self.visited_urls_in_queue.add(self._visited_key(href))
 
-            # --- SIMHASH AND CONTENT PROCESSING (unchanged core logic, but now protected by try-excepts above) ---
-            cleaned_text_for_simhash = self._get_cleaned_text_for_simhash(soup)
-            if cleaned_text_for_simhash:
-                current_page_simhash = self._compute_simhash(cleaned_text_for_simhash)
-            else:
-                # If no text is extracted for simhash, treat as potential duplicate or non-content page
-                logging.info(f"[SIMHASH_WARN] No significant text for simhash from {url}. Skipping to avoid processing empty content.")
-                skipped_duplicate_content += 1 # Count as a type of content skip
-                continue
+            # Commit the new links with the visited filter that now contains them
+            self.frontier.save()
+            logging.info(f"[LINKS] Added {links_added_from_page} new links to frontier, {links_waiting_for_robots} waiting for robots.txt, "
+                         f"{links_sent_from_page} sent to other partitions. Frontier size: {len(self.frontier)} ({self.frontier.num_hosts()} hosts queued).")
+        else:
+            logging.info(f"[LINKS] Max depth reached, no new links added from {url}.")
 
-            is_content_duplicate = False
-            for existing_simhash in self.seen_simhashes:
-                if self._hamming_distance(current_page_simhash, existing_simhash) <= self.simhash_threshold:
-                    logging.info(f"[SIMHASH] Skipping {url} (content duplicate with existing hash).")
-                    is_content_duplicate = True
-                    skipped_duplicate_content += 1
-                    break
 
-            if is_content_duplicate:
-                continue
+    def _import_pickled_queue(self):
+        """
+        Move the pickled frontier and visited set of earlier versions into the new stores,
+        the first time they are created.
+        """
+        if self.frontier.created and os.path.exists(self.path_to_frontier_pickle):
+            for item in self._load(self.path_to_frontier_pickle):
+                self.frontier.push(item)
+            self.frontier.save()
+            logging.info(f"Imported {len(self.frontier)} frontier URLs from {self.path_to_frontier_pickle}")
+        if self.visited_urls_in_queue.created and os.path.exists(self.path_to_visited_pickle):
+            self.visited_urls_in_queue.update(self._load(self.path_to_visited_pickle))
+            self.visited_urls_in_queue.save()
+            logging.info(f"Imported {len(self.visited_urls_in_queue)} visited URLs from {self.path_to_visited_pickle}")
+
+
+    def _import_pickled_documents(self):
+        """
+        Append the documents of crawled_data.pkl to the document log when the log is created,
+        so crawls of earlier versions keep their documents and IDs.
+        """
+        if self.documents.created and os.path.exists(self.path_to_crawled_data):
+            for doc_id, doc_info in sorted(self._load(self.path_to_crawled_data).items()):
+                self.documents.append(doc_id, doc_info)
+            self.documents.commit()
+            logging.info(f"Imported {len(self.documents)} documents from {self.path_to_crawled_data}")
 
-            self.seen_simhashes.add(current_page_simhash)
-            self._save(self.path_to_simhashes, self.seen_simhashes)
 
-            # Preprocess text for indexing
-            tokens_for_indexing = preprocess_text(soup) # Assuming preprocess_text is robust
-            if not tokens_for_indexing:
-                logging.info(f"[LANG] Skipping {url} (non-English or no extractable text after preprocessing).")
-                skipped_non_english += 1
-                continue
+    def _owns(self, url):
+        """
+        Whether the URL's host belongs to this worker (always true without partitioning).
+        """
+        return self.partition is None or partition_of(url, self.partition[1]) == self.partition[0]
 
-            doc_id = self._get_id(url)
-            self._save_crawled(doc_id, {'url': url, 'tokens': tokens_for_indexing})
-            self.url_to_doc_id[url] = doc_id
-            crawled_count += 1
 
-            # NEW: Incremented counter for periodic saving
-            self.crawled_since_last_save += 1
+    def _exchange_links(self):
+        """
+        Send the links found for other partitions, queue the links other partitions found for
+        this one, and pick up their new SimHashes. Returns the number of links received.
+        """
+        if self.outbox:
+            self.shared.send(self.outbox)
+            self.links_sent += len(self.outbox)
+            self.outbox = []
+
+        received = self.shared.receive(self.partition[0])
+        self.links_received += len(received)
+        for item in received:
+            url = item[1]
+            if self._doc_id(url) is not None or self._visited_key(url) in self.visited_urls_in_queue:
+                continue
+            allowed = self._robots_allows(item)
+            if allowed:
+                self.frontier.push(item)
+            elif allowed is not None:
+                logging.info(f"[ROBOTS] Skipping {url} due to robots.txt rules for {urlparse(url).netloc}.")
+                self._count("skipped_robots")
+                continue
+            self.visited_urls_in_queue.add(self._visited_key(url))
+        if received:
+            logging.info(f"[PARTITION] Received {len(received)} links from other partitions. Frontier size: {len(self.frontier)}.")
 
-            # NEW: Periodic Saving Check - Place this after a page is successfully crawled and all its state is updated
-            if self.crawled_since_last_save >= self.save_threshold:
-                logging.info(f"[PERIODIC_SAVE] Performing periodic save after {self.crawled_since_last_save} successful crawls.")
-                try:
-                    self._save(self.path_to_frontier, self.frontier)
-                    self._save(self.path_to_visited_urls_in_queue, self.visited_urls_in_queue)
-                    self._save(self.path_to_simhashes, self.seen_simhashes) # Ensure simhashes are also saved here
-                    # self._save(self.path_to_crawled_data, self.crawled_data) # crawled_data is already saved more often, but no harm in saving again.
-                    # Or, better, if you implement _save_crawled to save all data types, you can just call it.
-                except Exception as e:
-                    logging.error(f"[PERIODIC_SAVE_ERROR] Failed during periodic save: {e}")
-                finally:
-                    self.crawled_since_last_save = 0 # Reset counter after attempting to save
-
-            end_page_time = time.time()
-            processing_time = end_page_time - start_page_time
-            logging.info(f"[SUCCESS] Processed {url} (Doc ID: {doc_id}) in {processing_time:.2f} seconds.")
-
-            # --- Link Extraction and Frontier Management ---
-            if depth < self.max_depth:
-                current_page_text_for_scoring = self._get_cleaned_text_for_simhash(soup)
-                current_page_tokens_for_scoring = self._clean_for_scoring(current_page_text_for_scoring)
-
-                links_added_from_page = 0
-                for a in soup.find_all("a", href=True):
-                    href = urljoin(url, a["href"])
-                    href, _ = urldefrag(href)
-                    
-                    # --- NEW/MODIFIED: Robust parsing of extracted href ---
-                    try:
-                        p = urlparse(href)
-                    except Exception as e:
-                        logging.warning(f"[LINK_PARSE_ERROR] Skipping malformed extracted link '{href}' from '{url}': {e}.")
-                        continue
-
-                    if p.scheme in ("http", "https"):
-                        # --- NEW: Immediate Filtering for new links ---
-                        if self._is_blacklisted_ending(href):
-                            continue # Skip adding this link
-                        if p.netloc in self.blacklisted_domains:
-                            continue # Skip adding this link
-                        # --- END Immediate Filtering ---
-
-                        # NEW: Check if already processed (crawled and indexed) or already in frontier
-                        if href in self.url_to_doc_id or href in self.visited_urls_in_queue:
-                            continue
-
-                        target_rp = self._get_robot_parser(href)
-                        if target_rp.can_fetch(self.user_agent, href):
-                            anchor_text = a.get_text(strip=True)
-
-                            new_priority = self._calculate_priority(
-                                href,
-                                anchor_text,
-                                current_page_tokens_for_scoring,
-                                depth + 1
-                            )
-
-                            if new_priority != -float('inf'): # Only add if not effectively blacklisted by _calculate_priority
-                                heapq.heappush(self.frontier, (new_priority, href, depth + 1))
-                                self.visited_urls_in_queue.add(href)
-                                links_added_from_page += 1
-                            else:
-                                pass # Logging for blacklisted URLs already done by _calculate_priority
-                        else:
-                            pass # Logging for robots.txt disallow can be very verbose for all links
-
-                logging.info(f"[LINKS] Added {links_added_from_page} new links to frontier. Frontier size: {len(self.frontier)}.")
-            else:
-                logging.info(f"[LINKS] Max depth reached, no new links added from {url}.")
+        new_simhashes = self.shared.new_simhashes()
+        self.seen_simhashes.update(new_simhashes)
+        self.simhash_index.update(new_simhashes)
+        return len(received)
 
-        logging.info(f"\n[CRAWL COMPLETE] Finished crawling.")
-        logging.info(f"Total pages crawled and indexed: {crawled_count}")
-        logging.info(f"Skipped by robots.txt: {skipped_robots}")
-        logging.info(f"Skipped as content duplicates (SimHash): {skipped_duplicate_content}")
-        logging.info(f"Skipped as non-English or no text: {skipped_non_english}")
-        logging.info(f"Skipped (already processed in previous run): {skipped_already_processed}")
-        logging.info(f"Skipped (blacklisted domain/ending): {skipped_blacklisted}")
-        logging.info(f"Skipped due to fetch/request errors: {skipped_fetch_errors}") # NEW stat
-        logging.info(f"Skipped due to HTML parsing errors: {skipped_parsing_errors}") # NEW stat
-        logging.info(f"Remaining URLs in frontier (not crawled): {len(self.frontier)}")
 
-        # Explicitly save frontier and visited_urls_in_queue on normal completion
-        self._save(self.path_to_frontier, self.frontier)
-        self._save(self.path_to_visited_urls_in_queue, self.visited_urls_in_queue)
-        self._save(self.path_to_crawled_data, self.crawled_data)
-        self._save(self.path_to_simhashes, self.seen_simhashes)
-        logging.info("Frontier, visited URLs, crawled data, and simhashes saved on completion.")
+    def _partition_finished(self):
+        """
+        Called when this worker has nothing left to do: it is finished once all workers are idle
+        and no links are on their way.
+        """
+        if self._exchange_links() or self.in_flight:
+            return False
+        self.shared.set_idle(self.partition[0])
+        return self.shared.finished()
 
 
     def _get_robot_parser(self, url):
+        """
+        Blocking lookup of the robots.txt rules of the URL's domain, used for the seeds.
+        """
+        domain = urlparse(url).netloc
+        cached = self.robots_cache.get(domain)
+        if cached is None:
+            rp, crawl_delay = self._fetch_robots(url)
+            self._store_robots(domain, rp, crawl_delay)
+            return rp
+        return cached[0]
+
+    def _robots_allows(self, item):
+        """
+        Returns True/False if the robots.txt rules of the URL's domain are known. Otherwise
+        fetches them in the background, parks the frontier item until they arrive and
+        returns None.
+        """
+        url = item[1]
+        domain = urlparse(url).netloc
+        cached = self.robots_cache.get(domain)
+        if cached is not None:
+            return cached[0].can_fetch(self.user_agent, url)
+
+        if domain not in self.robots_pending:
+            self.robots_pending[domain] = []
+            future = self.fetch_pool.submit(self._fetch_robots, url)
+            self.in_flight[future] = ("robots", None, domain)
+            self.fetches_in_flight += 1
+        self.robots_pending[domain].append(item)
+        return None
+
+    def _handle_robots(self, domain, rp, crawl_delay):
+        self._store_robots(domain, rp, crawl_delay)
+
+        # Release the URLs that waited for these rules
+        for item in self.robots_pending.pop(domain, []):
+            if rp.can_fetch(self.user_agent, item[1]):
+                self.frontier.push(item)
+            else:
+                logging.info(f"[ROBOTS] Skipping {item[1]} due to robots.txt rules for {domain}.")
+                self._count("skipped_robots")
+                self.frontier.done(item[1])
+
+    def _store_robots(self, domain, rp, crawl_delay):
+        self.robots_cache.put(domain, rp, crawl_delay)
+        # Count the robots.txt request towards the domain's crawl-delay, instead of sleeping
+        self.frontier.set_delay(domain, crawl_delay)
+
+    def _fetch_robots(self, url):
+        """
+        Fetch and parse the robots.txt of the URL's domain. Safe to run on a fetch thread.
+
+        Returns:
+            (RobotFileParser, float) -> rules and effective crawl-delay of the domain
+        """
         parsed_url = urlparse(url)
         domain = parsed_url.netloc
+        robot_url = urlunparse(parsed_url._replace(path="/robots.txt", params="", query="", fragment=""))
+        rp = urllib.robotparser.RobotFileParser()
+        rp.set_url(robot_url)
 
-        if domain not in self.robot_parsers:
-            robot_url = urlunparse(parsed_url._replace(path="/robots.txt", params="", query="", fragment=""))
-            rp = urllib.robotparser.RobotFileParser()
-            rp.set_url(robot_url)
+        current_domain_delay = self.default_delay
 
-            current_domain_delay = self.default_delay
+        # --- NEW/MODIFIED: Robust fetching for robots.txt ---
+        try:
+            with self.http.get(robot_url, timeout=5, stream=True) as response:
+                response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+                self.http.record_transfer(response, len(response.content))
 
-            # --- NEW/MODIFIED: Robust fetching for robots.txt ---
-            try:
-                headers = {'User-Agent': self.user_agent}
-                with requests.get(robot_url, headers=headers, timeout=5, stream=True) as response:
-                    response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-                    # Attempt to decode robots.txt content robustly
-                    try:
-                        robot_content = response.content.decode('utf-8')
-                    except UnicodeDecodeError:
-                        logging.warning(f"[ROBOTS_ENCODING_ERROR] UnicodeDecodeError for robots.txt of {domain}. Attempting ISO-8859-1 fallback.")
-                        robot_content = response.content.decode('iso-8859-1', errors='ignore') # Ignore errors for robots.txt
-
-                rp.parse(robot_content.splitlines())
-                logging.info(f"Successfully fetched and parsed robots.txt for {domain}")
-
-                c_delay = rp.crawl_delay(self.user_agent)
-                if c_delay is not None:
-                    current_domain_delay = c_delay
-                    logging.info(f"Applying robots.txt crawl-delay of {c_delay}s for {domain}. Effective delay: {current_domain_delay}s")
-                else:
-                    logging.info(f"No specific crawl-delay in robots.txt for {domain}. Using default delay: {self.default_delay}s")
-                    current_domain_delay = self.default_delay
-
-            except requests.exceptions.HTTPError as e:
-                # Handles 404 (robots.txt not found), 403 (forbidden), etc.
-                if e.response.status_code in (401, 403):
-                    rp.disallow_all = True
-                    logging.info(f"Access denied to robots.txt for {domain} (Status: {e.response.status_code}). Disallowing all.")
-                elif 400 <= e.response.status_code < 500: # Includes 404
-                    rp.allow_all = True
-                    logging.info(f"robots.txt not found for {domain} (Status: {e.response.status_code}). Allowing all.")
-                else: # Other HTTP errors (e.g., 5xx server errors)
-                    rp.allow_all = True
-                    logging.error(f"HTTP error fetching robots.txt for {domain} (Status: {e.response.status_code}): {e}. Allowing all.")
-            except requests.exceptions.RequestException as e:
-                # This catches ConnectionError, Timeout, and any other general request-related issues
-                # including potentially a UnicodeDecodeError that might manifest differently.
-                logging.warning(f"Failed to fetch robots.txt for {domain} due to: {e}. Allowing all for this domain.")
-                rp.allow_all = True # Default to allowing all if there's any issue fetching/parsing robots.txt
-            except Exception as e:
-                # Catch any other unexpected errors during robots.txt processing (e.g., parsing issues if not from requests)
-                logging.error(f"An unexpected error occurred while processing robots.txt for {domain}: {e}. Allowing all for this domain.")
+                # Attempt to decode robots.txt content robustly
+                try:
+                    robot_content = response.content.decode('utf-8')
+                except UnicodeDecodeError:
+                    logging.warning(f"[ROBOTS_ENCODING_ERROR] UnicodeDecodeError for robots.txt of {domain}. Attempting ISO-8859-1 fallback.")
+                    robot_content = response.content.decode('iso-8859-1', errors='ignore') # Ignore errors for robots.txt
+
+            rp.parse(robot_content.splitlines())
+            logging.info(f"Successfully fetched and parsed robots.txt for {domain}")
+
+            c_delay = rp.crawl_delay(self.user_agent)
+            if c_delay is not None:
+                current_domain_delay = c_delay
+                logging.info(f"Applying robots.txt crawl-delay of {c_delay}s for {domain}. Effective delay: {current_domain_delay}s")
+            else:
+                logging.info(f"No specific crawl-delay in robots.txt for {domain}. Using default delay: {self.default_delay}s")
+                current_domain_delay = self.default_delay
+
+        except requests.exceptions.HTTPError as e:
+            # Handles 404 (robots.txt not found), 403 (forbidden), etc.
+            if e.response.status_code in (401, 403):
+                rp.disallow_all = True
+                logging.info(f"Access denied to robots.txt for {domain} (Status: {e.response.status_code}). Disallowing all.")
+            elif 400 <= e.response.status_code < 500: # Includes 404
                 rp.allow_all = True
+                logging.info(f"robots.txt not found for {domain} (Status: {e.response.status_code}). Allowing all.")
+            else: # Other HTTP errors (e.g., 5xx server errors)
+                rp.allow_all = True
+                logging.error(f"HTTP error fetching robots.txt for {domain} (Status: {e.response.status_code}): {e}. Allowing all.")
+        except requests.exceptions.RequestException as e:
+            # This catches ConnectionError, Timeout, and any other general request-related issues
+            # including potentially a UnicodeDecodeError that might manifest differently.
+            logging.warning(f"Failed to fetch robots.txt for {domain} due to: {e}. Allowing all for this domain.")
+            rp.allow_all = True # Default to allowing all if there's any issue fetching/parsing robots.txt
+        except Exception as e:
+            # Catch any other unexpected errors during robots.txt processing (e.g., parsing issues if not from requests)
+            logging.error(f"An unexpected error occurred while processing robots.txt for {domain}: {e}. Allowing all for this domain.")
+            rp.allow_all = True
 
-            self.robot_parsers[domain] = rp
-            self.domain_delays[domain] = current_domain_delay
-            # A small delay even after fetching robots.txt to avoid hammering
-            time.sleep(self.default_delay)
-
-        return self.robot_parsers[domain]
+        return rp, current_domain_delay
 
-    def _calculate_priority(self, url, anchor_text, source_page_tokens, current_depth):
+    def _calculate_priority(self, url, anchor_text, source_page_score, current_depth):
             score = 0
             
-            # Define base weights for keyword tiers (these are now very significant)
-            VERY_RELEVANT_WEIGHT = 70  # Higher impact
-            RELEVANT_WEIGHT = 30     # Higher impact
-            MODERATELY_RELEVANT_WEIGHT = 15 # Higher impact
+            # Keyword tier weights are in self.keyword_tier_weights (see _keyword_score)
 
             # Domain-based score adjustments
             HIGH_PRIO_DOMAIN_BASE_SCORE = 300 # Significant boost for high priority domains
-            BLACKLIST_DOMAIN_PENALTY = -10000 # Effectively puts them at the very end
 
-            # Depth penalty parameters
+            # Depth penalty parameters (linear per level)
             BASE_DEPTH_PENALTY_PER_LEVEL = 10
-            # For normal/high-prio domains, penalty is linear.
-            # For blacklisted domains, they should already be filtered/at end.
 
             parsed_url = urlparse(url)
             domain = parsed_url.netloc
 
-            # 0. Immediate Filtering for Blacklisted Endings
-            if self._is_blacklisted_ending(url):
-                return -float('inf') # Guaranteed lowest priority, effectively removed
+            # 0. Blacklisted endings and domains were filtered by self.url_filter when the link
+            # was extracted (seeds are checked before they get here)
 
             # 1. Domain-Tier Prioritization
-            if domain in self.blacklisted_domains:
-                # If a domain is blacklisted, its priority is extremely low.
-                # We still let it through this function to return -float('inf'),
-                # but the 'run' loop should ideally filter these early.
-                return -float('inf') 
-            elif domain in self.high_prio_domains:
+            if domain in self.high_prio_domains:
                 score += HIGH_PRIO_DOMAIN_BASE_SCORE
                 # For high-prio domains, maybe a slightly gentler depth penalty,
                 # but let the keyword density still drive it if they go off-topic.
@@ -838,61 +1448,39 @@ class OfflineCrawler:
 
             # 2. Anchor Text Relevance (Crucial for "normal" domains)
             if anchor_text:
-                cleaned_anchor_text_tokens = set(self._clean_for_scoring(anchor_text))
-                
-                score += len(cleaned_anchor_text_tokens.intersection(self.very_relevant_keywords)) * VERY_RELEVANT_WEIGHT
-                score += len(cleaned_anchor_text_tokens.intersection(self.relevant_keywords)) * RELEVANT_WEIGHT
-                score += len(cleaned_anchor_text_tokens.intersection(self.moderately_relevant_keywords)) * MODERATELY_RELEVANT_WEIGHT
-
-                # Penalize for blacklisted city names in anchor text
-                for city in self.blacklisted_city_keywords:
-                    if city in anchor_text.lower():
-                        score -= 50 # Penalize for other major cities
-                        break
+                # Penalize for blacklisted city names in anchor text (other major cities)
+                score += self._keyword_score(self._clean_for_scoring(anchor_text), city_penalty=50)
 
             # 3. URL Keyword Relevance (path, domain, query) - Also crucial for "normal" domains
-            url_components_text = (parsed_url.netloc + parsed_url.path + parsed_url.query).lower()
-            url_components_tokens = set(self._clean_for_scoring(url_components_text))
-            
-            score += len(url_components_tokens.intersection(self.very_relevant_keywords)) * VERY_RELEVANT_WEIGHT
-            score += len(url_components_tokens.intersection(self.relevant_keywords)) * RELEVANT_WEIGHT
-            score += len(url_components_tokens.intersection(self.moderately_relevant_keywords)) * MODERATELY_RELEVANT_WEIGHT
-
             # Penalize for blacklisted city names in URL
-            for city in self.blacklisted_city_keywords:
-                if city in url_components_text:
-                    score -= 75
-                    break
+            url_components_text = parsed_url.netloc + parsed_url.path + parsed_url.query
+            score += self._keyword_score(self._clean_for_scoring(url_components_text), city_penalty=75)
 
             # 4. Source Page Context Relevance (still contributes, but less than direct link signals)
-            if source_page_tokens:
-                source_tokens_set = set(source_page_tokens)
-                
-                score += len(source_tokens_set.intersection(self.very_relevant_keywords)) * (VERY_RELEVANT_WEIGHT / 3) # Reduced influence
-                score += len(source_tokens_set.intersection(self.relevant_keywords)) * (RELEVANT_WEIGHT / 3)
-                score += len(source_tokens_set.intersection(self.moderately_relevant_keywords)) * (MODERATELY_RELEVANT_WEIGHT / 3)
-
-                source_page_full_text = " ".join(token for token in source_page_tokens if isinstance(token, str)).lower()
-                for city in self.blacklisted_city_keywords:
-                    if city in source_page_full_text:
-                        score -= 25
-                        break
+            # Computed once per page by _keyword_score (reduced influence, city penalty 25)
+            score += source_page_score
             # 5. Depth Penalty (Linear, but combined with the stronger keyword weights)
             # This will ensure that if a "normal" domain has great keywords at depth 1, it gets high prio,
             # but if it keeps linking to irrelevant stuff, its score quickly drops due to depth AND lack of keywords.
             score -= (current_depth * BASE_DEPTH_PENALTY_PER_LEVEL)
 
-            # Ensure score is not negative if it shouldn't be, before negating for heapq
-            # If score is very low but not -inf, it will still be last in the heap.
+            # A very low score just puts the URL last in its queue
             return -score # heapq is a min-heap, so we negate for max-priority
         
     def _add_initial_seeds(self, seeds):
 
         for url in seeds:
-            normalized_url, _ = urldefrag(urljoin(url, url))
+            try:
+                normalized_url, _ = urldefrag(urljoin(url, url))
+                self.canonicalizer.canonicalize(normalized_url)
+            except ValueError as e:
+                logging.warning(f"[SEED_SKIP] Error parsing initial seed URL '{url}': {e}. Skipping.")
+                continue
+            if not self._owns(normalized_url):
+                continue
 
             # Only add if not already processed in previous runs and not currently in the queue
-            if normalized_url not in self.url_to_doc_id and normalized_url not in self.visited_urls_in_queue:
+            if self._doc_id(normalized_url) is None and self._visited_key(normalized_url) not in self.visited_urls_in_queue:
                 # Assign an extremely high priority to initial seeds at depth 0
                 initial_seed_priority_score = 10000
 
@@ -904,16 +1492,17 @@ class OfflineCrawler:
                     logging.warning(f"[SEED_SKIP] Error parsing initial seed URL '{normalized_url}': {e}. Skipping.")
                     continue
 
-                if parsed_url.netloc in self.blacklisted_domains or self._is_blacklisted_ending(normalized_url):
-                    logging.warning(f"[SEED_SKIP] Seed '{normalized_url}' domain/ending blacklisted. Skipping initial add.")
+                rule = self.url_filter.match(normalized_url)
+                if rule is not None:
+                    logging.warning(f"[SEED_SKIP] Seed '{normalized_url}' blacklisted ({rule}). Skipping initial add.")
                     continue
 
                 # Check robots.txt for the seed URL before adding
                 rp = self._get_robot_parser(normalized_url)
                 if rp.can_fetch(self.user_agent, normalized_url):
                     # Add to frontier with very high priority
-                    heapq.heappush(self.frontier, (-initial_seed_priority_score, normalized_url, 0))
-                    self.visited_urls_in_queue.add(normalized_url)
+                    self.frontier.push((-initial_seed_priority_score, normalized_url, 0))
+                    self.visited_urls_in_queue.add(self._visited_key(normalized_url))
                     logging.info(f"[SEED_ADD] Added new seed to frontier: '{normalized_url}' (Priority: {initial_seed_priority_score}).")
                 else:
                     logging.info(f"[SEED_SKIP] Seed '{normalized_url}' disallowed by robots.txt.")
@@ -923,99 +1512,125 @@ class OfflineCrawler:
         Basic cleaning: lowercase, remove punctuation, normalize whitespace, and return tokens.
         This is used for anchor text, URL components, and source page text for relevance scoring.
         """
-        text = text.lower()
-        text = re.sub(r'[^\w\s]', ' ', text) # Remove anything that's not alphanumeric or whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text.split() # Return as a list of tokens
+        return scoring_tokens(text) # The same tokens the keyword automaton is built from
 
 
-    def _get_cleaned_text_for_simhash(self, soup):
+    def _keyword_score(self, tokens, scale=1, city_penalty=0):
         """
-        Extracts and cleans text specifically for SimHash calculation.
-        This typically involves stripping more boilerplate elements.
+        Score of the keywords in a token list, from one pass of the keyword automaton: each
+        distinct keyword of a tier adds the tier's weight (times `scale`), and any blacklisted
+        city subtracts `city_penalty`.
         """
-        # Exclude common boilerplate tags for better content focus in SimHash
-        for tag in soup(["script", "style", "nav", "footer", "header", "aside", "form"]):
-            tag.decompose()
-        text = soup.get_text(separator=" ")
+        counts = self.keyword_automaton.counts(tokens)
+        score = sum(weight * counts.get(tier, 0) for tier, weight in self.keyword_tier_weights.items()) * scale
+        if counts.get("blacklisted_city"):
+            score -= city_penalty
+        return score
 
-        # Lowercase and remove excessive whitespace for SimHash
-        text = text.lower()
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text
+
+    def _compute_simhash(self, text):
+        """
+        Computes the SimHash of the given text (see Utils/simhash.py).
+        """
+        return self.simhasher.fingerprint(text)
 
 
-    def _compute_simhash(self, text, num_bits=64):
+    def _doc_id(self, url):
         """
-        Computes the SimHash of the given text.
-        Uses a simple bag-of-words approach with MD5 hashing for features.
+        Doc ID of the page at `url` (or at a variant with the same canonical form), None if not processed yet.
         """
-        if not text:
-            return 0
-
-        features = {}
-        for word in text.split():
-            feature_hash = int(hashlib.md5(word.encode('utf-8')).hexdigest(), 16)
-            features[feature_hash] = features.get(feature_hash, 0) + 1
-
-        v = [0] * num_bits
-        for feature_hash, weight in features.items():
-            for i in range(num_bits):
-                if (feature_hash >> i) & 1:
-                    v[i] += weight
-                else:
-                    v[i] -= weight
+        return self.doc_ids.get(self.canonicalizer.fingerprint(url))
 
-        simhash_val = 0
-        for i in range(num_bits):
-            if v[i] >= 0:
-                simhash_val |= (1 << i)
-        return simhash_val
 
+    def _visited_key(self, url):
+        """
+        Key of `url` in the visited filter: its canonical form, shared by all its variants.
+        """
+        return self.canonicalizer.canonicalize(url)
 
-    def _hamming_distance(self, hash1, hash2):
-        """Calculates the Hamming distance between two integers (representing hashes)."""
-        x = hash1 ^ hash2
-        set_bits = 0
-        while x > 0:
-            x &= (x - 1)
-            set_bits += 1
-        return set_bits
+
+    def _indexed_urls(self):
+        """
+        URLs of the processed pages, read from the document log (doc_ids only keeps fingerprints).
+        """
+        urls = {url_info['url'] for _, url_info in self.documents.iter_records() if 'url' in url_info}
+        if self.shared is not None:
+            urls.update(url for url in self.shared.doc_ids() if self._owns(url))
+        return urls
 
 
     def _get_id(self, url):
         # Use existing ID if URL was previously crawled and saved
-        if url in self.url_to_doc_id:
-            return self.url_to_doc_id[url]
+        doc_id = self._doc_id(url)
+        if doc_id is not None:
+            return doc_id
+
+        # Otherwise, assign a new ID (unique over all partitions in a distributed crawl)
+        if self.shared is not None:
+            return self.shared.allocate_doc_id(url)
+        return self.documents.allocate_id() # Larger than every ID in the log, the first document gets 0
+
+
+    def _record_simhash(self, simhash):
+        self.seen_simhashes.add(simhash)
+        self.simhash_journal.log(simhash)
+        if self.shared is not None:
+            self.shared.publish_simhash(self.partition[0], simhash)
 
-        # Otherwise, assign a new ID
-        if self.crawled_data:
-            return max(self.crawled_data.keys()) + 1
-        return 0 # First document will be ID 0
 
-    # TODO these three methods should be unified
-    def _save_crawled(self, doc_id, doc_info):
-        self.crawled_data[doc_id] = doc_info
+    def _count(self, outcome):
+        """
+        Count a page outcome in the crawl statistics and the live metrics.
+        """
+        self.stats[outcome] += 1
+        self.telemetry.count(outcome)
+
 
-        with open(self.path_to_crawled_data, "wb") as f:
-            pickle.dump(self.crawled_data, f)
+    def _report_metrics(self):
+        self.telemetry.report(self.stats, self.frontier, self.fetches_in_flight, self.processes_in_flight, len(self.process_backlog))
+
+
+    def _sync_state(self):
+        """
+        Make the changes since the last call durable, without rewriting any snapshot: commit the
+        frontier and the document log, and fsync the journals.
+        """
+        self.frontier.save()
+        self.documents.commit()
+        if self.archive is not None:
+            self.archive.commit()
+        for journal in (self.simhash_journal, self.robots_cache.journal, self.revisits.journal):
+            journal.sync()
+
+
+    def _checkpoint(self, final=False):
+        """
+        Save all crawl state. Journaled state is only snapshotted once its journal has grown as
+        large as the state, or when `final` is set; then crawled_data.pkl is exported as well.
+        """
+        self.frontier.save()
+        self.visited_urls_in_queue.save()
+        self.documents.commit()
+        if self.archive is not None:
+            self.archive.commit()
+        if self.simhash_journal.checkpoint(self.seen_simhashes, len(self.seen_simhashes), force=final):
+            logging.info(f"Successfully saved data to {self.path_to_simhashes}.")
+        self.robots_cache.save(force=final)
+        self.revisits.save(force=final)
+        if final:
+            self.documents.export(self.path_to_crawled_data)
 
 
     def _save(self, path, data):
         """Generic save method for any pickleable data."""
         try:
-            with open(path, "wb") as f:
-                pickle.dump(data, f)
+            atomic_dump(data, path)
             logging.info(f"Successfully saved data to {path}.")
         except Exception as e:
             # NEW/MODIFIED: Catch any error during saving
             logging.error(f"Error saving data to {path}: {e}. Data might be lost!")
 
 
-    def _save_all(self):
-        with open(self.path_to_crawled_data, "wb") as f:
-            pickle.dump(self.crawled_data, f)
-
     def _load(self, path):
         """Generic load method for any pickleable data, with robust error handling."""
         try:
@@ -1030,9 +1645,9 @@ class OfflineCrawler:
                 return {}
             elif path == self.path_to_simhashes:
                 return set()
-            elif path == self.path_to_frontier:
+            elif path == self.path_to_frontier_pickle:
                 return []
-            elif path == self.path_to_visited_urls_in_queue:
+            elif path == self.path_to_visited_pickle:
                 return set()
             else:
                 logging.error(f"Attempted to load unrecognized path: {path}")
@@ -1044,9 +1659,9 @@ class OfflineCrawler:
                 return {}
             elif path == self.path_to_simhashes:
                 return set()
-            elif path == self.path_to_frontier:
+            elif path == self.path_to_frontier_pickle:
                 return []
-            elif path == self.path_to_visited_urls_in_queue:
+            elif path == self.path_to_visited_pickle:
                 return set()
             else:
                 raise # Re-raise if path is not handled
@@ -1057,33 +1672,22 @@ class OfflineCrawler:
                 return {}
             elif path == self.path_to_simhashes:
                 return set()
-            elif path == self.path_to_frontier:
+            elif path == self.path_to_frontier_pickle:
                 return []
-            elif path == self.path_to_visited_urls_in_queue:
+            elif path == self.path_to_visited_pickle:
                 return set()
             else:
                 raise # Re-raise if path is not handled
 
     def _handle_interrupt(self, signum, frame):
+        # Saving from inside the handler could interrupt a write half-way, so only ask the run loop
+        # to stop. Changes since the last sync are in the journals and SQLite, so even a hard kill
+        # loses at most `sync_interval` seconds of work.
+        if self.stop_requested:
+            logging.info("\n[INTERRUPT] Second Ctrl+C, exiting without saving.")
+            sys.exit(1)
         logging.info("\n[INTERRUPT] Ctrl+C detected. Saving state and shutting down gracefully...")
-        try:
-            # Use the robust _save method for all state saving
-            self._save(self.path_to_frontier, self.frontier)
-            self._save(self.path_to_visited_urls_in_queue, self.visited_urls_in_queue)
-            self._save(self.path_to_crawled_data, self.crawled_data)
-            self._save(self.path_to_simhashes, self.seen_simhashes)
-            logging.info("Crawler state saved successfully.")
-        except Exception as e:
-            logging.error(f"Error during graceful shutdown save: {e}. Data might be partially lost!")
-        sys.exit(0)
-
-    def _is_blacklisted_ending(self, url): # <--- THIS METHOD NEEDS TO BE INDENTED
-        """Checks if the URL ends with any blacklisted extension or string."""
-        url_lower = url.lower()
-        for ending in self.url_ending_blacklist:
-            if url_lower.endswith(ending):
-                return True
-        return False
+        self.stop_requested = True
 
 # if __name__ == "__main__":
     
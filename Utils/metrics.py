@@ -0,0 +1,190 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+# Latency buckets in seconds, from sub-millisecond lookups to slow model inference
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics store (counters, gauges, histograms) rendered in the
+    Prometheus text exposition format.
+
+    Each process has its own registry; with pre-forked workers every worker reports its
+    own series, tagged with a `worker` label.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._counters = {}    # (name, labels) -> float
+        self._gauges = {}      # (name, labels) -> float
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._buckets = {}     # histogram name -> its bucket bounds
+
+
+    def _register(self, name, kind, help_text):
+        if name not in self._types:
+            self._types[name] = kind
+            self._help[name] = help_text
+
+
+    def inc(self, name, labels=None, value=1, help_text=""):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._register(name, "counter", help_text)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+
+    def set(self, name, value, labels=None, help_text=""):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._register(name, "gauge", help_text)
+            self._gauges[key] = value
+
+
+    def observe(self, name, value, labels=None, help_text="", buckets=None):
+        """
+        Add `value` to a histogram. `buckets` (bounds for values that are not latencies, e.g.
+        counts) are fixed by the first observation of the metric; the registry's by default.
+        """
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._register(name, "histogram", help_text)
+            bounds = self._buckets.setdefault(name, buckets or self.buckets)
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(bounds) + 2)
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+
+    def remove(self, name):
+        """
+        Drop all series of a gauge, e.g. before setting a new set of labels.
+        """
+        with self._lock:
+            for key in [key for key in self._gauges if key[0] == name]:
+                del self._gauges[key]
+
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text format.
+        """
+        worker = os.environ.get("PREFORK_WORKER_ID")
+        extra = (("worker", worker),) if worker is not None else ()
+
+        lines = []
+        with self._lock:
+            for name in sorted(self._types):
+                kind = self._types[name]
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+                if kind == "histogram":
+                    for (metric, labels), hist in sorted(self._histograms.items()):
+                        if metric != name:
+                            continue
+                        labels = labels + extra
+                        for i, bound in enumerate(self._buckets[name]):
+                            lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {hist[i]}")
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {hist[-1]}")
+                        lines.append(f"{name}_sum{_format_labels(labels)} {hist[-2]}")
+                        lines.append(f"{name}_count{_format_labels(labels)} {hist[-1]}")
+                else:
+                    series = self._counters if kind == "counter" else self._gauges
+                    for (metric, labels), value in sorted(series.items()):
+                        if metric == name:
+                            lines.append(f"{name}{_format_labels(labels + extra)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """
+    Per-request list of (stage, seconds), filled by `stage()` while the trace is active.
+
+    Its total is the wall-clock time from its start to `finish`, not the sum of the stages:
+    stages may overlap (e.g. the parallel document fetches) and not all work is a stage.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.end = None
+        self.stages = []
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages.append((name, seconds))
+
+    def finish(self):
+        """
+        Stop the clock (once) and return the total.
+        """
+        if self.end is None:
+            self.end = time.perf_counter()
+        return self.total()
+
+    def total(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def header_value(self):
+        """
+        Stage timings in the `Server-Timing` header format (durations in ms), plus the total.
+        """
+        with self._lock:
+            parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages]
+        parts.append(f"total;dur={self.total() * 1000:.2f}")
+        return ", ".join(parts)
+
+
+registry = MetricsRegistry()
+_current_trace = contextvars.ContextVar("search_trace", default=None)
+
+
+def start_trace():
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a pipeline stage: feeds the `search_stage_duration_seconds` histogram and,
+    if a trace is active in this context, the per-request trace.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe("search_stage_duration_seconds", seconds, {"stage": name},
+                         help_text="Time spent in each stage of the search pipeline.")
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, seconds)
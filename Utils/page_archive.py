@@ -0,0 +1,238 @@
+import os
+import zlib
+import uuid
+import struct
+import logging
+from email.utils import formatdate
+from http.client import responses
+from Utils.url_canonicalizer import url_fingerprint
+from Utils.checkpoint import lock_directory
+
+
+INDEX_ENTRY = struct.Struct('<QIQI')   # URL fingerprint, segment, offset, record length
+
+# Response headers kept in the archive; the others describe the transfer, not the page
+ARCHIVED_HEADERS = ('Content-Type', 'Content-Language', 'Date', 'Last-Modified', 'ETag')
+
+
+def encode_response(url, html, headers=None, status=200, fetched_at=None, level=6):
+    """
+    A WARC response record of a fetched page, compressed as one gzip member (as records are
+    stored in .warc.gz files). The body is the decoded HTML, so it is stored as UTF-8 and the
+    Content-Type says so.
+    """
+    headers = headers or {}
+    http_lines = [f"HTTP/1.1 {status} {responses.get(status, '')}".rstrip()]
+    for name in ARCHIVED_HEADERS:
+        value = headers.get(name)
+        if name == 'Content-Type':
+            value = f"{(value or 'text/html').split(';')[0].strip()}; charset=utf-8"
+        if value:
+            http_lines.append(f"{name}: {value}")
+    block = ("\r\n".join(http_lines) + "\r\n\r\n").encode('utf-8') + html.encode('utf-8', errors='replace')
+
+    warc_header = "\r\n".join([
+        "WARC/1.1",
+        "WARC-Type: response",
+        f"WARC-Target-URI: {url}",
+        f"WARC-Date: {formatdate(fetched_at, usegmt=True)}",
+        f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+        "Content-Type: application/http; msgtype=response",
+        f"Content-Length: {len(block)}",
+    ]) + "\r\n\r\n"
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    return compressor.compress(warc_header.encode('utf-8') + block + b"\r\n\r\n") + compressor.flush()
+
+
+def decode_response(data):
+    """
+    Inverse of `encode_response`: {'url', 'date', 'status', 'headers', 'html'}.
+    """
+    raw = zlib.decompress(data, 31)
+    warc_header, _, rest = raw.partition(b"\r\n\r\n")
+    warc_fields = _parse_fields(warc_header.decode('utf-8').split("\r\n")[1:])
+    block = rest[:int(warc_fields['content-length'])]
+    http_header, _, body = block.partition(b"\r\n\r\n")
+    status_line, *header_lines = http_header.decode('utf-8').split("\r\n")
+    return {'url': warc_fields['warc-target-uri'], 'date': warc_fields.get('warc-date'),
+            'status': int(status_line.split()[1]), 'headers': _parse_fields(header_lines),
+            'html': body.decode('utf-8', errors='replace')}
+
+
+def read_record(path, offset, length):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return decode_response(f.read(length))
+
+
+def _parse_fields(lines):
+    fields = {}
+    for line in lines:
+        name, _, value = line.partition(':')
+        fields[name.strip().lower()] = value.strip()
+    return fields
+
+
+class PageArchive:
+    """
+    Raw fetched pages, so the documents can be rebuilt with a changed preprocessing, language
+    filter or snippet extraction without crawling again (see Utils/reprocess.py).
+
+    Pages are appended as WARC response records, each a gzip member, to segment files
+    (segment_<n>.warc.gz) of at most `segment_bytes`; every segment is a valid .warc.gz file.
+    A page fetched again (a changed revisit) gets a new record, the latest one wins.
+
+    index.bin is the offset index: one fixed-size entry per record (URL fingerprint, segment,
+    offset, length), written by `commit` after the records are fsynced. On open, records after
+    the last indexed one are recovered by scanning the segment, and a torn record is cut off.
+    Like the document log, the archive is open in one process at a time (its LOCK file).
+    """
+
+    def __init__(self, path='data/page_archive', segment_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.segment_bytes = segment_bytes
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = lock_directory(path)
+        self.path_to_index = os.path.join(path, "index.bin")
+
+        self.offsets = {}      # URL fingerprint -> (segment, offset, length) of its latest record
+        self._pending = []     # index entries of records not committed yet
+        self._open()
+
+
+    def append(self, url, record):
+        """
+        Append a record made by `encode_response` for the page at `url`.
+        """
+        if self._active_size > 0 and self._active_size + len(record) > self.segment_bytes:
+            self.commit()
+            self._start_segment(self._active_segment + 1)
+        self._active_file.write(record)
+        entry = (url_fingerprint(url), self._active_segment, self._active_size, len(record))
+        self._active_size += len(record)
+        self._pending.append(entry)
+        self.offsets[entry[0]] = entry[1:]
+
+
+    def commit(self):
+        """
+        Make the pending records durable (one fsync) and index them.
+        """
+        if not self._pending:
+            return
+        self._active_file.flush()
+        os.fsync(self._active_file.fileno())
+        self._index_file.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in self._pending))
+        self._index_file.flush()
+        self._pending = []
+
+
+    def get(self, url):
+        segment, offset, length = self.offsets[url_fingerprint(url)]
+        return read_record(self._segment_path(segment), offset, length)
+
+
+    def locations(self):
+        """
+        (segment path, offset, length) of the latest record of every page, in archive order.
+        """
+        return [(self._segment_path(segment), offset, length) for segment, offset, length in sorted(self.offsets.values())]
+
+
+    def close(self):
+        self.commit()
+        self._active_file.close()
+        self._index_file.close()
+        self._lock_file.close()
+
+
+    def __contains__(self, url):
+        return url_fingerprint(url) in self.offsets
+
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, f"segment_{segment:05d}.warc.gz")
+
+
+    def _segments(self):
+        return sorted(int(name[len("segment_"):-len(".warc.gz")]) for name in os.listdir(self.path)
+                      if name.startswith("segment_") and name.endswith(".warc.gz"))
+
+
+    def _start_segment(self, segment):
+        if getattr(self, "_active_file", None) is not None:
+            self._active_file.close()
+        self._active_segment = segment
+        self._active_file = open(self._segment_path(segment), "ab")
+        self._active_size = self._active_file.tell()
+
+
+    def _open(self):
+        segments = self._segments()
+        sizes = {segment: os.path.getsize(self._segment_path(segment)) for segment in segments}
+
+        # Index entries; a torn entry at the end (crash while writing it) is dropped
+        data = b""
+        if os.path.exists(self.path_to_index):
+            with open(self.path_to_index, "rb") as f:
+                data = f.read()
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        end = (segments[0], 0) if segments else (0, 0)  # position after the last indexed record
+        for fingerprint, segment, offset, length in INDEX_ENTRY.iter_unpack(data[:usable]):
+            if offset + length > sizes.get(segment, -1):
+                continue
+            self.offsets[fingerprint] = (segment, offset, length)
+            end = max(end, (segment, offset + length))
+        self._index_file = open(self.path_to_index, "r+b" if data else "wb")
+        self._index_file.truncate(usable)
+        self._index_file.seek(usable)
+
+        recovered = self._recover(end, [segment for segment in segments if segment >= end[0]])
+        self._start_segment(segments[-1] if segments else 0)
+        if self.offsets:
+            logging.info(f"Opened page archive {self.path} with {len(self.offsets)} pages"
+                         + (f" ({recovered} records recovered from the segments)" if recovered else ""))
+
+
+    def _recover(self, end, segments):
+        """
+        Index the records written after the last index entry, and cut off a torn record.
+        """
+        entries = []
+        for segment in segments:
+            start = end[1] if segment == end[0] else 0
+            path = self._segment_path(segment)
+            with open(path, "r+b") as f:
+                f.seek(start)
+                data = memoryview(f.read())
+                offset = 0
+                while offset < len(data):
+                    # Feed the member in chunks until its end, which gives its compressed length
+                    decompressor = zlib.decompressobj(31)
+                    raw, position = b"", offset
+                    try:
+                        while not decompressor.eof and position < len(data):
+                            raw += decompressor.decompress(data[position:position + 65536])
+                            position += 65536
+                    except zlib.error:
+                        pass
+                    if not decompressor.eof:
+                        logging.warning(f"Truncating incomplete record at {path}:{start + offset}.")
+                        f.truncate(start + offset)
+                        break
+                    length = min(position, len(data)) - offset - len(decompressor.unused_data)
+                    url = _parse_fields(raw.partition(b"\r\n\r\n")[0].decode('utf-8').split("\r\n")[1:])['warc-target-uri']
+                    entries.append((url_fingerprint(url), segment, start + offset, length))
+                    offset += length
+
+        if entries:
+            self._index_file.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in entries))
+            self._index_file.flush()
+            for fingerprint, segment, offset, length in entries:
+                self.offsets[fingerprint] = (segment, offset, length)
+        return len(entries)
@@ -0,0 +1,203 @@
+import os
+import gc
+import sys
+import time
+import errno
+import signal
+import socket
+from werkzeug.serving import make_server
+
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def memory_report(pid="self"):
+    """
+    Memory usage of a process, read from /proc/<pid>/smaps_rollup.
+
+    Pss (proportional set size) splits shared pages between the processes that map them,
+    so summing Pss over all workers gives the real cost of the server. Private_Dirty is the
+    memory a worker has un-shared from the master (copy-on-write faults).
+
+    Args:
+        pid: int or "self" -> process to inspect
+
+    Returns:
+        dict: {field: kB} for the fields in SMAPS_FIELDS, empty if /proc is unavailable
+    """
+    report = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].rstrip(":") in SMAPS_FIELDS:
+                    report[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        pass
+    return report
+
+
+def format_memory_report(reports):
+    """
+    Render {name: memory_report} as a small table, in MB.
+    """
+    lines = [f"{'PROCESS':<16}" + "".join(f"{field:>15}" for field in SMAPS_FIELDS)]
+    totals = dict.fromkeys(SMAPS_FIELDS, 0)
+    for name, report in reports.items():
+        lines.append(f"{name:<16}" + "".join(f"{report.get(field, 0) / 1024:>13.1f}MB" for field in SMAPS_FIELDS))
+        for field in SMAPS_FIELDS:
+            totals[field] += report.get(field, 0)
+    lines.append(f"{'TOTAL':<16}" + "".join(f"{totals[field] / 1024:>13.1f}MB" for field in SMAPS_FIELDS))
+    return "\n".join(lines)
+
+
+class PreforkServer:
+    """
+    Pre-forking WSGI server.
+
+    Everything the app needs (index, models) must be loaded before `serve()` is called.
+    The master then binds the listening socket, freezes the garbage collector so that it
+    never writes to the inherited objects, and forks `workers` processes which all accept
+    on the same socket. Dead workers are respawned, SIGINT/SIGTERM stop all of them, and
+    SIGUSR1 (or every `report_interval` seconds) logs a per-worker memory report.
+
+    SIGHUP calls `reload` in the master (e.g. to load a new index) and replaces the workers
+    with ones forked from the reloaded master.
+    """
+
+    def __init__(self, app, host='127.0.0.1', port=5000, workers=4, report_interval=300, reload=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.report_interval = report_interval
+        self.reload = reload
+
+        self.children = {}  # pid -> worker number
+        self.sock = None
+        self.stopping = False
+        self.reloading = False
+
+
+    def serve(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(128)
+        self.sock.set_inheritable(True)
+
+        # Move every object created so far into the permanent generation. Otherwise the
+        # first collection in a worker walks (and writes to) all of them and un-shares the pages.
+        gc.collect()
+        gc.freeze()
+
+        print(f"[PREFORK] Master {os.getpid()} listening on http://{self.host}:{self.port} with {self.workers} workers.")
+        print("[PREFORK] Master memory before fork:\n" + format_memory_report({f"master {os.getpid()}": memory_report()}))
+
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.log_memory_report())
+        if self.reload is not None:
+            signal.signal(signal.SIGHUP, self._handle_reload)
+
+        last_report = time.time()
+        while not self.stopping:
+            if self.reloading:
+                self.reloading = False
+                self._reload()
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                worker_id = self.children.pop(pid, None)
+                if worker_id is not None and not self.stopping:
+                    print(f"[PREFORK] Worker {worker_id} (pid {pid}) exited with status {status}, respawning.")
+                    self._spawn(worker_id)
+                continue
+
+            if self.report_interval and time.time() - last_report >= self.report_interval:
+                self.log_memory_report()
+                last_report = time.time()
+            time.sleep(0.5)
+
+        self._shutdown()
+
+
+    def log_memory_report(self):
+        reports = {f"master {os.getpid()}": memory_report()}
+        for pid, worker_id in sorted(self.children.items(), key=lambda item: item[1]):
+            reports[f"worker {worker_id} ({pid})"] = memory_report(pid)
+        print("[PREFORK] Memory report:\n" + format_memory_report(reports))
+
+
+    def _spawn(self, worker_id):
+        pid = os.fork()
+        if pid == 0:
+            # Child: restore default signal handling and serve until killed
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+            os.environ["PREFORK_WORKER_ID"] = str(worker_id)
+            try:
+                server = make_server(self.host, self.port, self.app, fd=self.sock.fileno())
+                print(f"[PREFORK] Worker {worker_id} (pid {os.getpid()}) started.")
+                server.serve_forever()
+            except Exception as e:
+                print(f"[PREFORK] Worker {worker_id} crashed: {e}")
+            finally:
+                os._exit(1)
+        self.children[pid] = worker_id
+
+
+    def _handle_stop(self, signum, frame):
+        self.stopping = True
+
+
+    def _handle_reload(self, signum, frame):
+        self.reloading = True # reloaded by the main loop, not inside the signal handler
+
+
+    def _reload(self):
+        """
+        Reload in the master, then fork a new set of workers and stop the old ones. The old
+        workers are no longer in `children`, so they are not respawned when they exit.
+        """
+        print("[PREFORK] Reloading...")
+        if not self.reload():
+            print("[PREFORK] Reload failed, the workers keep serving.")
+            return
+        gc.collect()
+        gc.freeze()
+        old_children, self.children = self.children, {}
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+        for pid in old_children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+        print(f"[PREFORK] Reloaded, {self.workers} new workers started.")
+
+
+    def _shutdown(self):
+        print("[PREFORK] Stopping workers...")
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+        for pid in list(self.children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.children.clear()
+        self.sock.close()
+        sys.exit(0)
@@ -0,0 +1,140 @@
+import math
+import time
+import pickle
+import logging
+from Utils.checkpoint import SnapshotJournal
+
+
+class RevisitScheduler:
+    """
+    Validators and revisit times of crawled pages, for conditional re-crawls.
+
+    Per URL it keeps the ETag, Last-Modified and content hash of the indexed version, plus
+    how often the page was checked and how often it had changed. The change rate is estimated
+    with the estimator of Cho & Garcia-Molina for pages checked at (roughly) regular intervals:
+
+        rate = -ln((n - X + 0.5) / (n + 0.5)) / mean interval
+
+    with n checks and X detected changes. A page is revisited after about 1 / rate, kept within
+    [min_interval, max_interval]. Pages never seen changing back off exponentially.
+
+    Visits are logged to a journal next to the pickle (see SnapshotJournal), so `save` only
+    rewrites the pickle once the journal has grown as large.
+    """
+
+    def __init__(self, path='data/page_validators.pkl', initial_interval=24 * 3600,
+                 min_interval=3600, max_interval=30 * 24 * 3600):
+        self.path = path
+        self.initial_interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.journal = SnapshotJournal(path)
+        self.pages = self._load()  # url -> dict, see record()
+        self.pages.update(self.journal.replay())
+
+
+    def validators(self, url):
+        """
+        Returns {'etag', 'last_modified', 'content_hash'} of the indexed version of `url`, or None.
+        """
+        entry = self.pages.get(url)
+        if entry is None:
+            return None
+        return {key: entry[key] for key in ('etag', 'last_modified', 'content_hash')}
+
+
+    def record(self, url, changed, depth=None, etag=None, last_modified=None, content_hash=None):
+        """
+        Record a visit of `url`. The first visit only stores validators; later ones also
+        update the change statistics. Validators left as None keep their previous value.
+        """
+        now = time.time()
+        entry = self.pages.get(url)
+        if entry is None:
+            entry = self.pages[url] = {
+                'etag': None, 'last_modified': None, 'content_hash': None, 'depth': depth,
+                'checks': 0, 'changes': 0, 'observed': 0.0,
+                'interval': self.initial_interval,
+            }
+        else:
+            entry['checks'] += 1
+            entry['changes'] += int(changed)
+            entry['observed'] += now - entry['last_visit']
+
+        for key, value in (('etag', etag), ('last_modified', last_modified),
+                           ('content_hash', content_hash), ('depth', depth)):
+            if value is not None:
+                entry[key] = value
+
+        entry['interval'] = self._revisit_interval(entry)
+        entry['last_visit'] = now
+        entry['next_visit'] = now + entry['interval']
+        self.journal.log((url, entry))
+
+
+    def change_rate(self, url):
+        """
+        Estimated changes per second of `url`, or None before its first revisit.
+        """
+        entry = self.pages.get(url)
+        return self._change_rate(entry) if entry is not None else None
+
+
+    def due(self, urls, now=None):
+        """
+        Returns [(overdue ratio, url, depth)] of the given URLs whose revisit time has passed,
+        most overdue first. URLs crawled before validators were stored are always due.
+        """
+        now = time.time() if now is None else now
+        due = []
+        for url in urls:
+            entry = self.pages.get(url)
+            if entry is None:
+                due.append((float('inf'), url, None))
+            elif entry['next_visit'] <= now:
+                due.append(((now - entry['next_visit']) / entry['interval'], url, entry['depth']))
+        due.sort(reverse=True)
+        return due
+
+
+    def save(self, force=False):
+        try:
+            if self.journal.checkpoint(self.pages, len(self.pages), force):
+                logging.info(f"Successfully saved validators of {len(self.pages)} pages to {self.path}.")
+        except Exception as e:
+            logging.error(f"Error saving page validators to {self.path}: {e}.")
+
+
+    def close(self):
+        self.journal.close()
+
+
+    @staticmethod
+    def _change_rate(entry):
+        n, changes = entry['checks'], entry['changes']
+        if n == 0 or entry['observed'] <= 0:
+            return None
+        return -math.log((n - changes + 0.5) / (n + 0.5)) / (entry['observed'] / n)
+
+
+    def _revisit_interval(self, entry):
+        rate = self._change_rate(entry)
+        if not rate:
+            # Not seen changing (yet): back off
+            interval = entry['interval'] * 2 if entry['checks'] else entry['interval']
+        else:
+            interval = 1 / rate
+        return min(max(interval, self.min_interval), self.max_interval)
+
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                pages = pickle.load(f)
+            logging.info(f"Loaded validators of {len(pages)} pages from {self.path}")
+            return pages
+        except FileNotFoundError:
+            logging.warning(f"No previous data found for {self.path}. Initializing empty.")
+        except Exception as e:
+            logging.error(f"Error loading page validators from {self.path}: {e}. Initializing empty.")
+        return {}
@@ -0,0 +1,136 @@
+import os
+import shutil
+import logging
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from Utils.page_archive import PageArchive, read_record
+from Utils.document_log import DocumentLog
+from Utils.html_extractor import extract_page
+from Utils.text_preprocessor import preprocess_text
+from Utils.url_canonicalizer import url_fingerprint
+from Utils.crawl_shared_state import SharedCrawlState, partition_path
+from Utils.checkpoint import atomic_dump
+
+
+def reprocess_page(record):
+    """
+    The document of an archived page, built as the crawler builds it (extraction, language
+    filter, preprocessing), or None if the page would not be indexed.
+    """
+    extracted = extract_page(record['html'])
+    if not extracted['has_body'] or not extracted['content_text'].strip():
+        return None
+    tokens = preprocess_text(extracted['content_text'])
+    if not tokens:
+        return None
+    return {'url': record['url'], 'tokens': tokens, 'title': extracted['title'], 'description': extracted['description']}
+
+
+def _reprocess_batch(locations):
+    # Runs in a worker process: it reads its records itself, so only offsets are sent to it
+    documents = []
+    for path, offset, length in locations:
+        try:
+            record = read_record(path, offset, length)
+            documents.append((record['url'], reprocess_page(record)))
+        except Exception as e:
+            logging.error(f"[REPROCESS] Error reprocessing the record at {path}:{offset}: {e}. Keeping the old document.")
+    return documents
+
+
+def reprocess_archive(archive_path='data/page_archive', document_log_path='data/crawl_log',
+                      crawled_data_path='data/crawled_data.pkl', workers=None, batch_size=64, allocate_id=None):
+    """
+    Rebuild the document log of a crawl from its page archive, in `workers` processes, and export
+    it to `crawled_data_path`. Archived pages keep their doc IDs; pages indexed now but not before
+    get new ones (from `allocate_id(url)` if given), and pages that are not indexed any more are
+    dropped. Documents without an archived page (crawled before the archive existed) are kept.
+    Raises RuntimeError if the crawler is running (it holds the lock of the document log).
+
+    Returns:
+        Counter -> 'indexed', 'dropped' (indexed before, not now), 'skipped' and 'kept' documents
+    """
+    # Holds the lock of the log until the rebuilt one is swapped in, so no crawler starts meanwhile
+    old_log = DocumentLog(document_log_path)
+    archive = PageArchive(archive_path)
+    locations = archive.locations()
+    archive.close()
+
+    doc_ids = {url_fingerprint(doc_info['url']): doc_id for doc_id, doc_info in old_log.iter_records() if 'url' in doc_info}
+    rebuilt_path = f"{document_log_path}.rebuild"
+    shutil.rmtree(rebuilt_path, ignore_errors=True)
+    new_log = DocumentLog(rebuilt_path)
+    new_log.next_id = old_log.next_id # New documents get IDs no old document has
+
+    stats = Counter()
+    reprocessed = set() # Fingerprints of the archived URLs
+    batches = [locations[start:start + batch_size] for start in range(0, len(locations), batch_size)]
+    logging.info(f"[REPROCESS] Reprocessing {len(locations)} archived pages of {archive_path} in {workers or os.cpu_count()} processes.")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for documents in executor.map(_reprocess_batch, batches): # In archive order, so new IDs are deterministic
+            for url, doc_info in documents:
+                fingerprint = url_fingerprint(url)
+                reprocessed.add(fingerprint)
+                doc_id = doc_ids.get(fingerprint)
+                if doc_info is None:
+                    stats["skipped" if doc_id is None else "dropped"] += 1
+                    continue
+                if doc_id is None:
+                    doc_id = doc_ids[fingerprint] = allocate_id(url) if allocate_id is not None else new_log.allocate_id()
+                new_log.append(doc_id, doc_info)
+                stats["indexed"] += 1
+
+    for doc_id, doc_info in old_log.iter_records():
+        if url_fingerprint(doc_info.get('url', '')) not in reprocessed:
+            new_log.append(doc_id, doc_info)
+            stats["kept"] += 1
+    new_log.commit()
+    new_log.export(crawled_data_path)
+    new_log.close()
+
+    # Swap in the rebuilt log
+    old_path = f"{document_log_path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    os.rename(document_log_path, old_path)
+    os.rename(rebuilt_path, document_log_path)
+    old_log.close()
+    shutil.rmtree(old_path)
+    logging.info(f"[REPROCESS] Rebuilt {document_log_path}: {stats['indexed']} documents reprocessed, {stats['dropped']} dropped, "
+                 f"{stats['skipped']} archived pages not indexed, {stats['kept']} documents without an archived page kept.")
+    return stats
+
+
+def reprocess(num_partitions=None, workers=None, archive_path='data/page_archive', document_log_path='data/crawl_log',
+              crawled_data_path='data/crawled_data.pkl', shared_state_path='data/crawl_shared.db'):
+    """
+    Reprocess the archive of a crawl, or with `num_partitions` those of a distributed crawl
+    (see Utils/distributed_crawl.py) and merge their documents into `crawled_data_path`.
+    """
+    if num_partitions is None:
+        return reprocess_archive(archive_path, document_log_path, crawled_data_path, workers=workers)
+
+    shared = SharedCrawlState(shared_state_path) # Doc IDs are unique over all partitions
+    stats = Counter()
+    crawled_data = {}
+    if os.path.isdir(archive_path): # Pages of single-process crawls
+        stats.update(reprocess_archive(archive_path, document_log_path, crawled_data_path,
+                                       workers=workers, allocate_id=shared.allocate_doc_id))
+    for index in range(num_partitions):
+        partition_archive = partition_path(archive_path, index)
+        if not os.path.isdir(partition_archive):
+            logging.warning(f"[REPROCESS] No page archive at {partition_archive}, partition {index} is left as it is.")
+            continue
+        partition_data = partition_path(crawled_data_path, index)
+        stats.update(reprocess_archive(partition_archive, partition_path(document_log_path, index), partition_data,
+                                       workers=workers, allocate_id=shared.allocate_doc_id))
+    shared.close()
+
+    # The merged documents, as DistributedCrawler writes them: those of single-process crawls and of every partition
+    for path in [document_log_path] + [partition_path(document_log_path, index) for index in range(num_partitions)]:
+        if os.path.isdir(path):
+            documents = DocumentLog(path)
+            crawled_data.update(documents.iter_records())
+            documents.close()
+    atomic_dump(crawled_data, crawled_data_path)
+    logging.info(f"[REPROCESS] Merged {num_partitions} partitions: {len(crawled_data)} documents.")
+    return stats
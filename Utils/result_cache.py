@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of final search results with a TTL.
+
+    Entries are keyed by the normalized query tokens plus every option that changes the
+    result (query expansion, sentiment filter). The whole cache is dropped as soon as the
+    index version reported by `version_fn` changes, so results of another index are never served.
+    """
+
+    def __init__(self, max_entries=1024, ttl=600, version_fn=None, version_check_interval=5):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_fn = version_fn
+        self.version_check_interval = version_check_interval
+
+        self._entries = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+        self._version = version_fn() if version_fn else None
+        self._last_version_check = time.time()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+
+    @staticmethod
+    def make_key(query_tokens, use_query_expansion, sentiment_filter):
+        return (tuple(query_tokens), bool(use_query_expansion), sentiment_filter or None)
+
+
+    def get(self, key):
+        """
+        Returns the cached value for `key`, or None on a miss.
+        """
+        self._check_version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "index_version": self._version,
+        }
+
+
+    def _check_version(self):
+        # `version_fn` may be slow (e.g. stat files), so it is called at most every few seconds
+        if self.version_fn is None or time.time() - self._last_version_check < self.version_check_interval:
+            return
+        self._last_version_check = time.time()
+
+        version = self.version_fn()
+        if version != self._version:
+            self._version = version
+            self.clear()
+            self.invalidations += 1
@@ -0,0 +1,67 @@
+import time
+import pickle
+import logging
+from Utils.checkpoint import SnapshotJournal
+
+
+class RobotsCache:
+    """
+    Parsed robots.txt rules and crawl-delays per domain, persisted between crawls.
+
+    Entries older than `ttl` seconds count as missing, so the crawler fetches them again.
+    New entries are logged to a journal next to the pickle until the next snapshot.
+    """
+
+    def __init__(self, path='data/robots_cache.pkl', ttl=24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.journal = SnapshotJournal(path)
+        self.entries = self._load()  # domain -> (RobotFileParser, crawl delay, fetched at)
+        self.entries.update(self.journal.replay())
+
+
+    def get(self, domain):
+        """
+        Returns (RobotFileParser, crawl delay) for `domain`, or None if unknown or expired.
+        """
+        entry = self.entries.get(domain)
+        if entry is None or time.time() - entry[2] > self.ttl:
+            return None
+        return entry[0], entry[1]
+
+
+    def put(self, domain, robot_parser, crawl_delay):
+        self.entries[domain] = (robot_parser, crawl_delay, time.time())
+        self.journal.log((domain, self.entries[domain]))
+
+
+    def save(self, force=False):
+        # Expired entries would be refetched anyway
+        now = time.time()
+        fresh = {domain: entry for domain, entry in self.entries.items() if now - entry[2] <= self.ttl}
+        try:
+            if self.journal.checkpoint(fresh, len(fresh), force):
+                logging.info(f"Successfully saved robots.txt rules of {len(fresh)} domains to {self.path}.")
+        except Exception as e:
+            logging.error(f"Error saving robots.txt cache to {self.path}: {e}.")
+
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                entries = pickle.load(f)
+            logging.info(f"Loaded robots.txt rules of {len(entries)} domains from {self.path}")
+            return entries
+        except FileNotFoundError:
+            logging.warning(f"No previous data found for {self.path}. Initializing empty.")
+        except Exception as e:
+            logging.error(f"Error loading robots.txt cache from {self.path}: {e}. Initializing empty.")
+        return {}
+
+
+    def close(self):
+        self.journal.close()
+
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,116 @@
+import threading
+import time
+import numpy as np
+
+
+class SemanticQueryCache:
+    """
+    Cache of recent rankings looked up by query embedding instead of query string.
+
+    Paraphrased queries ("food and drinks" / "restaurants and bars in tuebingen") miss an
+    exact-match cache but land close to each other in SBERT space. The embeddings of the
+    last `capacity` queries are kept L2-normalized in one matrix (a ring buffer), so a lookup
+    is a single matrix-vector product. A stored ranking is reused when the best cosine
+    similarity reaches `threshold`.
+    """
+
+    def __init__(self, capacity=512, threshold=0.92, ttl=600, version_fn=None, version_check_interval=5):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.version_fn = version_fn
+        self.version_check_interval = version_check_interval
+
+        # Allocated on the first put, once the embedding dimension is known
+        self._embeddings = None
+        self._expires = np.zeros(capacity, dtype=np.float64)  # 0 marks an empty slot
+        self._results = [None] * capacity
+        self._next_slot = 0
+        self._lock = threading.Lock()
+
+        self._version = version_fn() if version_fn else None
+        self._last_version_check = time.time()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+
+    @staticmethod
+    def _normalize(query_emb):
+        query_emb = np.asarray(query_emb, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(query_emb)
+        return query_emb / norm if norm > 0 else query_emb
+
+
+    def lookup(self, query_emb):
+        """
+        Returns the ranking of the most similar cached query, or None if none is similar enough.
+
+        Args:
+            query_emb: array-like -> query embedding (any norm)
+
+        Returns:
+            list of (url, score) or None
+        """
+        self._check_version()
+        with self._lock:
+            if self._embeddings is None:
+                self.misses += 1
+                return None
+
+            similarities = self._embeddings @ self._normalize(query_emb)
+            similarities[self._expires < time.time()] = -np.inf  # empty or expired slots
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return self._results[best]
+
+
+    def put(self, query_emb, results):
+        query_emb = self._normalize(query_emb)
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = np.zeros((self.capacity, len(query_emb)), dtype=np.float32)
+
+            slot = self._next_slot
+            self._embeddings[slot] = query_emb
+            self._results[slot] = results
+            self._expires[slot] = time.time() + self.ttl
+            self._next_slot = (slot + 1) % self.capacity
+
+
+    def clear(self):
+        with self._lock:
+            self._expires[:] = 0
+            self._results = [None] * self.capacity
+            self._next_slot = 0
+
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": int(np.count_nonzero(self._expires >= time.time())),
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+    def _check_version(self):
+        if self.version_fn is None or time.time() - self._last_version_check < self.version_check_interval:
+            return
+        self._last_version_check = time.time()
+
+        version = self.version_fn()
+        if version != self._version:
+            self._version = version
+            self.clear()
+            self.invalidations += 1
@@ -0,0 +1,263 @@
+import os
+import json
+import pickle
+import numpy as np
+
+
+class SharedIndex:
+    """
+    Read-only copy of the search index stored in flat NumPy arrays.
+
+    The pickled index is made of millions of small Python objects (dicts, lists, ints).
+    Forked workers touch their refcounts on every lookup, which un-shares the memory pages
+    and makes every worker pay for its own copy. Here the same data lives in a handful of
+    memory-mapped arrays, so all workers share one copy through the page cache.
+
+    Layout (CSR style):
+        vocab_blob / vocab_offsets: UTF-8 encoded terms sorted by bytes, term i is
+            vocab_blob[vocab_offsets[i]:vocab_offsets[i + 1]]
+        idfs: IDF of term i
+        post_offsets: postings of term i are post_docs[post_offsets[i]:post_offsets[i + 1]]
+        post_docs / post_tfs: sorted doc IDs and term frequencies of each posting
+        pos_offsets / positions: positions of posting j are positions[pos_offsets[j]:pos_offsets[j + 1]]
+        doc_lengths: number of tokens of each doc ID
+        url_blob / url_offsets: URL of each doc ID
+        emb_rows / embeddings: SBERT embedding row of each doc ID (-1 if missing)
+    """
+
+    ARRAYS = (
+        "vocab_blob", "vocab_offsets", "idfs",
+        "post_offsets", "post_docs", "post_tfs",
+        "pos_offsets", "positions",
+        "doc_lengths", "url_blob", "url_offsets",
+        "emb_rows", "embeddings",
+    )
+
+    def __init__(self, path='data/shared_index', mmap=True):
+        self.path = path
+        mmap_mode = 'r' if mmap else None
+
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+
+        for name in self.ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode))
+
+        self.num_terms = len(self.vocab_offsets) - 1
+        self.num_docs = len(self.doc_lengths)
+        self.avgdl = self.meta['avgdl']
+
+
+    @staticmethod
+    def exists(path='data/shared_index'):
+        return os.path.exists(os.path.join(path, 'meta.json'))
+
+
+    @staticmethod
+    def build(crawled_data, pos_index_dict, idfs, doc_embeddings, path='data/shared_index'):
+        """
+        Flatten the pickled index structures into arrays and save them to `path`.
+
+        Args:
+            crawled_data: dict -> {doc_id: {'url': str, 'tokens': list}}
+            pos_index_dict: dict -> {term: [[doc_id, positions], ...]}
+            idfs: dict -> {term: idf}
+            doc_embeddings: dict -> {doc_id: np.array}
+            path: str -> output directory
+        """
+        os.makedirs(path, exist_ok=True)
+        num_docs = max(crawled_data.keys()) + 1 if crawled_data else 0
+
+        # Vocabulary sorted by UTF-8 bytes, so binary search on the blob matches bytes comparison
+        terms = sorted(pos_index_dict.keys(), key=lambda t: t.encode('utf-8'))
+        encoded_terms = [t.encode('utf-8') for t in terms]
+        vocab_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        vocab_offsets[1:] = np.cumsum([len(t) for t in encoded_terms])
+        vocab_blob = np.frombuffer(b''.join(encoded_terms), dtype=np.uint8)
+
+        term_idfs = np.array([idfs.get(t, 0) for t in terms], dtype=np.float64)
+
+        post_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        post_docs, post_tfs, pos_lengths, positions = [], [], [], []
+        for i, term in enumerate(terms):
+            postings = sorted(pos_index_dict[term], key=lambda entry: entry[0])
+            for doc_id, doc_positions in postings:
+                post_docs.append(doc_id)
+                post_tfs.append(len(doc_positions))
+                pos_lengths.append(len(doc_positions))
+                positions.extend(doc_positions)
+            post_offsets[i + 1] = len(post_docs)
+
+        pos_offsets = np.zeros(len(post_docs) + 1, dtype=np.int64)
+        pos_offsets[1:] = np.cumsum(pos_lengths)
+
+        doc_lengths = np.zeros(num_docs, dtype=np.float64)
+        encoded_urls = [b''] * num_docs
+        # As in BM25 over tfs.pkl: documents with a token list (also an empty one) count towards avgdl
+        tokenized_lengths = []
+        for doc_id, doc_data in crawled_data.items():
+            tokens = doc_data.get('tokens')
+            doc_lengths[doc_id] = len(tokens) if tokens else 0
+            if tokens is not None:
+                tokenized_lengths.append(len(tokens))
+            encoded_urls[doc_id] = doc_data.get('url', '').encode('utf-8')
+        url_offsets = np.zeros(num_docs + 1, dtype=np.int64)
+        url_offsets[1:] = np.cumsum([len(u) for u in encoded_urls])
+        url_blob = np.frombuffer(b''.join(encoded_urls), dtype=np.uint8)
+
+        emb_rows = np.full(num_docs, -1, dtype=np.int32)
+        emb_ids = [doc_id for doc_id in sorted(doc_embeddings) if doc_id < num_docs]
+        for row, doc_id in enumerate(emb_ids):
+            emb_rows[doc_id] = row
+        if emb_ids:
+            embeddings = np.stack([np.asarray(doc_embeddings[doc_id], dtype=np.float32) for doc_id in emb_ids])
+        else:
+            embeddings = np.zeros((0, 0), dtype=np.float32)
+
+        arrays = {
+            "vocab_blob": vocab_blob,
+            "vocab_offsets": vocab_offsets,
+            "idfs": term_idfs,
+            "post_offsets": post_offsets,
+            "post_docs": np.array(post_docs, dtype=np.int32),
+            "post_tfs": np.array(post_tfs, dtype=np.int32),
+            "pos_offsets": pos_offsets,
+            "positions": np.array(positions, dtype=np.int32),
+            "doc_lengths": doc_lengths,
+            "url_blob": url_blob,
+            "url_offsets": url_offsets,
+            "emb_rows": emb_rows,
+            "embeddings": embeddings,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f'{name}.npy'), array)
+
+        meta = {
+            "num_terms": len(terms),
+            "num_docs": num_docs,
+            "num_postings": len(post_docs),
+            "avgdl": sum(tokenized_lengths) / len(tokenized_lengths) if tokenized_lengths else 0.0,
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        print(f"[DONE] Saved shared index ({len(terms)} terms, {len(post_docs)} postings) to {path}")
+
+
+    @staticmethod
+    def build_from_files(path='data/shared_index',
+                         path_to_crawled_data='data/crawled_data.pkl',
+                         path_to_posting_lists='data/posting_list.pkl',
+                         path_to_IDFs='data/idfs.pkl',
+                         path_to_embeddings='data/sbert_doc_embeddings.pkl'):
+        """
+        Build the shared index from the pickles written by Indexer.run().
+        """
+        with open(path_to_crawled_data, 'rb') as f:
+            crawled_data = pickle.load(f)
+        with open(path_to_posting_lists, 'rb') as f:
+            _, pos_index_dict = pickle.load(f)
+        with open(path_to_IDFs, 'rb') as f:
+            idfs = pickle.load(f)
+        with open(path_to_embeddings, 'rb') as f:
+            doc_embeddings = pickle.load(f)
+        SharedIndex.build(crawled_data, pos_index_dict, idfs, doc_embeddings, path)
+
+
+    def _term_id(self, term):
+        """
+        Binary search for `term` in the sorted vocabulary. Returns -1 if the term is unknown.
+        """
+        key = term.encode('utf-8')
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self.vocab_blob[self.vocab_offsets[mid]:self.vocab_offsets[mid + 1]].tobytes()
+            if current < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_terms and self.vocab_blob[self.vocab_offsets[lo]:self.vocab_offsets[lo + 1]].tobytes() == key:
+            return lo
+        return -1
+
+
+    def _posting_index(self, term, doc_id):
+        """
+        Returns the global posting index of (term, doc_id), or -1 if the term is not in the doc.
+        """
+        term_id = self._term_id(term)
+        if term_id < 0:
+            return -1
+        start, end = self.post_offsets[term_id], self.post_offsets[term_id + 1]
+        idx = start + np.searchsorted(self.post_docs[start:end], doc_id)
+        if idx < end and self.post_docs[idx] == doc_id:
+            return int(idx)
+        return -1
+
+
+    def get_union_candidates(self, query, max_candidates=None):
+        """
+        Retrieve documents that contain at least one of the query terms.
+        Args:
+            query: list of str -> preprocessed query tokens
+            max_candidates: int -> optional cap; terms are then added rarest first, the
+                            last one only with as many postings as still fit
+
+        Returns:
+            list of int: Candidate document IDs
+        """
+        slices = []
+        for term in query:
+            term_id = self._term_id(term)
+            if term_id >= 0:
+                slices.append(self.post_docs[self.post_offsets[term_id]:self.post_offsets[term_id + 1]])
+        if not slices:
+            return []
+
+        if max_candidates is None:
+            return np.unique(np.concatenate(slices)).tolist()
+
+        slices.sort(key=len)
+        candidates = np.empty(0, dtype=self.post_docs.dtype)
+        for postings in slices:
+            remaining = max_candidates - len(candidates)
+            if remaining <= 0:
+                break
+            # Postings are sorted and unique per term; only documents not yet included use up the budget
+            new_docs = np.setdiff1d(postings, candidates, assume_unique=True)
+            candidates = np.union1d(candidates, new_docs[:remaining])
+        return candidates.tolist()
+
+
+    def positions_of(self, term, doc_id):
+        """
+        Returns the positions of `term` in `doc_id`, or None if the term does not occur in it.
+        """
+        idx = self._posting_index(term, doc_id)
+        if idx < 0:
+            return None
+        return self.positions[self.pos_offsets[idx]:self.pos_offsets[idx + 1]].tolist()
+
+
+    def term_frequency(self, term, doc_id):
+        idx = self._posting_index(term, doc_id)
+        return int(self.post_tfs[idx]) if idx >= 0 else 0
+
+
+    def idf(self, term):
+        term_id = self._term_id(term)
+        return float(self.idfs[term_id]) if term_id >= 0 else 0
+
+
+    def url(self, doc_id):
+        return self.url_blob[self.url_offsets[doc_id]:self.url_offsets[doc_id + 1]].tobytes().decode('utf-8')
+
+
+    def embedding(self, doc_id):
+        """
+        Returns the SBERT embedding of `doc_id`, or None if it has none.
+        """
+        if doc_id >= self.num_docs or self.emb_rows[doc_id] < 0:
+            return None
+        return self.embeddings[self.emb_rows[doc_id]]
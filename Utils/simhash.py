@@ -0,0 +1,107 @@
+import hashlib
+from collections import Counter
+import numpy as np
+
+
+def reference_simhash(text, num_bits=64):
+    """
+    The original SimHash of the crawler: bag of words, MD5 per word (its low 64 bits), term
+    frequencies as weights, one Python loop per bit. Kept to check SimHasher against.
+    """
+    if not text:
+        return 0
+
+    features = {}
+    for word in text.split():
+        feature_hash = int(hashlib.md5(word.encode('utf-8')).hexdigest(), 16)
+        features[feature_hash] = features.get(feature_hash, 0) + 1
+
+    v = [0] * num_bits
+    for feature_hash, weight in features.items():
+        for i in range(num_bits):
+            if (feature_hash >> i) & 1:
+                v[i] += weight
+            else:
+                v[i] -= weight
+
+    simhash_val = 0
+    for i in range(num_bits):
+        if v[i] >= 0:
+            simhash_val |= (1 << i)
+    return simhash_val
+
+
+class SimHasher:
+    """
+    64-bit SimHash of a text, with the bit accumulation done as one NumPy matrix product.
+
+    Features are word shingles (`shingle_size` consecutive words), weighted by their count
+    (`tf_weighting`) or once each. Feature hashes are cached per feature, as most words of a
+    page were seen on earlier pages.
+
+    mode:
+        'md5'   low 64 bits of the MD5 of each feature. With single words and TF weighting this
+                gives exactly the fingerprints of `reference_simhash`, so SimHashes stored by
+                earlier crawls stay comparable.
+        'fast'  64-bit BLAKE2b of each feature, cheaper to compute. Its fingerprints are not
+                comparable with 'md5' ones, so start with an empty simhashes.pkl when switching.
+    """
+
+    def __init__(self, mode='md5', shingle_size=1, tf_weighting=True, cache_size=500_000):
+        if mode not in ('md5', 'fast'):
+            raise ValueError(f"Unknown SimHash mode: {mode}")
+        self.mode = mode
+        self.shingle_size = shingle_size
+        self.tf_weighting = tf_weighting
+        self.cache_size = cache_size
+        self._cache = {}  # feature -> 8 bytes, little-endian hash
+
+
+    def _feature_hash(self, feature):
+        data = feature.encode('utf-8')
+        if self.mode == 'md5':
+            # int(hexdigest, 16) keeps its low 64 bits in the last 8 bytes, big-endian
+            return hashlib.md5(data).digest()[:7:-1]
+        return hashlib.blake2b(data, digest_size=8).digest()
+
+
+    def features(self, text):
+        words = text.split()
+        if self.shingle_size <= 1:
+            return words
+        if len(words) < self.shingle_size:
+            return [" ".join(words)] if words else []
+        return [" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)]
+
+
+    def fingerprint(self, text):
+        if not text:
+            return 0
+        counts = Counter(self.features(text))
+        if not counts:
+            return 0
+
+        cache = self._cache
+        try:
+            digests = b"".join(map(cache.__getitem__, counts))
+        except KeyError:
+            if len(cache) > self.cache_size:
+                cache.clear()
+            parts = []
+            for feature in counts:
+                digest = cache.get(feature) # (another fetch thread may clear the cache meanwhile)
+                if digest is None:
+                    digest = cache[feature] = self._feature_hash(feature)
+                parts.append(digest)
+            digests = b"".join(parts)
+
+        # One row per feature, one column per bit (bit i of the hash in column i)
+        bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+        # Float weights so the product runs in BLAS; sums of counts are exact far beyond any page size
+        if self.tf_weighting:
+            weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        else:
+            weights = np.ones(len(counts), dtype=np.float64)
+        # Sum of +weight for set bits and -weight for unset bits
+        v = 2 * (weights @ bits) - weights.sum()
+        return int.from_bytes(np.packbits(v >= 0, bitorder='little').tobytes(), 'little')
@@ -0,0 +1,93 @@
+from itertools import combinations
+
+
+class SimHashIndex:
+    """
+    Finds SimHashes within Hamming distance `max_distance` of a query without comparing it to
+    every stored hash, with the permuted tables of Manku, Jain & Das Sarma (2007).
+
+    The `num_bits` bits are split into `num_blocks` blocks. Two hashes that differ in at most
+    `max_distance` bits differ in at most that many blocks, so they agree exactly on at least
+    `num_blocks - max_distance` blocks. There is one table per choice of such blocks, keyed by
+    the bits of the chosen blocks; a query only has to be compared with the hashes sharing its
+    key in some table. (Keying on the masked bits is the hash-table form of the paper's sorted
+    tables of permuted hashes, whose leading bits are the chosen blocks.)
+
+    With the default num_blocks = max_distance + 1 there are max_distance + 1 tables keyed on
+    one block each (16 bits for 64-bit hashes with distance 3). More blocks mean longer keys,
+    so fewer candidates per probe, at the cost of more tables: 6 blocks with distance 3 give
+    20 tables keyed on about 32 bits, which suits billions of hashes.
+    """
+
+    def __init__(self, max_distance=3, hashes=(), num_bits=64, num_blocks=None):
+        self.max_distance = max_distance
+        self.num_bits = num_bits
+        num_blocks = num_blocks or max_distance + 1
+        if num_blocks <= max_distance:
+            raise ValueError("num_blocks must be larger than max_distance")
+
+        # Masks of the blocks, as evenly sized as possible
+        block_masks = []
+        start = 0
+        for index in range(num_blocks):
+            size = num_bits // num_blocks + (1 if index < num_bits % num_blocks else 0)
+            block_masks.append(((1 << size) - 1) << start)
+            start += size
+
+        self.table_masks = []
+        for chosen in combinations(block_masks, num_blocks - max_distance):
+            mask = 0
+            for block_mask in chosen:
+                mask |= block_mask
+            self.table_masks.append(mask)
+        self.tables = [{} for _ in self.table_masks]  # key (masked hash) -> list of hashes
+        self.hashes = set()
+
+        for simhash in hashes:
+            self.add(simhash)
+
+
+    def add(self, simhash):
+        if simhash in self.hashes:
+            return
+        self.hashes.add(simhash)
+        for mask, table in zip(self.table_masks, self.tables):
+            table.setdefault(simhash & mask, []).append(simhash)
+
+
+    def update(self, hashes):
+        for simhash in hashes:
+            self.add(simhash)
+
+
+    def find(self, simhash):
+        """
+        Returns a stored hash within `max_distance` of `simhash`, or None.
+        """
+        if simhash in self.hashes:
+            return simhash
+        for mask, table in zip(self.table_masks, self.tables):
+            for candidate in table.get(simhash & mask, ()):
+                if (candidate ^ simhash).bit_count() <= self.max_distance:
+                    return candidate
+        return None
+
+
+    def near(self, simhash):
+        """
+        Returns all stored hashes within `max_distance` of `simhash`.
+        """
+        found = set()
+        for mask, table in zip(self.table_masks, self.tables):
+            for candidate in table.get(simhash & mask, ()):
+                if candidate not in found and (candidate ^ simhash).bit_count() <= self.max_distance:
+                    found.add(candidate)
+        return found
+
+
+    def __contains__(self, simhash):
+        return simhash in self.hashes
+
+
+    def __len__(self):
+        return len(self.hashes)
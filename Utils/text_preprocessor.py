@@ -42,11 +42,12 @@ def get_wordnet_pos(tag):
 def preprocess_text(text: str, isQuery=False):
     
     if not isQuery:
-        # We are processing a BeautifulSoup object
-        # Extract visible text (from the original soup, not the one modified for SimHash)
-        for tag in text(["script", "style"]):
-            tag.decompose()
-        text = text.get_text(separator=" ")
+        # We are processing a BeautifulSoup object or text already extracted from a page
+        if not isinstance(text, str):
+            # Extract visible text (from the original soup, not the one modified for SimHash)
+            for tag in text(["script", "style"]):
+                tag.decompose()
+            text = text.get_text(separator=" ")
 
         # Language filter
         langs = []
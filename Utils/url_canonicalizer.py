@@ -0,0 +1,131 @@
+import re
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, unquote
+
+
+# Query parameters that only track where a click came from; names ending in * are prefixes
+DEFAULT_TRACKING_PARAMS = ('utm_*', 'srsltid', 'gclid', 'fbclid', 'msclkid', 'dclid', 'yclid', 'igshid',
+                           'mc_cid', 'mc_eid', '_ga', '_gl')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+_PERCENT_ESCAPE = re.compile(r'%[0-9a-fA-F]{2}')
+_UNRESERVED = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+
+
+def url_fingerprint(url):
+    """
+    64-bit fingerprint of a URL.
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def _normalize_escape(match):
+    # %7e -> ~ (unreserved characters never need escaping), %2f -> %2F
+    char = chr(int(match.group(0)[1:], 16))
+    return char if char in _UNRESERVED else match.group(0).upper()
+
+
+def _remove_dot_segments(path):
+    """
+    '/a/./b/../c' -> '/a/c' (RFC 3986, 5.2.4)
+    """
+    output = []
+    for segment in path.split('/'):
+        if segment == '..':
+            if len(output) > 1:
+                output.pop()
+        elif segment != '.':
+            output.append(segment)
+    if path.endswith(('/.', '/..')):
+        output.append('')
+    return '/'.join(output) or '/'
+
+
+class UrlCanonicalizer:
+    """
+    Maps the variants of a URL to one canonical form, so the crawler fetches each page once.
+
+    Always: the scheme and host are lowercased, the default port and the fragment dropped,
+    and an empty path becomes '/'. Configurable rules:
+
+        remove_params         query parameters to drop (tracking parameters by default);
+                              names ending in * are prefixes, matched case-insensitively
+        sort_query            order the remaining parameters by name
+        strip_trailing_slash  '/a/b/' -> '/a/b' (the root path stays '/')
+        normalize_percent     uppercase percent-escapes, unescape unreserved characters
+        remove_dot_segments   '/a/./b/../c' -> '/a/c'
+
+    The rules are compiled once (the parameter names into one regex), and results are cached
+    per raw URL, as the same links appear on many pages of a site.
+    """
+
+    def __init__(self, remove_params=DEFAULT_TRACKING_PARAMS, sort_query=True, strip_trailing_slash=True,
+                 normalize_percent=True, remove_dot_segments=True, cache_size=200_000):
+        self.remove_params = tuple(remove_params)
+        self.sort_query = sort_query
+        self.strip_trailing_slash = strip_trailing_slash
+        self.normalize_percent = normalize_percent
+        self.remove_dot_segments = remove_dot_segments
+        self.cache_size = cache_size
+
+        patterns = [re.escape(name[:-1]) + '.*' if name.endswith('*') else re.escape(name) for name in self.remove_params]
+        self._removed_param = re.compile('(?:' + '|'.join(patterns) + ')$', re.IGNORECASE).match if patterns else None
+        self._cache = {}
+
+
+    def canonicalize(self, url):
+        """
+        Returns the canonical form of an absolute URL. Raises ValueError for malformed ones
+        (e.g. an invalid port).
+        """
+        canonical = self._cache.get(url)
+        if canonical is None:
+            if len(self._cache) > self.cache_size:
+                self._cache.clear()
+            canonical = self._cache[url] = self._canonicalize(url)
+        return canonical
+
+
+    def fingerprint(self, url):
+        """
+        64-bit fingerprint of the canonical form of `url`.
+        """
+        return url_fingerprint(self.canonicalize(url))
+
+
+    def _canonicalize(self, url):
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        netloc = parts.netloc
+        if netloc:
+            host = (parts.hostname or '').rstrip('.')
+            if ':' in host:
+                host = f'[{host}]' # IPv6
+            port = parts.port
+            if port is not None and port != DEFAULT_PORTS.get(scheme):
+                host = f'{host}:{port}'
+            userinfo = netloc.rpartition('@')[0]
+            netloc = f'{userinfo}@{host}' if userinfo else host
+
+        path = parts.path
+        query = parts.query
+        if self.normalize_percent:
+            path = _PERCENT_ESCAPE.sub(_normalize_escape, path)
+            query = _PERCENT_ESCAPE.sub(_normalize_escape, query)
+        if netloc:
+            if self.remove_dot_segments and '.' in path:
+                path = _remove_dot_segments(path)
+            if not path:
+                path = '/'
+            elif self.strip_trailing_slash and len(path) > 1 and path.endswith('/'):
+                path = path.rstrip('/') or '/'
+
+        if query:
+            params = [param for param in query.split('&') if param]
+            if self._removed_param is not None:
+                params = [param for param in params if not self._removed_param(unquote(param.partition('=')[0]))]
+            if self.sort_query:
+                params.sort(key=lambda param: param.partition('=')[0]) # stable: repeated names keep their order
+            query = '&'.join(params)
+
+        return urlunsplit((scheme, netloc, path, query, ''))
@@ -0,0 +1,96 @@
+import re
+import threading
+from collections import Counter
+from urllib.parse import urlsplit
+
+
+_END = None  # key of the rule stored in a trie node where a rule ends
+
+
+class UrlFilter:
+    """
+    Blacklist rules for URLs, compiled once and evaluated in one call per URL:
+
+        endings   file types (".pdf"), in a trie of reversed strings. They are matched against
+                  the lowercased path, and the path with its query ("/get?file=a.pdf"), so
+                  "/a.pdf?download=1" is caught but the host "docs.pdf.example" is not.
+        tlds      top-level domains (".ru"), matched against the host only.
+        domains   blocked domains, in a trie of reversed host labels: "google.com" also blocks
+                  "maps.google.com", but not "notgoogle.com".
+        patterns  optional regular expressions, searched in the URL, compiled into one regex.
+
+    `match` returns the name of the rule that fired (e.g. "domain:facebook.com"), and
+    `counts` how often each rule fired.
+    """
+
+    def __init__(self, endings=(), tlds=(), domains=(), patterns=()):
+        self._endings = {}
+        for ending in endings:
+            node = self._endings
+            for char in reversed(ending.lower()):
+                node = node.setdefault(char, {})
+            node[_END] = f"ending:{ending}"
+
+        # A TLD is a domain rule of one label
+        self._domains = {}
+        for rule in [f"tld:{tld}" for tld in tlds] + [f"domain:{domain}" for domain in domains]:
+            node = self._domains
+            for label in reversed(rule.partition(':')[2].lower().strip('.').split('.')):
+                node = node.setdefault(label, {})
+            node[_END] = rule
+
+        self.patterns = list(patterns)
+        self._pattern = None
+        if self.patterns:
+            # One named group per rule, so the match tells which rule fired
+            self._pattern = re.compile("|".join(f"(?P<p{index}>{pattern})" for index, pattern in enumerate(self.patterns)))
+
+        self.counts = Counter()  # rule -> number of URLs it rejected
+        self._lock = threading.Lock()  # links are filtered in the fetch threads
+
+
+    def match(self, url):
+        """
+        Returns the name of the first rule matching `url`, or None if the URL passes.
+        """
+        lowered = url.lower()
+        try:
+            parts = urlsplit(lowered)
+            host = parts.hostname or ""
+        except ValueError:
+            parts = None
+        if parts is None:
+            rule = self._match_ending(lowered)
+        else:
+            rule = (self._match_ending(f"{parts.path}?{parts.query}" if parts.query else parts.path)
+                    or self._match_ending(parts.path) or self._match_domain(host))
+        if rule is None and self._pattern is not None:
+            found = self._pattern.search(url)
+            if found:
+                rule = f"pattern:{self.patterns[int(found.lastgroup[1:])]}"
+        if rule is not None:
+            with self._lock:
+                self.counts[rule] += 1
+        return rule
+
+
+    def _match_ending(self, text):
+        node = self._endings
+        for index in range(len(text) - 1, -1, -1):
+            node = node.get(text[index])
+            if node is None:
+                return None
+            if _END in node:
+                return node[_END]
+        return None
+
+
+    def _match_domain(self, host):
+        node = self._domains
+        for label in reversed(host.split('.')):
+            node = node.get(label)
+            if node is None:
+                return None
+            if _END in node:
+                return node[_END]
+        return None
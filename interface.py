@@ -1,15 +1,37 @@
-from flask import Flask, render_template, request
+from flask import Flask, render_template, request, jsonify
 import requests
 from bs4 import BeautifulSoup
-from main import search, init_search
+from main import search, init_search, normalize_query
+from Utils.cursor_cache import RankedListCache
+from Utils.result_cache import ResultCache
+from Utils.deadline import Deadline
+from Utils.prefork import PreforkServer, memory_report
+from Utils import metrics
+from flask import g, Response
+import contextvars
 # from nltk.tokenize import word_tokenize
 import time
 import re
 from concurrent.futures import ThreadPoolExecutor
 import random
+import math
+import os
+import signal
+import argparse
 
 app = Flask(__name__)
 
+# Full ranked lists of recent API queries, so later pages skip the whole search pipeline
+ranked_list_cache = RankedListCache(ttl=300, max_entries=256)
+MAX_PAGE_SIZE = 100
+
+# Time budget of one search request in seconds; optional stages are skipped when it runs low
+DEFAULT_DEADLINE = 2.0
+MAX_DEADLINE = 10.0
+
+# Final results of repeated queries, created with the models (it needs the index version)
+result_cache = None
+
 # ---------------- Helper Functions ----------------
 
 def document_sentiment_analysis_binary(data: list[str], pipeline, seed=0, random_aprox=False):
@@ -109,20 +131,25 @@ def extract_description_from_soup(soup):
 
     return "No description available."
 
-def get_document_data(url, pipeline, session):
-    try:
-        response = session.get(url, timeout=0.5)
-        response.raise_for_status()
-    except requests.RequestException:
-        return None
+def get_document_data(url, pipeline, session, run_sentiment=True):
+    with metrics.stage("doc_store"):
+        try:
+            response = session.get(url, timeout=0.5)
+            response.raise_for_status()
+        except requests.RequestException:
+            return None
 
-    soup = BeautifulSoup(response.text, 'html.parser')
+        soup = BeautifulSoup(response.text, 'html.parser')
 
-    title = extract_title_from_soup(soup)
-    description = extract_description_from_soup(soup)
+        title = extract_title_from_soup(soup)
+        description = extract_description_from_soup(soup)
 
-    text = preprocess_text(soup.get_text(separator=" ", strip=True))
-    sentiment_analy = document_sentiment_analysis_binary(text, pipeline, seed=0, random_aprox=False)
+    if run_sentiment:
+        with metrics.stage("sentiment"):
+            text = preprocess_text(soup.get_text(separator=" ", strip=True))
+            sentiment_analy = document_sentiment_analysis_binary(text, pipeline, seed=0, random_aprox=False)
+    else:
+        sentiment_analy = {"label": "unknown", "score": 0}
 
     return {
         "title": str(title),
@@ -133,35 +160,53 @@ def get_document_data(url, pipeline, session):
     }
 
 
-def get_results(query, sentiment_pipeline, indexer, hybrid_model, sentiment_filter=None):
+def get_results(query, sentiment_pipeline, indexer, hybrid_model, sentiment_filter=None, deadline=None):
+    """
+    Returns (data, search_duration, skipped_stages) for the top 10 results of `query`.
+    """
     start_time = time.time()
-    results_urls = search(query, indexer, hybrid_model, use_query_expansion=True)
+    if deadline is None:
+        deadline = Deadline(DEFAULT_DEADLINE)
+
+    query_tokens = normalize_query(query)
+    cache_key = ResultCache.make_key(query_tokens, True, sentiment_filter)
+    if result_cache is not None:
+        cached_data = result_cache.get(cache_key)
+        metrics.registry.inc("search_cache_lookups_total", {"cache": "exact", "result": "hit" if cached_data is not None else "miss"},
+                             help_text="Cache lookups by cache and result.")
+        if cached_data is not None:
+            return cached_data, round(time.time() - start_time, 2), []
+
+    results_urls = search(query, indexer, hybrid_model, use_query_expansion=True, query_tokens=query_tokens, deadline=deadline)
+    run_sentiment = deadline.allows("sentiment")
 
-    start_recrawling_time = time.time()
     # data = [get_document_data(url, sentiment_pipeline) for (url, score) in results_urls[:10]]
 
     session = requests.Session()
 
     def process_url(pair):
         url, _ = pair
-        return get_document_data(url, sentiment_pipeline, session)
+        return get_document_data(url, sentiment_pipeline, session, run_sentiment)
 
     with ThreadPoolExecutor(max_workers=10) as executor:
-        data = list(executor.map(process_url, results_urls[:10]))
+        # Run each fetch in a copy of this context so the stage timings land in the request trace
+        futures = [executor.submit(contextvars.copy_context().run, process_url, pair) for pair in results_urls[:10]]
+        data = [future.result() for future in futures]
 
     # Remove None results (failed requests)
     data = [result for result in data if result is not None]
-    end_recrawling_time = time.time()
-    print(f"Re-crawling took {end_recrawling_time - start_recrawling_time:.2f} seconds")
-    # sentiment filter
-    if sentiment_filter:
+    # sentiment filter (not applicable when sentiment was skipped for the deadline)
+    if sentiment_filter and run_sentiment:
         data = [result for result in data if result['sentiment'] == sentiment_filter]
 
+    # Degraded results are not cached, the next identical query gets a full run
+    if result_cache is not None and not deadline.skipped:
+        result_cache.put(cache_key, data)
+
     end_time = time.time()  # End timer
     search_duration = round(end_time - start_time,2)
-    print(f"Search took {search_duration:.2f} seconds")  # Print or log the duration
 
-    return data, search_duration
+    return data, search_duration, deadline.skipped
 
 # ---------------- Routes ----------------
 
@@ -170,36 +215,239 @@ bm25_model = None
 hybrid_model = None
 sentiment_pipeline= None
 
-with app.app_context():
-    app.config["search_models"] = init_search()
+
+def set_search_models(models):
+    global result_cache
+    app.config["search_models"] = models
+    indexer = models[0]
+    result_cache = ResultCache(max_entries=1024, ttl=600, version_fn=indexer.index_version)
     print("Search engine initialized with models.")
 
 
+def get_search_models():
+    # Normally loaded in __main__ before serving (and before forking workers),
+    # loaded lazily when the app is imported by another WSGI server
+    if "search_models" not in app.config:
+        set_search_models(init_search(**app.config.get("search_options", {})))
+    return app.config["search_models"]
+
+
+def reload_search_models():
+    """
+    Load the index and models again, e.g. after a re-index, and serve them from now on.
+    Cached rankings and cursors are keyed by the index version, so those of the old index
+    are not served any more. Returns False (and keeps the old models) if loading fails.
+    """
+    try:
+        models = init_search(**app.config.get("search_options", {}))
+    except Exception as e:
+        print(f"Reloading the search models failed, keeping the loaded ones: {e}")
+        return False
+    set_search_models(models)
+    return True
+
+
+def _traced(wsgi_app):
+    # The trace starts before Flask sees the request, so its total covers routing and the hooks too
+    def traced_app(environ, start_response):
+        metrics.start_trace()
+        return wsgi_app(environ, start_response)
+    return traced_app
+
+
+app.wsgi_app = _traced(app.wsgi_app)
+
+
+@app.before_request
+def start_request_trace():
+    g.trace = metrics.current_trace() or metrics.start_trace()
+
+
+@app.after_request
+def finish_request_trace(response):
+    trace = getattr(g, "trace", None)
+    if trace is None:
+        return response
+
+    total = trace.finish() # the same wall-clock total for the histogram and the header
+    endpoint = request.endpoint or "unknown"
+    metrics.registry.inc("search_requests_total", {"endpoint": endpoint, "status": response.status_code},
+                         help_text="HTTP requests by endpoint and status code.")
+    metrics.registry.observe("search_request_duration_seconds", total, {"endpoint": endpoint},
+                             help_text="End-to-end request latency by endpoint.")
+
+    # Per-request stage breakdown, only on demand
+    if request.args.get("debug") == "1" or request.headers.get("X-Debug-Trace") == "1":
+        response.headers["Server-Timing"] = trace.header_value()
+    return response
+
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
 
     # Initialize models
-    indexer, hybrid_model, sentiment_pipeline = app.config["search_models"]
+    indexer, hybrid_model, sentiment_pipeline = get_search_models()
 
     query = ""
     results = []
     sentiment_filter = ""
     search_duration = ""
+    skipped_stages = []
     if request.method == 'POST':
         query = request.form.get('query')
         sentiment_filter = request.form.get('sentiment_filter')
         if query:
             if sentiment_filter:
-                data, search_duration = get_results(query, sentiment_pipeline, indexer, hybrid_model, sentiment_filter)
+                data, search_duration, skipped_stages = get_results(query, sentiment_pipeline, indexer, hybrid_model, sentiment_filter)
             else:
-                data, search_duration = get_results(query, sentiment_pipeline, indexer, hybrid_model)
+                data, search_duration, skipped_stages = get_results(query, sentiment_pipeline, indexer, hybrid_model)
             results = data
 
-    return render_template('index.html', query=query, results=results, sentiment_filter=sentiment_filter, search_duration=search_duration)
+    return render_template('index.html', query=query, results=results, sentiment_filter=sentiment_filter,
+                           search_duration=search_duration, skipped_stages=skipped_stages)
+
+
+@app.route('/api/search', methods=['GET'])
+def api_search():
+    """
+    Paginated JSON search.
+
+    Query parameters:
+        q: the query text (needed unless a valid cursor is given)
+        page: 1-based page number (default 1)
+        size: results per page (default 10, max MAX_PAGE_SIZE)
+        cursor: opaque cursor returned by a previous call for the same query (409 if `q` is another query)
+        budget_ms: time budget of the search in milliseconds (default DEFAULT_DEADLINE, max MAX_DEADLINE)
+    """
+    indexer, hybrid_model, _ = get_search_models()
+
+    query = request.args.get('q', '').strip()
+    cursor = request.args.get('cursor')
+    try:
+        page = int(request.args.get('page', 1))
+        size = int(request.args.get('size', 10))
+        budget = float(request.args.get('budget_ms', DEFAULT_DEADLINE * 1000)) / 1000
+    except ValueError:
+        return jsonify({"error": "page, size and budget_ms must be numbers"}), 400
+    if page < 1 or size < 1 or size > MAX_PAGE_SIZE:
+        return jsonify({"error": f"page must be >= 1 and size between 1 and {MAX_PAGE_SIZE}"}), 400
+    if not (math.isfinite(budget) and 0 < budget <= MAX_DEADLINE):
+        return jsonify({"error": f"budget_ms must be above 0 and at most {MAX_DEADLINE * 1000:.0f}"}), 400
+
+    start_time = time.time()
+    deadline = Deadline(budget)
+    # Cached rankings and cursors belong to one index version
+    version = indexer.index_version()
+    query_tokens = normalize_query(query) if query else None
+    key = (tuple(query_tokens), True, version) if query else None
+    ranked = None
+    skipped_stages = []
+    if cursor:
+        entry = ranked_list_cache.entry(cursor)
+        if entry is not None and entry[0][-1] != version:
+            entry = None # Ranked on another index, treated as expired
+        if entry is not None:
+            if key is not None and entry[0] != key:
+                return jsonify({"error": "cursor belongs to a different query, drop it or resend that query"}), 409
+            ranked, skipped_stages = entry[1], entry[2]
+    cached = ranked is not None
+
+    if ranked is None:
+        if not query:
+            # Either no query at all, or the cursor expired and we cannot rerun the search
+            if cursor:
+                return jsonify({"error": "cursor expired or unknown, resend the query"}), 410
+            return jsonify({"error": "missing query parameter 'q'"}), 400
+
+        cursor = ranked_list_cache.lookup(key)
+        if cursor is not None:
+            ranked = ranked_list_cache.get(cursor)
+            cached = ranked is not None
+
+        if ranked is None:
+            ranked = search(query, indexer, hybrid_model, use_query_expansion=True, query_tokens=query_tokens, deadline=deadline)
+            # A ranking cut short by the deadline keeps its cursor for paging, but is not reused for new queries
+            skipped_stages = deadline.skipped
+            cursor = ranked_list_cache.put(key, ranked, skipped=skipped_stages)
+
+    total = len(ranked)
+    offset = (page - 1) * size
+    page_results = [
+        {"rank": offset + i + 1, "url": url, "score": float(score)}
+        for i, (url, score) in enumerate(ranked[offset:offset + size])
+    ]
+
+    return jsonify({
+        "query": query,
+        "cursor": cursor,
+        "page": page,
+        "size": size,
+        "total": total,
+        "pages": math.ceil(total / size),
+        "cached": cached,
+        "skipped_stages": skipped_stages,
+        "search_duration": round(time.time() - start_time, 6),
+        "results": page_results,
+    })
+
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    _, hybrid_model, _ = get_search_models()
+    semantic_cache = hybrid_model.semantic_cache
+    return jsonify({
+        "results": result_cache.stats(),
+        "semantic": semantic_cache.stats() if semantic_cache is not None else None,
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Cache state is exported as gauges at scrape time
+    if result_cache is not None:
+        stats = result_cache.stats()
+        metrics.registry.set("search_cache_entries", stats["size"], {"cache": "exact"},
+                             help_text="Entries currently held by each cache.")
+        metrics.registry.set("search_cache_hit_ratio", stats["hit_rate"], {"cache": "exact"},
+                             help_text="Hit ratio of each cache since start.")
+        _, hybrid_model, _ = get_search_models()
+        if hybrid_model.semantic_cache is not None:
+            stats = hybrid_model.semantic_cache.stats()
+            metrics.registry.set("search_cache_entries", stats["size"], {"cache": "semantic"})
+            metrics.registry.set("search_cache_hit_ratio", stats["hit_rate"], {"cache": "semantic"})
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/debug/memory', methods=['GET'])
+def debug_memory():
+    return jsonify({
+        "pid": os.getpid(),
+        "worker": os.environ.get("PREFORK_WORKER_ID"),
+        "memory_kb": memory_report(),
+    })
 
 
 # ---------------- Run App ----------------
 
 if __name__ == '__main__':
 
-    app.run(debug=False)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the search website.")
+    parser.add_argument("--workers", type=int, default=0, help="Number of pre-forked worker processes (0 = single process).")
+    parser.add_argument("--shared-index", action="store_true", help="Serve from the memory-mapped array index instead of the pickles.")
+    parser.add_argument("--semantic-cache-threshold", type=float, default=None,
+                        help="Enable the semantic cache: cosine similarity needed to reuse a cached ranking of a similar query (e.g. 0.92). Off by default.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    # Load index and models once, in the master, so forked workers share them
+    app.config["search_options"] = dict(use_shared_index=args.shared_index or args.workers > 0,
+                                        semantic_cache_threshold=args.semantic_cache_threshold)
+    set_search_models(init_search(**app.config["search_options"]))
+
+    # SIGHUP loads the index again (and restarts the workers)
+    if args.workers > 0:
+        PreforkServer(app, host=args.host, port=args.port, workers=args.workers, reload=reload_search_models).serve()
+    else:
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload_search_models())
+        app.run(host=args.host, port=args.port, debug=False)
\ No newline at end of file
@@ -1,52 +1,87 @@
 from Utils.legal_crawling import OfflineCrawler
+from Utils.distributed_crawl import DistributedCrawler
 from Utils.indexer import Indexer
 from Utils.hybrid_retrieval import HybridRetrieval
 from Utils.query_expander import QueryExpander
 from Utils.text_preprocessor import preprocess_text
-import time
+from Utils.shared_index import SharedIndex
+from Utils import metrics
 from transformers import pipeline
 
+def normalize_query(query_text: str):
+    """
+    Returns the preprocessed query tokens, which are used as the canonical form of a query.
+    """
+    with metrics.stage("preprocess"):
+        return preprocess_text(query_text, isQuery=True)
+
+
 def search(query_text: str, 
            indexer: Indexer, 
            hybrid_model:HybridRetrieval, 
-           use_query_expansion=True):
+           use_query_expansion=True,
+           query_tokens=None,
+           deadline=None,
+           max_degraded_candidates=1000):
+    """
+    Run the search pipeline. With a `deadline` (Utils.deadline.Deadline), optional stages are
+    skipped as the budget runs low; they are listed in `deadline.skipped` afterwards.
+    """
     
-    start = time.time()
-    query_tokens = preprocess_text(query_text, isQuery=True)
-    end = time.time()
-    print("Time to preprocess query: ", end - start)
+    if query_tokens is None:
+        query_tokens = normalize_query(query_text)
+
+    def allows(stage):
+        return deadline is None or deadline.allows(stage)
     
-    start = time.time()
-    if use_query_expansion:
-        print("\nExpanding query...\n")
-        expander = QueryExpander(max_synonyms=2, synonym_weight=0.25, original_weight=1.0)
-        weighted_tokens = expander.expand(query_tokens)
-        print("Expanded query tokens with weights:", weighted_tokens)
-    else:
-        weighted_tokens = [(token, 1.0) for token in query_tokens]
+    with metrics.stage("expand"):
+        if use_query_expansion and allows("expansion"):
+            expander = QueryExpander(max_synonyms=2, synonym_weight=0.25, original_weight=1.0)
+            weighted_tokens = expander.expand(query_tokens)
+        else:
+            weighted_tokens = [(token, 1.0) for token in query_tokens]
 
-    end = time.time()
-    print("Time to expand query: ", end - start)
+    # Paraphrases of a recent query reuse its ranking and skip candidate generation and ranking.
+    # Encoding is part of dense re-ranking, so it is skipped with it.
+    query_emb = None
+    if allows("dense_rerank"):
+        query_emb = hybrid_model.encode_query(weighted_tokens)
+        if hybrid_model.semantic_cache is not None:
+            cached_results = hybrid_model.semantic_cache.lookup(query_emb.cpu().numpy())
+            if cached_results is not None:
+                metrics.registry.inc("search_cache_lookups_total", {"cache": "semantic", "result": "hit"},
+                                     help_text="Cache lookups by cache and result.")
+                return cached_results
+            metrics.registry.inc("search_cache_lookups_total", {"cache": "semantic", "result": "miss"},
+                                 help_text="Cache lookups by cache and result.")
 
-    original_terms = [term for term, weight in weighted_tokens if weight >= 1.0]
-    candidates_ids = indexer.get_union_candidates(original_terms)
+    with metrics.stage("candidate_union"):
+        original_terms = [term for term, weight in weighted_tokens if weight >= 1.0]
+        max_candidates = None if allows("candidates") else max_degraded_candidates
+        candidates_ids = indexer.get_union_candidates(original_terms, max_candidates=max_candidates)
 
-    print("candidate size = ", len(candidates_ids))
+    metrics.registry.observe("search_candidates", len(candidates_ids),
+                             help_text="Size of the union candidate set per query.",
+                             buckets=(10, 100, 1000, 10000, 100000))
 
     if not candidates_ids:
         return []
     
-    print("\nUsing hybrid model...\n")
-    start = time.time()
-    results = hybrid_model.retrieve(weighted_tokens, candidates_ids)
-    end = time.time()
-    print("Time to rank: ", end - start)
+    results = hybrid_model.retrieve(weighted_tokens, candidates_ids, query_emb=query_emb, deadline=deadline)
+
+    # Degraded rankings are not reused for other queries
+    if hybrid_model.semantic_cache is not None and query_emb is not None and (deadline is None or not deadline.skipped):
+        hybrid_model.semantic_cache.put(query_emb.cpu().numpy(), results)
 
     return results
 
-def initialize_crawling(seeds):
+def initialize_crawling(seeds, num_workers=1):
     print("Crawling...")
-    crawler = OfflineCrawler(seeds, max_depth=4)
+    if num_workers > 1:
+        # One process per partition of the hosts, see Utils/distributed_crawl.py
+        crawler = DistributedCrawler(seeds, num_workers=num_workers, max_depth=4)
+    else:
+        crawler = OfflineCrawler(seeds, max_depth=4)
     crawler.run()
     
     #print("Indexing...")
@@ -369,9 +404,17 @@ def initialize_crawling(seeds):
                     
 
 
-def init_search():
-    indexer = Indexer()
-    hybrid_model = HybridRetrieval()
+def init_search(use_shared_index=False, semantic_cache_threshold=None):
+    shared_index = None
+    if use_shared_index:
+        # Array-based, memory-mapped index: shared between forked workers instead of copied
+        if not SharedIndex.exists():
+            print("Building shared index from pickles...")
+            SharedIndex.build_from_files()
+        shared_index = SharedIndex()
+
+    hybrid_model = HybridRetrieval(shared_index=shared_index, semantic_cache_threshold=semantic_cache_threshold)
+    indexer = hybrid_model.indexer
     sentiment_pipeline = pipeline("text-classification", model="GroNLP/mdebertav3-subjectivity-english", device=-1)
 
     return indexer, hybrid_model, sentiment_pipeline
\ No newline at end of file
@@ -0,0 +1,22 @@
+# Rebuilds the crawled documents from the archived pages (data/page_archive), e.g. after changing the
+# preprocessing, the language filter or the snippet extraction, without crawling again.
+import argparse
+import logging
+from Utils.reprocess import reprocess
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog="reprocess.py",
+        description="Rebuild data/crawled_data.pkl from the page archive of the crawler. Refuses to run while the crawler is running.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU).")
+    parser.add_argument("--partitions", type=int, default=None,
+                        help="Number of crawler processes of a distributed crawl, to reprocess all their archives.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    try:
+        stats = reprocess(num_partitions=args.partitions, workers=args.workers)
+    except RuntimeError as e:
+        parser.exit(1, f"reprocess.py: {e}\n")
+    print(f"Reprocessed {stats['indexed']} documents, dropped {stats['dropped']}, kept {stats['kept']} without an archived page.")
@@ -0,0 +1,91 @@
+import pytest
+
+pytest.importorskip("transformers") # interface.py loads the search stack (main.py)
+import interface
+
+
+class FakeIndexer:
+    version = 1
+
+    def index_version(self):
+        return self.version
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(interface, "get_search_models", lambda: (FakeIndexer(), None, None))
+    monkeypatch.setattr(interface, "normalize_query", lambda query: query.lower().split())
+    monkeypatch.setattr(interface, "ranked_list_cache", interface.RankedListCache(ttl=300, max_entries=16))
+    return interface.app.test_client()
+
+
+@pytest.mark.parametrize("budget_ms", ["0", "-100", "nan", "inf", str(interface.MAX_DEADLINE * 1000 + 1)])
+def test_budget_out_of_range_is_rejected(client, monkeypatch, budget_ms):
+    monkeypatch.setattr(interface, "search", lambda *args, **kwargs: pytest.fail("searched with an invalid budget"))
+    response = client.get("/api/search", query_string={"q": "lease contract", "budget_ms": budget_ms})
+    assert response.status_code == 400
+
+
+def test_small_budget_skips_expansion_first(client, monkeypatch):
+    def search(query, indexer, hybrid_model, deadline=None, **kwargs):
+        deadline.start -= 0.3 * deadline.budget # most of a small budget is gone before the first stage
+        assert not deadline.allows("expansion")
+        assert deadline.allows("candidates")
+        return [("http://a.example/", 1.0)]
+    monkeypatch.setattr(interface, "search", search)
+
+    response = client.get("/api/search", query_string={"q": "lease contract", "budget_ms": "50"})
+    assert response.status_code == 200
+    assert response.get_json()["skipped_stages"] == ["expansion"]
+
+
+def test_cursor_of_a_reloaded_index_expires(client, monkeypatch):
+    monkeypatch.setattr(interface, "search", lambda *args, **kwargs: [("http://a.example/", 1.0)])
+    cursor = client.get("/api/search", query_string={"q": "lease contract"}).get_json()["cursor"]
+    assert client.get("/api/search", query_string={"cursor": cursor}).status_code == 200
+
+    monkeypatch.setattr(FakeIndexer, "version", 2) # the server loaded a new index
+    assert client.get("/api/search", query_string={"cursor": cursor}).status_code == 410
+
+
+def test_server_timing_total_is_measured_around_the_request(client, monkeypatch):
+    def search(*args, **kwargs):
+        interface.metrics.current_trace().add("dense_rerank", 60.0) # stage timings may overlap
+        return [("http://a.example/", 1.0)]
+    monkeypatch.setattr(interface, "search", search)
+
+    response = client.get("/api/search", query_string={"q": "lease contract", "debug": "1"})
+    timings = dict(part.split(";dur=") for part in response.headers["Server-Timing"].split(", "))
+    assert float(timings["dense_rerank"]) == 60000.0
+    assert 0 < float(timings["total"]) < 60000.0
+
+
+def test_degraded_ranking_is_not_reused_for_a_new_query(client, monkeypatch):
+    searches = []
+    def search(query, indexer, hybrid_model, deadline=None, **kwargs):
+        searches.append(query)
+        if len(searches) == 1: # the first search runs out of time before the expansion
+            deadline.start -= 0.3 * deadline.budget
+            deadline.allows("expansion")
+        return [("http://a.example/", 1.0), ("http://b.example/", 0.5)]
+    monkeypatch.setattr(interface, "search", search)
+
+    first = client.get("/api/search", query_string={"q": "lease contract", "size": "1"}).get_json()
+    assert first["skipped_stages"] == ["expansion"]
+    second_page = client.get("/api/search", query_string={"cursor": first["cursor"], "page": "2", "size": "1"}).get_json()
+    assert second_page["cached"] and second_page["skipped_stages"] == ["expansion"]
+
+    again = client.get("/api/search", query_string={"q": "lease contract"}).get_json()
+    assert not again["cached"] and again["skipped_stages"] == []
+    assert len(searches) == 2
+    assert client.get("/api/search", query_string={"q": "lease contract"}).get_json()["cached"]
+
+
+def test_cursor_of_another_query_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(interface, "search", lambda *args, **kwargs: [("http://a.example/", 1.0)])
+    cursor = client.get("/api/search", query_string={"q": "lease contract"}).get_json()["cursor"]
+
+    assert client.get("/api/search", query_string={"q": "Lease  CONTRACT", "cursor": cursor}).status_code == 200
+    response = client.get("/api/search", query_string={"q": "tenancy law", "cursor": cursor})
+    assert response.status_code == 409
+    assert "different query" in response.get_json()["error"]
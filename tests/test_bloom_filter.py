@@ -0,0 +1,45 @@
+from Utils.bloom_filter import ScalableBloomFilter
+
+
+def urls(count, start=0):
+    return [f"http://a.example/page/{index}" for index in range(start, start + count)]
+
+
+def test_no_false_negatives_while_growing(tmp_path):
+    bloom = ScalableBloomFilter(str(tmp_path / "visited.bloom"), initial_capacity=100, error_rate=1e-3)
+    bloom.update(urls(1000))
+    assert len(bloom.slices) > 1
+    assert len(bloom) <= 1000
+    assert all(url in bloom for url in urls(1000))
+    false_positives = sum(url in bloom for url in urls(1000, start=1000))
+    assert false_positives < 10
+    bloom.close()
+
+
+def test_adding_twice_counts_once(tmp_path):
+    bloom = ScalableBloomFilter(str(tmp_path / "visited.bloom"), initial_capacity=100)
+    bloom.add("http://a.example/")
+    bloom.add("http://a.example/")
+    assert len(bloom) == 1
+    bloom.close()
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "visited.bloom")
+    bloom = ScalableBloomFilter(path, initial_capacity=100, error_rate=1e-3)
+    assert bloom.created
+    bloom.update(urls(300))
+    count, num_slices = len(bloom), len(bloom.slices)
+    bloom.save()
+    bloom.close()
+
+    # The stored parameters win over the arguments, so the slices are read as they were written
+    reopened = ScalableBloomFilter(path, initial_capacity=5000, error_rate=0.1)
+    assert not reopened.created
+    assert (reopened.initial_capacity, reopened.error_rate) == (100, 1e-3)
+    assert len(reopened) == count
+    assert len(reopened.slices) == num_slices
+    assert all(url in reopened for url in urls(300))
+    reopened.add("http://b.example/")
+    assert "http://b.example/" in reopened
+    reopened.close()
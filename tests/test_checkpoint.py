@@ -0,0 +1,60 @@
+import os
+import pickle
+from Utils.checkpoint import SnapshotJournal, atomic_dump
+
+
+def load(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def test_atomic_dump_replaces_the_file(tmp_path):
+    path = str(tmp_path / "state.pkl")
+    atomic_dump({1}, path)
+    atomic_dump({1, 2}, path)
+    assert load(path) == {1, 2}
+    assert not os.path.exists(f"{path}.tmp")
+
+
+def test_journal_replays_records_after_reopen(tmp_path):
+    path = str(tmp_path / "simhashes.pkl")
+    journal = SnapshotJournal(path)
+    for simhash in (11, 12, 13):
+        journal.log(simhash)
+    journal.close()
+
+    reopened = SnapshotJournal(path)
+    assert len(reopened) == 3
+    assert reopened.replay() == [11, 12, 13]
+    assert reopened.replay() == [] # only once
+    reopened.close()
+
+
+def test_journal_cuts_off_a_torn_record(tmp_path):
+    path = str(tmp_path / "simhashes.pkl")
+    journal = SnapshotJournal(path)
+    journal.log(11)
+    journal.log(12)
+    journal.close()
+    with open(f"{path}.wal", "r+b") as f:
+        f.truncate(os.path.getsize(f"{path}.wal") - 1)
+
+    reopened = SnapshotJournal(path)
+    assert reopened.replay() == [11]
+    reopened.log(13) # appended after the cut, so it is read back
+    reopened.close()
+    assert SnapshotJournal(path).replay() == [11, 13]
+
+
+def test_checkpoint_snapshots_and_resets_the_journal(tmp_path):
+    path = str(tmp_path / "simhashes.pkl")
+    journal = SnapshotJournal(path)
+    journal.log(11)
+    assert not journal.checkpoint({11}, size=5) # journal still smaller than the snapshot
+    assert not os.path.exists(path)
+    assert journal.checkpoint({11}, size=5, force=True)
+    journal.close()
+
+    assert load(path) == {11}
+    assert os.path.getsize(f"{path}.wal") == 0
+    assert SnapshotJournal(path).replay() == []
@@ -0,0 +1,86 @@
+from Utils.crawl_frontier import HostFrontier, DiskFrontier
+
+
+def pop_all(frontier):
+    urls = []
+    while (ready := frontier.pop_ready()) is not None:
+        urls.append(ready[1][1])
+        frontier.done(ready[1][1])
+    return urls
+
+
+def test_set_delay_keeps_a_busy_host_busy():
+    frontier = HostFrontier([(0, "http://a.example/1", 0), (1, "http://a.example/2", 0)])
+    host, _ = frontier.pop_ready()
+    frontier.acquire(host, 0)
+    frontier.set_delay(host, 0)
+    assert frontier.pop_ready() is None # the fetch is still in flight
+    frontier.release(host)
+    assert frontier.pop_ready()[1][1] == "http://a.example/2"
+
+
+def test_set_delay_postpones_a_ready_host():
+    frontier = HostFrontier([(0, "http://a.example/1", 0), (0, "http://b.example/1", 0)])
+    frontier.set_delay("a.example", 60)
+    assert frontier.pop_ready()[0] == "b.example"
+    assert frontier.pop_ready() is None
+    assert 59 < frontier.seconds_until_ready() <= 60
+
+
+def test_host_frontier_pops_best_url_first_and_waits_for_busy_hosts():
+    frontier = HostFrontier([(2, "http://a.example/2", 0), (1, "http://a.example/1", 0), (0, "http://b.example/0", 0)])
+    assert frontier.pop_ready()[1][1] == "http://b.example/0"
+    host, item = frontier.pop_ready()
+    assert item[1] == "http://a.example/1"
+    frontier.acquire(host, 0)
+    assert frontier.pop_ready() is None
+    frontier.release(host)
+    assert frontier.pop_ready()[1][1] == "http://a.example/2"
+
+
+def test_disk_frontier_refills_in_priority_order(tmp_path):
+    frontier = DiskFrontier(str(tmp_path / "frontier.db"), hot_window=2)
+    for priority in (5, 3, 4, 1, 2):
+        frontier.push((priority, f"http://h{priority}.example/", 0))
+    assert len(frontier) == 5
+    # The first two pushes fill the hot window; the rest waits on disk and is loaded best first
+    # whenever the window is down to half, so it overtakes the worse URL in memory
+    assert pop_all(frontier) == ["http://h3.example/", "http://h1.example/", "http://h2.example/",
+                                 "http://h4.example/", "http://h5.example/"]
+    assert len(frontier) == 0
+
+
+def test_disk_frontier_ignores_urls_already_queued(tmp_path):
+    frontier = DiskFrontier(str(tmp_path / "frontier.db"), hot_window=1)
+    frontier.push((0, "http://a.example/hot", 0))
+    frontier.push((0, "http://a.example/disk", 0))
+    frontier.push((0, "http://a.example/hot", 0))
+    frontier.push((0, "http://a.example/disk", 0))
+    assert len(frontier) == 2
+    assert sorted(pop_all(frontier)) == ["http://a.example/disk", "http://a.example/hot"]
+
+
+def test_disk_frontier_requeues_a_popped_url_once(tmp_path):
+    frontier = DiskFrontier(str(tmp_path / "frontier.db"))
+    frontier.push((0, "http://a.example/", 0))
+    _, item = frontier.pop_ready()
+    frontier.push(item) # parked, e.g. until the robots.txt of its host arrives
+    frontier.push(item)
+    assert len(frontier) == 1
+    assert pop_all(frontier) == ["http://a.example/"]
+
+
+def test_disk_frontier_restores_undone_urls_on_reopen(tmp_path):
+    path = str(tmp_path / "frontier.db")
+    frontier = DiskFrontier(path, hot_window=2)
+    for index in range(4):
+        frontier.push((index, f"http://h{index}.example/", 0))
+    _, popped = frontier.pop_ready() # in flight when the crawl stops
+    _, finished = frontier.pop_ready()
+    frontier.done(finished[1])
+    frontier.close()
+
+    reopened = DiskFrontier(path, hot_window=2)
+    assert not reopened.created
+    assert len(reopened) == 3
+    assert popped[1] in pop_all(reopened)
@@ -0,0 +1,65 @@
+from Utils.crawl_shared_state import SharedCrawlState, partition_of, partition_path
+
+
+def test_partitions():
+    assert partition_path("data/crawled_data.pkl", 2) == "data/crawled_data.p2.pkl"
+    assert partition_of("http://a.example/x", 4) == partition_of("http://a.example/y?z", 4)
+    assert {partition_of(f"http://host{index}.example/", 4) for index in range(50)} == {0, 1, 2, 3}
+
+
+def test_doc_ids_are_unique_over_processes(tmp_path):
+    path = str(tmp_path / "shared.db")
+    first, second = SharedCrawlState(path), SharedCrawlState(path)
+    first.register_documents({0: {'url': "http://a.example/"}, 5: {'url': "http://b.example/"}})
+    assert second.allocate_doc_id("http://a.example/") == 0
+    assert second.allocate_doc_id("http://c.example/") == 6
+    assert first.allocate_doc_id("http://d.example/") == 7
+    assert first.allocate_doc_id("http://c.example/") == 6
+    assert second.doc_ids() == {"http://a.example/": 0, "http://b.example/": 5,
+                                "http://c.example/": 6, "http://d.example/": 7}
+    first.close()
+    second.close()
+
+
+def test_links_and_simhashes(tmp_path):
+    path = str(tmp_path / "shared.db")
+    sender, receiver = SharedCrawlState(path), SharedCrawlState(path)
+    sender.send([(1, (0.5, "http://b.example/", 2)), (0, (0.1, "http://a.example/", 1)), (1, (0.9, "http://b.example/x", 3))])
+    assert receiver.receive(1) == [(0.5, "http://b.example/", 2), (0.9, "http://b.example/x", 3)]
+    assert receiver.receive(1) == []
+    assert receiver.receive(0, limit=5) == [(0.1, "http://a.example/", 1)]
+
+    sender.publish_simhash(0, 2 ** 64 - 1)
+    sender.publish_simhash(1, 42)
+    assert receiver.new_simhashes() == [2 ** 64 - 1, 42]
+    assert receiver.new_simhashes() == []
+    sender.publish_simhash(0, 7)
+    assert receiver.new_simhashes() == [7]
+    sender.close()
+    receiver.close()
+
+
+def test_finished(tmp_path):
+    shared = SharedCrawlState(str(tmp_path / "shared.db"))
+    shared.reset_workers(2)
+    assert not shared.finished()
+    shared.set_idle(0)
+    shared.set_idle(1)
+    assert shared.finished()
+
+    # Queued links make their worker busy again once it receives them
+    shared.send([(1, (0.5, "http://b.example/", 1))])
+    assert not shared.finished()
+    shared.receive(1)
+    assert not shared.finished()
+    shared.set_idle(1)
+    assert shared.finished()
+
+    # Links for a worker that stopped stay queued, but do not keep the crawl running
+    shared.mark_exited(0)
+    shared.send([(0, (0.5, "http://a.example/", 1))])
+    assert shared.finished()
+    shared.reset_workers(2)
+    shared.set_idle(1)
+    assert shared.receive(0) == [(0.5, "http://a.example/", 1)]
+    shared.close()
@@ -0,0 +1,87 @@
+import pickle
+import functools
+import threading
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import pytest
+from Utils.crawl_frontier import DiskFrontier
+
+
+# Distinct English paragraphs, so neither SimHash nor the language filter drops a page
+TEXTS = [
+    "Tuebingen is a university town on the Neckar river with a historic old town, half-timbered houses and a castle above the market square.",
+    "Students fill the cafes and bars around the market, and in summer people rent punts to glide along the river past the tower where the poet Hoelderlin lived.",
+    "The botanical garden of the university grows plants from every continent, and its greenhouses are open to visitors free of charge on most days of the week.",
+    "Museums in the castle show archaeological finds from the region, including some of the oldest figurative ivory carvings that were ever discovered by researchers.",
+]
+
+
+LINKS = ["p1.html", "p1.html?utm_source=news#top", "p2.html?b=2&a=1", "p3.html"]
+# Fetched and stored as linked; the variant of page 1 is the same page
+CRAWLED = ["p0.html", "p1.html", "p2.html?b=2&a=1", "p3.html"]
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site(tmp_path):
+    """
+    A small site on a local server: page 0 links to pages 1 to 3 (and to a variant of page 1
+    with a tracking parameter, and to page 2 with a query). Returns its base URL.
+    """
+    root = tmp_path / "site"
+    root.mkdir()
+    for index, text in enumerate(TEXTS):
+        links = "".join(f'<a href="{href}">Tuebingen {href}</a> ' for href in LINKS) if index == 0 else ""
+        (root / f"p{index}.html").write_text(f"<html><head><title>Page {index}</title></head><body><p>{text}</p>{links}</body></html>")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_crawler(tmp_path, monkeypatch):
+    """
+    Crawlers keep their state under data/ in the working directory, so they run in tmp_path.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "log").mkdir()
+    try:
+        from Utils.legal_crawling import OfflineCrawler
+    except (ImportError, LookupError) as e: # a dependency or the NLTK data is missing
+        pytest.skip(f"the crawler cannot be imported: {e}")
+    return functools.partial(OfflineCrawler, max_depth=1, delay=0.01, process_workers=1, metrics_port=None)
+
+
+def crawled_urls():
+    with open("data/crawled_data.pkl", "rb") as f:
+        return sorted(doc_info["url"] for doc_info in pickle.load(f).values())
+
+
+def test_crawl_indexes_each_page_once_under_its_linked_url(site, make_crawler):
+    crawler = make_crawler([site + "p0.html"])
+    crawler.run()
+    assert crawler.stats["crawled"] == len(TEXTS)
+    assert crawled_urls() == [site + path for path in CRAWLED]
+
+
+def test_pages_stay_queued_until_preprocessed(site, make_crawler, monkeypatch):
+    crawler = make_crawler([site + "p0.html"])
+    # Stop as soon as the first fetched page waits for preprocessing
+    with monkeypatch.context() as patch:
+        patch.setattr(type(crawler), "_submit_processing", lambda self: setattr(self, "stop_requested", True))
+        crawler.run()
+    assert crawler.stats["crawled"] == 0
+
+    frontier = DiskFrontier("data/frontier.db")
+    assert site + "p0.html" in [url for url, in frontier.conn.execute("SELECT url FROM frontier")]
+    frontier.close()
+
+    resumed = make_crawler([site + "p0.html"])
+    resumed.run()
+    assert crawled_urls() == [site + path for path in CRAWLED]
@@ -0,0 +1,42 @@
+from Utils.cursor_cache import RankedListCache
+
+
+RANKED = [("http://a.example/", 2.0), ("http://b.example/", 1.0)]
+
+
+def test_same_query_reuses_its_cursor():
+    cache = RankedListCache(ttl=300, max_entries=4)
+    cursor = cache.put(("lease",), RANKED)
+    assert cache.lookup(("lease",)) == cursor
+    assert cache.entry(cursor) == (("lease",), RANKED, [])
+
+    newer = cache.put(("lease",), RANKED[:1])
+    assert cache.lookup(("lease",)) == newer
+    assert cache.get(cursor) is None
+
+
+def test_degraded_ranking_is_only_served_through_its_cursor():
+    cache = RankedListCache(ttl=300, max_entries=4)
+    full = cache.put(("lease",), RANKED)
+    degraded = cache.put(("lease",), RANKED[:1], skipped=["expansion", "dense_rerank"])
+    assert cache.entry(degraded) == (("lease",), RANKED[:1], ["expansion", "dense_rerank"])
+    assert cache.lookup(("lease",)) == full
+
+    only_degraded = cache.put(("contract",), RANKED, skipped=["expansion"])
+    assert cache.lookup(("contract",)) is None
+    assert cache.get(only_degraded) == RANKED
+
+
+def test_eviction_keeps_a_newer_cursor_of_the_same_query():
+    cache = RankedListCache(ttl=300, max_entries=2)
+    cache.put(("lease",), RANKED, skipped=["expansion"])
+    full = cache.put(("lease",), RANKED)
+    cache.put(("contract",), RANKED) # evicts the degraded entry
+    assert cache.lookup(("lease",)) == full
+
+
+def test_entries_expire():
+    cache = RankedListCache(ttl=-1)
+    cursor = cache.put(("lease",), RANKED)
+    assert cache.get(cursor) is None
+    assert cache.lookup(("lease",)) is None
@@ -0,0 +1,40 @@
+import time
+from Utils.deadline import Deadline
+
+
+def spent(budget, fraction):
+    # A deadline with `fraction` of its budget already used
+    deadline = Deadline(budget)
+    deadline.start = time.perf_counter() - fraction * budget
+    return deadline
+
+
+def test_full_budget_allows_every_stage():
+    deadline = Deadline(10.0)
+    assert all(deadline.allows(stage) for stage in Deadline.DEGRADATION_ORDER)
+    assert deadline.skipped == []
+
+
+def test_small_budget_skips_expansion_first():
+    deadline = spent(1.0, 0.3)
+    assert not deadline.allows("expansion")
+    assert all(deadline.allows(stage) for stage in Deadline.DEGRADATION_ORDER[1:])
+    assert deadline.skipped == ["expansion"]
+
+
+def test_stages_are_dropped_in_degradation_order():
+    reserves = [Deadline.DEFAULT_RESERVES[stage] for stage in Deadline.DEGRADATION_ORDER]
+    assert reserves == sorted(reserves, reverse=True)
+
+    deadline = spent(1.0, 0.65)
+    allowed = [stage for stage in Deadline.DEGRADATION_ORDER if deadline.allows(stage)]
+    assert allowed == ["dense_rerank", "sentiment"]
+    assert deadline.skipped == ["expansion", "candidates", "proximity"]
+
+
+def test_skipped_stage_is_recorded_once():
+    deadline = spent(1.0, 1.0)
+    assert deadline.expired()
+    assert not deadline.allows("expansion")
+    assert not deadline.allows("expansion")
+    assert deadline.skipped == ["expansion"]
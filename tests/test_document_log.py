@@ -0,0 +1,83 @@
+import os
+import pickle
+import pytest
+from Utils.document_log import DocumentLog
+
+
+def doc(index, version=0):
+    return {"url": f"http://a.example/{index}", "tokens": ["page", str(index)], "version": version}
+
+
+def fill(path, count, **kwargs):
+    log = DocumentLog(path, **kwargs)
+    for index in range(count):
+        log.append(log.allocate_id(), doc(index))
+    return log
+
+
+def test_documents_survive_reopening(tmp_path):
+    path = str(tmp_path / "crawl_log")
+    log = fill(path, 5)
+    log.append(2, doc(2, version=1)) # a changed revisit: the latest record wins
+    log.close()
+
+    reopened = DocumentLog(path)
+    assert not reopened.created
+    assert len(reopened) == 5
+    assert reopened.get(2) == doc(2, version=1)
+    assert [doc_id for doc_id, _ in reopened.iter_records()] == [0, 1, 3, 4, 2]
+    assert reopened.allocate_id() == 5
+    reopened.close()
+
+
+def test_records_span_segments(tmp_path):
+    path = str(tmp_path / "crawl_log")
+    fill(path, 20, segment_bytes=256).close()
+    assert len([name for name in os.listdir(path) if name.startswith("segment_")]) > 1
+    reopened = DocumentLog(path)
+    assert dict(reopened.iter_records()) == {index: doc(index) for index in range(20)}
+    reopened.close()
+
+
+def test_unindexed_records_are_recovered(tmp_path):
+    path = str(tmp_path / "crawl_log")
+    fill(path, 5, group_size=100, group_interval=3600).close()
+    os.remove(os.path.join(path, "index.bin")) # as if killed before the index was written
+
+    reopened = DocumentLog(path)
+    assert dict(reopened.iter_records()) == {index: doc(index) for index in range(5)}
+    reopened.close()
+    assert os.path.getsize(os.path.join(path, "index.bin")) > 0
+
+
+def test_torn_record_is_cut_off(tmp_path):
+    path = str(tmp_path / "crawl_log")
+    fill(path, 3).close()
+    segment = os.path.join(path, "segment_00000.log")
+    with open(segment, "ab") as f:
+        f.write(b"\x40\x00\x00\x00torn") # header of a record whose payload was never written
+    size = os.path.getsize(segment)
+
+    reopened = DocumentLog(path)
+    assert len(reopened) == 3
+    assert os.path.getsize(segment) == size - 8
+    reopened.append(reopened.allocate_id(), doc(3))
+    reopened.close()
+    assert DocumentLog(path).get(3) == doc(3)
+
+
+def test_export_writes_the_latest_documents(tmp_path):
+    log = fill(str(tmp_path / "crawl_log"), 3)
+    log.export(str(tmp_path / "crawled_data.pkl"))
+    log.close()
+    with open(tmp_path / "crawled_data.pkl", "rb") as f:
+        assert pickle.load(f) == {index: doc(index) for index in range(3)}
+
+
+def test_log_is_open_in_one_process_at_a_time(tmp_path):
+    path = str(tmp_path / "crawl_log")
+    log = DocumentLog(path)
+    with pytest.raises(RuntimeError, match="in use"):
+        DocumentLog(path)
+    log.close()
+    DocumentLog(path).close()
@@ -0,0 +1,29 @@
+import pytest
+from Utils import html_extractor
+from Utils.html_extractor import extract_page
+
+
+@pytest.fixture(params=["stdlib", "lxml"])
+def backend(request, monkeypatch):
+    if request.param == "lxml":
+        pytest.importorskip("lxml")
+    else:
+        monkeypatch.setattr(html_extractor, "lxml", None)
+    return request.param
+
+
+def test_has_body_follows_the_source(backend):
+    assert extract_page("<html><head><title>T</title></head><BODY class=x><p>text</p></BODY></html>")["has_body"]
+    assert not extract_page("<html><head><title>T</title></head><p>text</p></html>")["has_body"]
+    assert not extract_page("<p>text</p>")["has_body"]
+
+
+def test_boilerplate_is_left_out_of_content_and_links(backend):
+    page = extract_page('<html><head><title> A  page </title><meta name="description" content=" About it ">'
+                        '<script>var x;</script></head><body><nav><a href="/menu">Menu</a></nav>'
+                        '<p>Main <a href="/doc">the doc</a></p><footer>Footer</footer></body></html>')
+    assert page["title"] == "A page"
+    assert page["description"] == "About it"
+    assert page["links"] == [("/doc", "the doc")]
+    assert "Main" in page["content_text"] and "Menu" not in page["content_text"] and "Footer" not in page["content_text"]
+    assert "Menu" in page["text"] and "var x" not in page["text"]
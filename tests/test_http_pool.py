@@ -0,0 +1,8 @@
+import importlib.util
+from Utils.http_pool import HostSessionPool
+
+
+def test_brotli_is_only_requested_when_it_can_be_decoded():
+    encodings = HostSessionPool("test-agent")._session("a.example").headers["Accept-Encoding"].split(", ")
+    assert encodings[:2] == ["gzip", "deflate"]
+    assert ("br" in encodings) == (importlib.util.find_spec("brotli") is not None)
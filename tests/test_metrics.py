@@ -0,0 +1,32 @@
+import time
+from Utils import metrics
+from Utils.metrics import MetricsRegistry, Trace
+
+
+def test_trace_total_is_wall_clock_not_the_sum_of_stages():
+    trace = Trace()
+    trace.add("doc_store", 5.0) # e.g. ten parallel fetches of 0.5 s each
+    time.sleep(0.01)
+    total = trace.finish()
+    assert 0.01 <= total < 1.0
+    assert trace.finish() == total == trace.total()
+    assert trace.header_value() == f"doc_store;dur=5000.00, total;dur={total * 1000:.2f}"
+
+
+def test_stage_lands_in_the_active_trace():
+    trace = metrics.start_trace()
+    with metrics.stage("bm25"):
+        pass
+    assert [name for name, _ in trace.stages] == ["bm25"]
+
+
+def test_histogram_buckets_are_fixed_per_metric():
+    registry = MetricsRegistry()
+    registry.observe("candidates", 500, buckets=(10, 1000))
+    registry.observe("candidates", 5, buckets=(1, 2))
+    registry.observe("latency", 0.003)
+    text = registry.render()
+    assert 'candidates_bucket{le="10"} 1' in text
+    assert 'candidates_bucket{le="1000"} 2' in text
+    assert 'candidates_bucket{le="+Inf"} 2' in text
+    assert 'latency_bucket{le="0.005"} 1' in text
@@ -0,0 +1,85 @@
+import os
+import gzip
+import pytest
+from Utils.page_archive import PageArchive, encode_response, decode_response
+
+
+HTML = "<html><body><p>Tübingen am Neckar</p></body></html>"
+
+
+def page(index):
+    return f"http://a.example/{index}", f"<html><body><p>Page {index} " + "text " * index + "</p></body></html>"
+
+
+def fill(path, count, **kwargs):
+    archive = PageArchive(path, **kwargs)
+    for index in range(count):
+        url, html = page(index)
+        archive.append(url, encode_response(url, html, {"Content-Type": "text/html; charset=latin-1"}, fetched_at=0))
+    return archive
+
+
+def test_record_round_trip():
+    record = encode_response("http://a.example/", HTML, {"Content-Type": "text/html; charset=latin-1",
+                                                         "Set-Cookie": "id=1", "ETag": '"abc"'}, status=200, fetched_at=0)
+    decoded = decode_response(record)
+    assert decoded["url"] == "http://a.example/"
+    assert decoded["status"] == 200
+    assert decoded["html"] == HTML
+    assert decoded["headers"] == {"content-type": "text/html; charset=utf-8", "etag": '"abc"'}
+    assert decoded["date"] == "Thu, 01 Jan 1970 00:00:00 GMT"
+    assert gzip.decompress(record).startswith(b"WARC/1.1\r\nWARC-Type: response\r\n")
+
+
+def test_pages_survive_reopening(tmp_path):
+    path = str(tmp_path / "page_archive")
+    archive = fill(path, 5, segment_bytes=300)
+    url, html = page(2)
+    archive.append(url, encode_response(url, html + "<!-- changed -->")) # a changed revisit: the latest record wins
+    archive.close()
+    assert len([name for name in os.listdir(path) if name.endswith(".warc.gz")]) > 1
+
+    reopened = PageArchive(path)
+    assert len(reopened) == 5
+    assert url in reopened
+    assert reopened.get(url)["html"] == html + "<!-- changed -->"
+    assert reopened.get(page(4)[0])["html"] == page(4)[1]
+    assert len(reopened.locations()) == 5
+    reopened.close()
+
+
+def test_unindexed_records_are_recovered(tmp_path):
+    path = str(tmp_path / "page_archive")
+    fill(path, 4).close()
+    os.remove(os.path.join(path, "index.bin")) # as if killed before the index was written
+
+    reopened = PageArchive(path)
+    assert len(reopened) == 4
+    assert reopened.get(page(3)[0])["html"] == page(3)[1]
+    reopened.close()
+
+
+def test_torn_record_is_cut_off(tmp_path):
+    path = str(tmp_path / "page_archive")
+    fill(path, 3).close()
+    segment = os.path.join(path, "segment_00000.warc.gz")
+    size = os.path.getsize(segment)
+    url, html = page(3)
+    with open(segment, "ab") as f:
+        f.write(encode_response(url, html)[:40]) # killed while writing the record
+
+    reopened = PageArchive(path)
+    assert len(reopened) == 3
+    assert os.path.getsize(segment) == size
+    reopened.append(url, encode_response(url, html))
+    reopened.close()
+    assert PageArchive(path).get(url)["html"] == html
+
+
+def test_archive_is_open_in_one_process_at_a_time(tmp_path):
+    path = str(tmp_path / "page_archive")
+    archive = PageArchive(path)
+    with pytest.raises(RuntimeError, match="in use"):
+        PageArchive(path)
+    archive.close()
+    PageArchive(path).close()
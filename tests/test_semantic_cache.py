@@ -0,0 +1,28 @@
+import numpy as np
+from Utils.semantic_cache import SemanticQueryCache
+
+
+def test_similar_query_reuses_the_ranking():
+    cache = SemanticQueryCache(capacity=4, threshold=0.9)
+    cache.put([1.0, 0.0, 0.0], [("http://a.example/", 1.0)])
+    assert cache.lookup([0.99, 0.05, 0.0]) == [("http://a.example/", 1.0)]
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_ring_buffer_drops_the_oldest_query():
+    cache = SemanticQueryCache(capacity=2, threshold=0.99)
+    for index in range(3):
+        cache.put(np.eye(3)[index], [(f"http://{index}.example/", 1.0)])
+    assert cache.lookup(np.eye(3)[0]) is None
+    assert cache.lookup(np.eye(3)[2]) == [("http://2.example/", 1.0)]
+
+
+def test_index_version_change_clears_the_cache():
+    version = [1]
+    cache = SemanticQueryCache(threshold=0.9, version_fn=lambda: version[0], version_check_interval=0)
+    cache.put([1.0, 0.0], [("http://a.example/", 1.0)])
+    version[0] = 2
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["invalidations"] == 1
@@ -0,0 +1,44 @@
+import random
+import pytest
+from Utils.simhash_index import SimHashIndex
+
+
+def flip(simhash, *bits):
+    for bit in bits:
+        simhash ^= 1 << bit
+    return simhash
+
+
+@pytest.mark.parametrize("num_blocks", [None, 6])
+def test_finds_hashes_within_distance(num_blocks):
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(1000)]
+    index = SimHashIndex(max_distance=3, hashes=hashes, num_blocks=num_blocks)
+    assert len(index) == 1000
+    assert hashes[7] in index
+
+    for simhash in hashes[:50]:
+        bits = rng.sample(range(64), 3)
+        near = flip(simhash, *bits)
+        assert index.find(near) == simhash
+        assert simhash in index.near(near)
+        assert index.find(flip(simhash, *rng.sample(range(64), 1))) == simhash
+
+    # Four bits away is too far (random hashes are about 32 bits apart)
+    assert index.find(flip(hashes[0], 0, 17, 33, 60)) is None
+    assert index.near(flip(hashes[0], 0, 17, 33, 60)) == set()
+
+
+def test_near_returns_all_matches():
+    index = SimHashIndex(max_distance=3)
+    base = 0x0123456789abcdef
+    index.update([base, flip(base, 1), flip(base, 1, 40), flip(base, 1, 40, 63, 20)])
+    index.add(base) # already stored
+    assert len(index) == 4
+    assert index.near(base) == {base, flip(base, 1), flip(base, 1, 40)}
+    assert 0 not in index
+
+
+def test_blocks_must_outnumber_distance():
+    with pytest.raises(ValueError):
+        SimHashIndex(max_distance=3, num_blocks=3)
@@ -0,0 +1,34 @@
+from Utils.url_filter import UrlFilter
+
+
+def make_filter():
+    return UrlFilter(endings=[".pdf", ".js"], tlds=[".ru"], domains=["google.com"], patterns=[r"/calendar/\d+"])
+
+
+def test_endings_match_the_path_and_query():
+    url_filter = make_filter()
+    assert url_filter.match("http://a.example/doc.PDF") == "ending:.pdf"
+    assert url_filter.match("http://a.example/doc.pdf?download=1") == "ending:.pdf"
+    assert url_filter.match("http://a.example/get?file=doc.pdf") == "ending:.pdf"
+    assert url_filter.match("http://a.example/doc.html") is None
+
+
+def test_endings_do_not_match_the_host():
+    url_filter = make_filter()
+    assert url_filter.match("http://cdn.js/") is None
+    assert url_filter.match("http://node.js") is None
+
+
+def test_tlds_and_domains_match_the_host():
+    url_filter = make_filter()
+    assert url_filter.match("http://news.example.ru/page") == "tld:.ru"
+    assert url_filter.match("http://example.com/a.ru") is None
+    assert url_filter.match("https://maps.google.com/x") == "domain:google.com"
+    assert url_filter.match("https://notgoogle.com/x") is None
+
+
+def test_patterns_and_counts():
+    url_filter = make_filter()
+    assert url_filter.match("http://a.example/calendar/2024") == r"pattern:/calendar/\d+"
+    url_filter.match("http://b.example/c.pdf")
+    assert url_filter.counts == {r"pattern:/calendar/\d+": 1, "ending:.pdf": 1}